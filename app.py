@@ -1,22 +1,24 @@
+import click
 from flask import Flask, jsonify
 from dotenv import load_dotenv
 from flask_smorest import Api
 from flask_jwt_extended import JWTManager
-from flask_migrate import Migrate
-from rq import Queue
 from db import db
-from blocklist import BLOCKLIST
+from blocklist import create_blocklist
+from cache import create_response_cache
+from connections import lazy_queue, lazy_redis
+from metrics import init_metrics
+from passwords import create_password_hasher
+from profiling import init_profiler
+from query_budget import init_query_budgets
+from ratelimit import create_rate_limiter
+from replicas import init_replicas, replica_binds
+from store_stats import store_stats_cli
 
-import redis
 import os
 import secrets
 import models
 
-from resources.item import blp as ItemBlueprint
-from resources.store import blp as StoreBlueprint
-from resources.tag import blp as TagBlueprint
-from resources.user import blp as UserBlueprint
-
 def create_app(db_url=None):
     app = Flask(__name__)
     load_dotenv()
@@ -25,7 +27,7 @@ def create_app(db_url=None):
     您贴出的代码片段似乎是用来建立与 Redis 服务器的连接，并用这个连接创建一个用于处理电子邮件任务的作业队列。
     下面是代码的详细解释：
 
-    1. connection = redis.from_url(os.getenv("REDIS_URL")): 这行代码使用 redis 库根据环境变量 REDIS_URL 的值来创建一个 Redis 连接。
+    1. connection = redis.from_url(os.getenv("REDIS_URL")) (现在在 connections.get_redis 中，第一次使用时才执行): 这行代码使用 redis 库根据环境变量 REDIS_URL 的值来创建一个 Redis 连接。
     这个环境变量应该包含 Redis 服务器的完整 URL，包括协议、用户名、密码、主机名、端口号和数据库编号（如果需要）。
 
     2. app.queue = Queue("emails", connection=connection): 这行代码使用前面创建的 Redis 连接来初始化一个名为 "emails" 的队列，
@@ -34,13 +36,15 @@ def create_app(db_url=None):
     这样做的目的是为了在应用程序的其他部分能够使用 app.queue 来加入电子邮件任务。
     '''
 
-    # 建立connection
-    connection = redis.from_url(
-        os.getenv("REDIS_URL")
-    )
+    # Redis 连接与 RQ 队列在第一次使用时才创建 (见 connections.py):
+    # 启动时不导入 redis / rq，也不连接 Redis，Redis 不可用不影响启动
+    app.config["REDIS_URL"] = os.getenv("REDIS_URL")
+    connection = lazy_redis(app)
 
     # app 绑定 queue
-    app.queue = Queue("emails", connection = connection)
+    app.queue = lazy_queue(app)
+    # 其它后台任务 (例如删除很大的 store) 的队列
+    app.jobs_queue = lazy_queue(app, "default")
 
     app.config["API_TITLE"] = "Stores REST API"
     app.config["API_VERSION"] = "v1"
@@ -50,10 +54,105 @@ def create_app(db_url=None):
     app.config["OPENAPI_SWAGGER_UI_URL"] = "https://cdn.jsdelivr.net/npm/swagger-ui-dist/"
     app.config["SQLALCHEMY_DATABASE_URI"] = db_url or os.getenv("DATABASE_URL", "sqlite:///data.db")
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    # 只读副本 (逗号分隔的 URL): GET 请求的读查询发往副本，写和刚写过的客户端读主库 (见 replicas.py)
+    app.config["SQLALCHEMY_BINDS"] = replica_binds(os.getenv("DATABASE_REPLICA_URLS", ""))
+    app.config["REPLICA_STALENESS_WINDOW"] = float(os.getenv("REPLICA_STALENESS_WINDOW", 5))
+    app.config["REPLICA_STALENESS_BACKEND"] = os.getenv("REPLICA_STALENESS_BACKEND", "redis")
+    app.config["REPLICA_HEALTH_CHECK_INTERVAL"] = float(os.getenv("REPLICA_HEALTH_CHECK_INTERVAL", 5))
+    # 数据库连接池的大小: gevent 模式下一个 worker 同时处理很多请求，需要更多连接 (见 gunicorn.conf.py)
+    # 没有设置 DB_POOL_SIZE 时使用 SQLAlchemy 默认的连接池
+    if os.getenv("DB_POOL_SIZE"):
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+            "pool_size": int(os.getenv("DB_POOL_SIZE")),
+            "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", 10)),
+            "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", 30)),
+        }
     app.config["PROPAGATE_EXCEPTIONS"] = True
+    # GET /store/export 每次从 server-side cursor 取多少行
+    app.config["EXPORT_CHUNK_SIZE"] = int(os.getenv("EXPORT_CHUNK_SIZE", 1000))
+    # 批量写接口: 每个请求最多多少行，每条多行 INSERT 写入多少行
+    app.config["BULK_MAX_ROWS"] = int(os.getenv("BULK_MAX_ROWS", 50000))
+    app.config["BULK_CHUNK_SIZE"] = int(os.getenv("BULK_CHUNK_SIZE", 500))
+    # DELETE /store/<id>: 超过这么多 item 的 store 交给 RQ 任务删除，每块删除多少个 item / tag (见 store_delete.py)
+    app.config["STORE_DELETE_SYNC_MAX_ITEMS"] = int(os.getenv("STORE_DELETE_SYNC_MAX_ITEMS", 10000))
+    app.config["STORE_DELETE_CHUNK_SIZE"] = int(os.getenv("STORE_DELETE_CHUNK_SIZE", 1000))
+    # 列表接口 (many=True) 用编译好的 serializer 只查询需要的列，再用 orjson 编码 (见 serializers.py)
+    app.config["FAST_SERIALIZER_ENABLED"] = os.getenv("FAST_SERIALIZER_ENABLED", "true").lower() == "true"
+    # GET /item/search 最多给多少个匹配的 item 计算相关度并排序，0 表示不限制 (见 search.py)
+    app.config["SEARCH_MAX_RANKED"] = int(os.getenv("SEARCH_MAX_RANKED", 10000))
+    # GET /store/<id>, /item/<id>, /tag/<id> 的响应缓存: "lru" (进程内), "redis" 或 "null" (不缓存)
+    app.config["RESPONSE_CACHE_BACKEND"] = os.getenv("RESPONSE_CACHE_BACKEND", "lru")
+    app.config["RESPONSE_CACHE_SIZE"] = int(os.getenv("RESPONSE_CACHE_SIZE", 1024))
+    app.config["RESPONSE_CACHE_TTL"] = int(os.getenv("RESPONSE_CACHE_TTL", 300))
+
+    # app 绑定 response_cache, redis 后端复用上面的 connection
+    app.response_cache = create_response_cache(app.config, connection)
+
+    # JWT blocklist: "redis" (所有 worker 共享) 或 "memory" (仅单进程)
+    app.config["JWT_BLOCKLIST_BACKEND"] = os.getenv("JWT_BLOCKLIST_BACKEND", "redis")
+    # 本地缓存 blocklist 查询结果的条数与秒数，0 表示每次都查询 redis
+    app.config["JWT_BLOCKLIST_CACHE_SIZE"] = int(os.getenv("JWT_BLOCKLIST_CACHE_SIZE", 4096))
+    app.config["JWT_BLOCKLIST_CACHE_TTL"] = float(os.getenv("JWT_BLOCKLIST_CACHE_TTL", 2))
+
+    # app 绑定 blocklist, redis 后端复用上面的 connection
+    app.blocklist = create_blocklist(app.config, connection)
+
+    # 密码 hash 进程池: 进程数 (0 表示在当前进程中计算)、pbkdf2 rounds、最多排队的请求数
+    app.config["PASSWORD_HASH_WORKERS"] = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+    app.config["PASSWORD_HASH_ROUNDS"] = int(os.getenv("PASSWORD_HASH_ROUNDS", 29000))
+    app.config["PASSWORD_HASH_MAX_PENDING"] = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 64))
+
+    # app 绑定 password_hasher
+    app.password_hasher = create_password_hasher(app.config)
+
+    # /login 和 /register 的 token bucket 限流: 每个 IP / username 最多连续 BURST 次，每分钟补充 PER_MINUTE 次
+    app.config["RATELIMIT_ENABLED"] = os.getenv("RATELIMIT_ENABLED", "true").lower() == "true"
+    app.config["RATELIMIT_BACKEND"] = os.getenv("RATELIMIT_BACKEND", "redis")
+    app.config["RATELIMIT_AUTH_BURST"] = int(os.getenv("RATELIMIT_AUTH_BURST", 10))
+    app.config["RATELIMIT_AUTH_PER_MINUTE"] = float(os.getenv("RATELIMIT_AUTH_PER_MINUTE", 10))
+
+    # app 绑定 rate_limiter, redis 后端复用上面的 connection
+    app.rate_limiter = create_rate_limiter(app.config, connection)
 
     db.init_app(app)
-    migrate = Migrate(app, db)
+
+    # 配置了只读副本时，app.extensions["replicas"] 负责选择副本，redis 后端复用上面的 connection
+    init_replicas(app, connection)
+
+    # 每个接口用 @query_budget(n) 声明的 SQL 语句数上限 (见 query_budget.py)
+    # QUERY_BUDGET_ENFORCE 打开时 (测试中) 超出上限抛出异常，否则只计入 /metrics
+    app.config["QUERY_BUDGET_ENFORCE"] = os.getenv("QUERY_BUDGET_ENFORCE", "false").lower() == "true"
+    init_query_budgets(app)
+
+    # flask_migrate 会导入 alembic，很慢: 只有 flask 命令行 (flask db upgrade 等) 需要它，
+    # gunicorn worker 和测试都不需要
+    if click.get_current_context(silent = True) is not None:
+        from flask_migrate import Migrate
+
+        migrate = Migrate(app, db)
+
+    # flask store-stats rebuild: 重新计算 store_stats 表 (见 store_stats.py)
+    app.cli.add_command(store_stats_cli)
+
+    # 只在开发 / 测试时用 db.create_all() 建表 (默认: debug 模式或者显式传入了 db_url)
+    # 生产环境的表由 docker-entrypoint.sh 中的 flask db upgrade 创建
+    app.config["DB_CREATE_ALL"] = os.getenv(
+        "DB_CREATE_ALL", str(app.debug or db_url is not None)
+    ).lower() == "true"
+
+    # GET /metrics: 每个接口的请求数 / 延迟、连接池、队列长度等指标
+    app.config["METRICS_ENABLED"] = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    if app.config["METRICS_ENABLED"]:
+        init_metrics(app)
+
+    # 按需的请求级 profiler: 带 X-Profile: <PROFILER_TOKEN> 头 或 按 PROFILER_SAMPLE_RATE 抽样
+    # 关闭时不注册任何 hook，没有额外开销
+    app.config["PROFILER_ENABLED"] = os.getenv("PROFILER_ENABLED", "false").lower() == "true"
+    app.config["PROFILER_TOKEN"] = os.getenv("PROFILER_TOKEN")
+    app.config["PROFILER_SAMPLE_RATE"] = float(os.getenv("PROFILER_SAMPLE_RATE", 0))
+    app.config["PROFILER_DIR"] = os.getenv("PROFILER_DIR", "profiles")
+    if app.config["PROFILER_ENABLED"]:
+        init_profiler(app)
 
     api = Api(app)
 
@@ -73,7 +172,7 @@ def create_app(db_url=None):
     # 检查令牌是否在黑名单中：
     @jwt.token_in_blocklist_loader
     def check_if_token_in_blocklist(jwt_header, jwt_payload):
-        return jwt_payload["jti"] in BLOCKLIST
+        return jwt_payload["jti"] in app.blocklist
 
     # 处理过期的令牌：
     @jwt.expired_token_loader
@@ -129,8 +228,16 @@ def create_app(db_url=None):
             401,
         )
 
-    with app.app_context():
-        db.create_all()
+    if app.config["DB_CREATE_ALL"]:
+        with app.app_context():
+            # 只在主库建表: 只读副本的表来自主库的复制
+            db.create_all(bind_key=None)
+
+    # 蓝图在这里才导入: 只 import app 模块 (例如 rq worker、flask 命令行) 时不需要加载它们
+    from resources.item import blp as ItemBlueprint
+    from resources.store import blp as StoreBlueprint
+    from resources.tag import blp as TagBlueprint
+    from resources.user import blp as UserBlueprint
 
     # 将 ItemBlueprint蓝图 注册到 Flask 应用
     api.register_blueprint(ItemBlueprint)
@@ -144,6 +251,8 @@ def create_app(db_url=None):
     return app
 
 if __name__ == '__main__':
+    # 开发模式: 让 create_app 用 db.create_all() 建表
+    os.environ.setdefault("FLASK_DEBUG", "true")
     app = create_app()
     app.run(debug=True)
 
@@ -0,0 +1,403 @@
+"""
+End-to-end HTTP benchmarks for every route in resources/*.py.
+
+    python -m benchmarks.http_bench --mode client
+    python -m benchmarks.http_bench --mode gunicorn --workers 4 --concurrency 16
+    python -m benchmarks.http_bench --stores 100 --items-per-store 1000 --update-baselines
+
+A catalog of N stores x M items x K tags plus users is seeded into a SQLite
+file (see seed.py). Every scenario is then driven either through the Flask test
+client in this process ("client") or over real HTTP against a gunicorn process
+("gunicorn"). Throughput and p50/p95/p99 latency are reported per scenario.
+
+Results are compared with benchmarks/baselines.json. The run exits with
+status 1 when a scenario's p95 latency rises, or its throughput drops, by more
+than --tolerance. Baselines are machine-specific: record them on the machine
+that runs the comparison with --update-baselines.
+
+Runs offline; Redis and Mailgun are replaced by the stand-ins in standins.py.
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from benchmarks.seed import PASSWORD, PRODUCTS, Catalog, seed  # noqa: E402
+from benchmarks.standins import MailgunStandIn, create_offline_app  # noqa: E402
+
+BASELINES = os.path.join(os.path.dirname(__file__), "baselines.json")
+
+# 需要删除目标的场景，在这个 id 之后预先创建目标，避免和种子数据冲突
+SCRATCH_ID_BASE = 10_000_000
+# 查询删除任务的场景用的 store id: 只放入一个任务，没有这个 store，也不和上面的目标冲突
+DELETE_JOB_STORE_ID = 2 * SCRATCH_ID_BASE
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    path: Callable[[int], str]
+    body: Optional[Callable[[int], object]] = None
+    # "access" / "fresh" / "refresh" / "single-use" (每个请求一个新的 access token)
+    auth: Optional[str] = None
+    expect: tuple = (200,)
+    # prepare(app, catalog, requests): 预先创建要被删除的目标
+    prepare: Optional[Callable] = None
+    # prepare 写入的是本进程的 fakeredis，gunicorn 的每个 worker 各有一个，只能用 test client 运行
+    client_only: bool = False
+
+
+def _prepare_rows(model_name, make_row):
+    def prepare(app, catalog, requests):
+        import models
+        from db import db
+        from sqlalchemy import insert
+
+        with app.app_context():
+            model = getattr(models, model_name)
+            rows = [make_row(SCRATCH_ID_BASE + i, catalog) for i in range(requests)]
+            db.session.execute(insert(model), rows)
+            db.session.commit()
+
+    return prepare
+
+
+def _prepare_delete_job(app, catalog, requests):
+    from store_delete import queue_store_delete
+
+    # 没有 worker 执行，任务一直是 queued
+    queue_store_delete(app.jobs_queue, DELETE_JOB_STORE_ID)
+
+
+def scenarios(catalog):
+    c = catalog
+
+    def store(i):
+        return i % c.stores + 1
+
+    def item(i):
+        return i % c.items + 1
+
+    def tag(i):
+        return i % c.tags + 1
+
+    def other_tag(i):
+        # item 所属 store 的另一个 tag (种子数据中还没有关联)
+        first = ((item(i) - 1) // c.items_per_store) * c.tags_per_store + 1
+        return first + (item(i) + 1) % c.tags_per_store
+
+    def user(i):
+        return i % c.users + 1
+
+    def scratch(i):
+        return SCRATCH_ID_BASE + i
+
+    return [
+        # 读
+        Scenario("list stores", "GET", lambda i: "/store?limit=50"),
+        Scenario("get store", "GET", lambda i: f"/store/{store(i)}"),
+        Scenario("export stores", "GET", lambda i: "/store/export"),
+        Scenario("list items", "GET", lambda i: "/item?limit=100", auth="access"),
+        Scenario(
+            "filter items", "GET",
+            lambda i: f"/item?limit=100&store_id={store(i)}&min_price=5&max_price=200&sort=-price", auth="access",
+        ),
+        Scenario("filter items by tag", "GET", lambda i: f"/item?limit=100&tag_id={tag(i)}&sort=name", auth="access"),
+        Scenario("search items", "GET", lambda i: f"/item/search?q=ceramic+{PRODUCTS[i % len(PRODUCTS)]}&limit=20", auth="access"),
+        Scenario("get item", "GET", lambda i: f"/item/{item(i)}", auth="access"),
+        Scenario("list store tags", "GET", lambda i: f"/store/{store(i)}/tag"),
+        Scenario("get tag", "GET", lambda i: f"/tag/{tag(i)}"),
+        Scenario("get user", "GET", lambda i: f"/user/{user(i)}"),
+        Scenario("get store stats", "GET", lambda i: f"/store/{store(i)}/stats"),
+        Scenario("list store stats", "GET", lambda i: "/store/stats?limit=50"),
+        Scenario(
+            "get delete job", "GET", lambda i: f"/store/{DELETE_JOB_STORE_ID}/delete-job",
+            prepare=_prepare_delete_job, client_only=True,
+        ),
+        # 写
+        Scenario("create store", "POST", lambda i: "/store", lambda i: {"name": f"bench-store-{time.time_ns()}-{i}"}, expect=(201,)),
+        Scenario(
+            "create item", "POST", lambda i: "/item",
+            lambda i: {"name": f"bench-item-{i}", "price": 9.99, "store_id": store(i)},
+            auth="fresh", expect=(201,),
+        ),
+        Scenario(
+            "bulk create items", "POST", lambda i: "/item/bulk",
+            lambda i: [{"name": f"bulk-{i}-{n}", "price": n, "store_id": store(i)} for n in range(100)],
+            auth="fresh", expect=(201,),
+        ),
+        Scenario(
+            "bulk upsert items", "PUT", lambda i: "/item",
+            # 替换 store(i) 已有的 item，不改变 store: 重复运行时目录不变
+            lambda i: [
+                {"id": (store(i) - 1) * c.items_per_store + n + 1, "name": f"upsert-{i}-{n}", "price": n + 1, "store_id": store(i)}
+                for n in range(min(100, c.items_per_store))
+            ],
+            auth="fresh",
+        ),
+        Scenario(
+            "update item", "PUT", lambda i: f"/item/{item(i)}",
+            lambda i: {"name": f"renamed-{i}", "price": 1.5, "store_id": (item(i) - 1) // c.items_per_store + 1},
+        ),
+        Scenario(
+            "create tag", "POST", lambda i: f"/store/{store(i)}/tag",
+            lambda i: {"name": f"bench-tag-{time.time_ns()}-{i}"}, expect=(201,),
+        ),
+        Scenario("link tag", "POST", lambda i: f"/item/{item(i)}/tag/{other_tag(i)}", expect=(201,)),
+        Scenario("unlink tag", "DELETE", lambda i: f"/item/{item(i)}/tag/{other_tag(i)}"),
+        Scenario(
+            "bulk link tags", "POST", lambda i: "/tag/link",
+            lambda i: {"tag_ids": [other_tag(i)], "item_ids": [item(i + n) for n in range(0, 50 * c.tags_per_store, c.tags_per_store)]},
+        ),
+        Scenario(
+            "bulk unlink tags", "DELETE", lambda i: "/tag/link",
+            lambda i: {"tag_ids": [other_tag(i)], "item_ids": [item(i + n) for n in range(0, 50 * c.tags_per_store, c.tags_per_store)]},
+        ),
+        Scenario(
+            "register", "POST", lambda i: "/register",
+            lambda i: {"username": f"bench-{time.time_ns()}-{i}", "email": f"bench-{time.time_ns()}-{i}@example.com", "password": PASSWORD},
+            expect=(201,),
+        ),
+        Scenario("login", "POST", lambda i: "/login", lambda i: {"username": f"user-{user(i)}", "password": PASSWORD}),
+        Scenario("refresh", "POST", lambda i: "/refresh", auth="refresh"),
+        Scenario("logout", "POST", lambda i: "/logout", auth="single-use"),
+        # 删除: 目标在 prepare 中预先创建
+        Scenario(
+            "delete item", "DELETE", lambda i: f"/item/{scratch(i)}", auth="fresh",
+            prepare=_prepare_rows("ItemModel", lambda id, c: {"id": id, "name": f"scratch-{id}", "price": 1, "store_id": 1}),
+        ),
+        Scenario(
+            "delete tag", "DELETE", lambda i: f"/tag/{scratch(i)}", expect=(202,),
+            prepare=_prepare_rows("TagModel", lambda id, c: {"id": id, "name": f"scratch-tag-{id}", "store_id": 1}),
+        ),
+        Scenario(
+            "delete user", "DELETE", lambda i: f"/user/{scratch(i)}",
+            prepare=_prepare_rows("UserModel", lambda id, c: {"id": id, "username": f"scratch-{id}", "email": f"scratch-{id}@example.com", "password": "x"}),
+        ),
+        Scenario(
+            "delete store", "DELETE", lambda i: f"/store/{scratch(i)}",
+            prepare=_prepare_rows("StoreModel", lambda id, c: {"id": id, "name": f"scratch-store-{id}"}),
+        ),
+    ]
+
+
+class Tokens:
+    def __init__(self, app):
+        self.app = app
+
+    def headers(self, kind):
+        from flask_jwt_extended import create_access_token, create_refresh_token
+
+        if kind is None:
+            return {}
+        with self.app.app_context():
+            if kind == "refresh":
+                token = create_refresh_token(identity="1")
+            else:
+                token = create_access_token(identity="1", fresh=(kind != "access"), additional_claims={"is_admin": True})
+        return {"Authorization": f"Bearer {token}"}
+
+    def for_scenario(self, scenario, requests):
+        # access / fresh token 可以复用; refresh 和 logout 会把 token 加入 blocklist，每个请求单独一个
+        if scenario.auth in ("refresh", "single-use"):
+            return [self.headers(scenario.auth) for _ in range(requests)]
+        return [self.headers(scenario.auth)] * requests
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def run_client(app, scenario, headers, requests):
+    client = app.test_client()
+    latencies = []
+    errors = 0
+
+    started = time.perf_counter()
+    for i in range(requests):
+        body = scenario.body(i) if scenario.body else None
+        t0 = time.perf_counter()
+        response = client.open(scenario.path(i), method=scenario.method, json=body, headers=headers[i])
+        response.get_data()
+        latencies.append(time.perf_counter() - t0)
+        errors += response.status_code not in scenario.expect
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def run_http(base_url, scenario, headers, requests, concurrency):
+    import requests as http
+
+    sessions = [http.Session() for _ in range(concurrency)]
+
+    def one(i):
+        body = scenario.body(i) if scenario.body else None
+        t0 = time.perf_counter()
+        response = sessions[i % concurrency].request(
+            scenario.method, base_url + scenario.path(i), json=body, headers=headers[i]
+        )
+        return time.perf_counter() - t0, response.status_code not in scenario.expect
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    return summarize([latency for latency, _ in results], sum(error for _, error in results), elapsed)
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(db_url, workers, worker_class="sync", env=None):
+    port = _free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "gunicorn",
+            "--workers", str(workers),
+            "--worker-class", worker_class,
+            "--bind", f"127.0.0.1:{port}",
+            "--log-level", "warning",
+            f"benchmarks.standins:create_offline_app({db_url!r})",
+        ],
+        cwd=ROOT,
+        env={**os.environ, **(env or {})},
+    )
+
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            if process.poll() is not None:
+                raise RuntimeError("gunicorn exited during startup")
+            time.sleep(0.1)
+
+    process.terminate()
+    raise RuntimeError("gunicorn did not start within 30 seconds")
+
+
+def compare(results, baselines, tolerance):
+    regressions = []
+    for key, result in results.items():
+        if result["errors"]:
+            regressions.append(f"{key}: {result['errors']} responses with an unexpected status")
+        baseline = baselines.get(key)
+        if baseline is None:
+            continue
+        if result["p95_ms"] > baseline["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{key}: p95 {result['p95_ms']:.2f}ms > baseline {baseline['p95_ms']:.2f}ms")
+        if result["throughput"] < baseline["throughput"] * (1 - tolerance):
+            regressions.append(
+                f"{key}: throughput {result['throughput']:.1f}/s < baseline {baseline['throughput']:.1f}/s"
+            )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["client", "gunicorn"], default="client")
+    parser.add_argument("--stores", type=int, default=10)
+    parser.add_argument("--items-per-store", type=int, default=100)
+    parser.add_argument("--tags-per-store", type=int, default=5)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--concurrency", type=int, default=8, help="client threads in gunicorn mode")
+    parser.add_argument("--only", action="append", help="run only scenarios whose name contains this")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--baselines", default=BASELINES)
+    parser.add_argument("--update-baselines", action="store_true")
+    args = parser.parse_args(argv)
+
+    catalog = Catalog(args.stores, args.items_per_store, args.tags_per_store, args.users)
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    db_url = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+
+    with MailgunStandIn():
+        app = create_offline_app(db_url)
+        seed(app, catalog)
+        tokens = Tokens(app)
+
+        process = base_url = None
+        if args.mode == "gunicorn":
+            process, base_url = start_gunicorn(db_url, args.workers)
+
+        results = {}
+        try:
+            print(f"{'scenario':<22}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+            for scenario in scenarios(catalog):
+                if args.only and not any(name in scenario.name for name in args.only):
+                    continue
+                if scenario.client_only and args.mode != "client":
+                    continue
+                if scenario.prepare:
+                    scenario.prepare(app, catalog, args.requests)
+
+                headers = tokens.for_scenario(scenario, args.requests)
+                if args.mode == "client":
+                    result = run_client(app, scenario, headers, args.requests)
+                else:
+                    result = run_http(base_url, scenario, headers, args.requests, args.concurrency)
+
+                results[f"{args.mode}/{scenario.name}"] = result
+                print(
+                    f"{scenario.name:<22}{result['throughput']:>10.1f}{result['p50_ms']:>10.2f}"
+                    f"{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}{result['errors']:>8}"
+                )
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    baselines = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines) as f:
+            baselines = json.load(f)
+
+    if args.update_baselines:
+        baselines.update(results)
+        with open(args.baselines, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"baselines written to {args.baselines}")
+        return 0
+
+    regressions = compare(results, baselines, args.tolerance)
+    for regression in regressions:
+        print("REGRESSION", regression)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
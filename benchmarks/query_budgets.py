@@ -0,0 +1,183 @@
+"""
+SQL statements per request against the declared query budgets (query_budget.py).
+
+    python -m benchmarks.query_budgets
+    python -m benchmarks.query_budgets --verbose
+
+Sends a request to every endpoint with a ``@query_budget`` declaration,
+covering its slow paths: cache misses, ``?include=`` of every relation, pages
+of several sizes, writes that conflict and writes that succeed. Each case runs
+once with FAST_SERIALIZER_ENABLED on and once with it off (marshmallow). The
+statements of each request are counted on every engine, and an executemany
+counts once.
+
+The table lists each case with its statement count and budget. Declared
+endpoints that no case covers, and endpoints without a declaration, are
+listed after it. The run exits with status 1 when a request is over its
+budget or a declared endpoint has no case.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from benchmarks.seed import PASSWORD, Catalog, seed  # noqa: E402
+from benchmarks.standins import create_offline_app  # noqa: E402
+
+CATALOG = Catalog(stores=5, items_per_store=20, tags_per_store=4, users=3)
+
+# (方法, URL, token, JSON 请求体): token 是 None / "access" / "admin" / "refresh"
+CASES = (
+    ("GET", "/store?limit=3", None, None),
+    ("GET", "/store?limit=100&include=items,tags", None, None),
+    ("POST", "/store", None, {"name": "budget store"}),
+    ("POST", "/store", None, {"name": "budget store"}),
+    ("GET", "/store/1", None, None),
+    ("GET", "/store/2?include=items,tags", None, None),
+    ("GET", "/store/1/stats", None, None),
+    ("GET", "/store/stats?store_id=1,2,3", None, None),
+    ("GET", "/store/stats?limit=100", None, None),
+    ("GET", "/store/1/delete-job", None, None),
+    ("GET", "/store/1/tag?limit=100", None, None),
+    ("POST", "/store/1/tag", None, {"name": "budget tag"}),
+    ("POST", "/store/1/tag", None, {"name": "budget tag"}),
+    ("POST", "/store/999/tag", None, {"name": "orphan tag"}),
+    ("POST", "/item/2/tag/1", None, None),
+    ("POST", "/item/1/tag/2", None, None),
+    ("POST", "/item/999/tag/2", None, None),
+    ("POST", "/item/1/tag/999", None, None),
+    ("DELETE", "/item/1/tag/2", None, None),
+    ("POST", "/tag/link", None, {"pairs": [{"item_id": 3, "tag_id": 4}, {"item_id": 3, "tag_id": 1}]}),
+    ("GET", "/tag/3", None, None),
+    ("GET", "/tag/4?include=items", None, None),
+    ("DELETE", "/tag/20", None, None),
+    ("DELETE", "/tag/21", None, None),
+    ("GET", "/item?limit=5", "access", None),
+    ("GET", "/item?limit=100&include=store,tags&tag_id=1,2&min_price=1&sort=-price", "access", None),
+    ("POST", "/item", "access", {"name": "budget item", "price": 9.5, "store_id": 1}),
+    ("GET", "/item/5", "access", None),
+    ("GET", "/item/6?include=store,tags", "access", None),
+    ("PUT", "/item/5", None, {"name": "renamed", "price": 3.25, "store_id": 1}),
+    # 移到另一个 store；不存在的 id 被插入
+    ("PUT", "/item/8", None, {"name": "moved", "price": 4.5, "store_id": 2}),
+    ("PUT", "/item/5000", None, {"name": "created", "price": 2.75, "store_id": 3}),
+    ("DELETE", "/item/7", "admin", None),
+    ("GET", "/item/search?q=ceramic&limit=20", "access", None),
+    ("POST", "/register", None, {"username": "budget", "email": "budget@example.com", "password": PASSWORD}),
+    ("POST", "/register", None, {"username": "budget", "email": "other@example.com", "password": PASSWORD}),
+    ("POST", "/login", None, {"username": "user-1", "password": PASSWORD}),
+    ("POST", "/refresh", "refresh", None),
+    ("POST", "/logout", "access", None),
+    ("GET", "/user/1", None, None),
+    ("DELETE", "/user/3", None, None),
+)
+
+
+def issue_tokens(app):
+    from flask_jwt_extended import create_access_token, create_refresh_token
+
+    with app.app_context():
+        return {
+            "access": create_access_token(identity="1", fresh=True),
+            "admin": create_access_token(identity="1", fresh=True, additional_claims={"is_admin": True}),
+            "refresh": create_refresh_token(identity="1"),
+        }
+
+
+def send(app, client, tokens, case):
+    """
+    发送 CASES 中的一个请求 (test_query_budgets.py 也用它)。
+    """
+    from flask_jwt_extended import create_access_token
+
+    method, url, token, body = case
+    # 每个用户的 access token 只能 logout 一次: 每个用例重新签发
+    if token == "access":
+        with app.app_context():
+            tokens["access"] = create_access_token(identity="1", fresh=True)
+    headers = {"Authorization": f"Bearer {tokens[token]}"} if token else {}
+    return client.open(url, method=method, headers=headers, json=body)
+
+
+class StatementCounter:
+    def __init__(self, app):
+        from sqlalchemy import event
+
+        from db import db
+
+        self.count = 0
+        with app.app_context():
+            for engine in db.engines.values():
+                event.listen(engine, "before_cursor_execute", self._record)
+
+    def _record(self, *args):
+        self.count += 1
+
+    def during(self, function):
+        self.count = 0
+        result = function()
+        return self.count, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--verbose", action="store_true", help="print every case, not only the failures")
+    args = parser.parse_args(argv)
+
+    from query_budget import endpoint_budget
+
+    failures = 0
+    covered = set()
+    rows = []
+
+    for fast in (True, False):
+        os.environ["FAST_SERIALIZER_ENABLED"] = str(fast).lower()
+        workdir = tempfile.mkdtemp(prefix="bench-")
+        app = create_offline_app(f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+        seed(app, CATALOG)
+        counter = StatementCounter(app)
+        client = app.test_client()
+        adapter = app.url_map.bind("localhost")
+
+        tokens = issue_tokens(app)
+
+        for case in CASES:
+            method, url = case[:2]
+            endpoint, _ = adapter.match(url.split("?")[0], method)
+            budget = endpoint_budget(app.view_functions[endpoint], method)
+            count, response = counter.during(lambda: send(app, client, tokens, case))
+            covered.add((endpoint, method))
+
+            over = budget is not None and count > budget
+            failures += over
+            rows.append((over, fast, method, url, response.status_code, count, budget))
+
+    print(f"{'':<6}{'serializer':<12}{'request':<72}{'status':>7}{'queries':>9}{'budget':>8}")
+    for over, fast, method, url, status, count, budget in rows:
+        if over or args.verbose:
+            serializer = "fast" if fast else "marshmallow"
+            request = f"{method} {url}"
+            print(f"{'FAIL' if over else 'ok':<6}{serializer:<12}{request:<72}{status:>7}{count:>9}{budget if budget is not None else '-':>8}")
+
+    declared, undeclared = [], []
+    for rule in app.url_map.iter_rules():
+        for method in sorted(rule.methods - {"HEAD", "OPTIONS"}):
+            if endpoint_budget(app.view_functions[rule.endpoint], method) is None:
+                undeclared.append(f"{method} {rule.rule}")
+            elif (rule.endpoint, method) not in covered:
+                declared.append(f"{method} {rule.rule}")
+
+    print()
+    print(f"{len(rows)} requests, {failures} over budget")
+    for name in declared:
+        print(f"FAIL  declared but not covered by a case: {name}")
+    print("no budget declared: " + ", ".join(undeclared))
+    return 1 if failures or declared else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+"""
+Query plans and results of the filtered and sorted ``GET /item`` listing.
+
+    python -m benchmarks.query_plans
+    python -m benchmarks.query_plans --stores 50 --items-per-store 400 --verbose
+
+Every filter combination (store, price range, tag any/all, name prefix) is
+requested with every sort order. Each request is sent twice, once with
+FAST_SERIALIZER_ENABLED on and once off. Every page is followed to the end. The
+statements sent to SQLite are recorded and run again under
+``EXPLAIN QUERY PLAN``. A filtered request fails the check when any of its
+statements reads ``items``, ``items_tags`` or ``tags`` with a plain table scan
+instead of an index. The ids returned across all pages must equal the same
+filter and sort applied in Python to the whole catalog.
+
+The run exits with status 1 when any case fails. test_query_plans.py runs the
+same checks on a smaller catalog in the test suite.
+"""
+
+import argparse
+import os
+import re
+import sys
+from itertools import product
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from benchmarks.seed import Catalog, seed  # noqa: E402
+from benchmarks.standins import create_offline_app  # noqa: E402
+
+FILTERS = (
+    "store_id=3",
+    "min_price=10&max_price=12.5",
+    "store_id=3&min_price=20",
+    "tag_id=4",
+    "tag_id=4,7,9",
+    "tag_id=4,5&tag_match=all",
+    "name=item-1",
+    "name=item-2&max_price=30",
+    "store_id=2&tag_id=6,7&tag_match=any",
+)
+SORTS = ("id", "-id", "price", "-price", "name", "-name")
+
+# "SCAN items" 而不是 "SCAN items USING INDEX ..." / "SEARCH items ...": 读整张表
+TABLE_SCAN = re.compile(r"\bSCAN (items|items_tags|tags)\b(?! USING)")
+
+
+def _add_edge_cases(app):
+    from db import db
+    from models import ItemModel, TagModel
+
+    with app.app_context():
+        # 相同价格和相同名字的 item，检查 (price, id) / (name, id) 的 cursor；一个前缀里有 ASCII 最大字符的名字
+        for name in ("item-1 twin", "item-1 twin", "item-1\x7f", "Item-1 upper"):
+            item = ItemModel(name=name, price=11.0, store_id=3)
+            item.tags = [db.session.get(TagModel, 4), db.session.get(TagModel, 5)]
+            db.session.add(item)
+        db.session.commit()
+
+
+class StatementLog:
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.statements = []
+        event.listen(engine, "before_cursor_execute", self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            self.statements.append((statement, parameters))
+
+
+def _expected(app, query_string, sort):
+    """
+    在 Python 中对整个目录做同样的过滤和排序，返回 item id 列表。
+    """
+    from urllib.parse import parse_qs
+
+    from sqlalchemy.orm import selectinload
+
+    from models import ItemModel
+
+    args = {key: values[0] for key, values in parse_qs(query_string).items()}
+    with app.app_context():
+        items = ItemModel.query.options(selectinload(ItemModel.tags)).all()
+        rows = [(item.id, item.name, item.price, item.store_id, {tag.id for tag in item.tags}) for item in items]
+
+    def keep(row):
+        item_id, name, price, store_id, tags = row
+        if "store_id" in args and store_id != int(args["store_id"]):
+            return False
+        if "min_price" in args and price < float(args["min_price"]):
+            return False
+        if "max_price" in args and price > float(args["max_price"]):
+            return False
+        if "name" in args and not name.startswith(args["name"]):
+            return False
+        if "tag_id" in args:
+            wanted = {int(tag) for tag in args["tag_id"].split(",")}
+            if args.get("tag_match") == "all" and not wanted <= tags:
+                return False
+            if not wanted & tags:
+                return False
+        return True
+
+    column = sort.lstrip("-")
+    key = {"id": lambda row: (row[0],), "name": lambda row: (row[1], row[0]), "price": lambda row: (row[2], row[0])}
+    return [row[0] for row in sorted(filter(keep, rows), key=key[column], reverse=sort.startswith("-"))]
+
+
+def _fetch_all(client, url, headers, fast):
+    client.application.config["FAST_SERIALIZER_ENABLED"] = fast
+    ids = []
+    after = None
+    while True:
+        response = client.get(url + (f"&after={after}" if after else ""), headers=headers)
+        assert response.status_code == 200, (url, response.status_code, response.get_data(as_text=True))
+        ids += [item["id"] for item in response.get_json()]
+        after = response.headers.get("X-Next-Cursor")
+        if after is None:
+            return ids
+
+
+def table_scans(connection, statements):
+    """
+    返回 [(语句, 全表扫描的计划行)]。
+    """
+    scans = []
+    for statement, parameters in statements:
+        plan = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+        scans += [(statement, row[-1]) for row in plan if TABLE_SCAN.search(row[-1])]
+    return scans
+
+
+def check_case(app, client, log, headers, url, filters, sort, fast, verbose=False):
+    """
+    取完 url 的所有页，返回 (item ids, 问题列表)：结果和 Python 中的过滤不同，或者有全表扫描。
+    """
+    from db import db
+
+    del log.statements[:]
+    ids = _fetch_all(client, url, headers, fast)
+    statements = list(log.statements)
+
+    problems = []
+    if ids != _expected(app, filters, sort):
+        problems.append("results differ from the catalog filtered in Python")
+    with app.app_context(), db.engine.connect() as connection:
+        problems += [f"table scan: {detail}\n    {statement}" for statement, detail in table_scans(connection, statements)]
+        if verbose:
+            for statement, parameters in statements:
+                for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters):
+                    print(f"    {row[-1]}")
+    return ids, problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stores", type=int, default=20)
+    parser.add_argument("--items-per-store", type=int, default=100)
+    parser.add_argument("--tags-per-store", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=7, help="page size, small so every case spans several pages")
+    parser.add_argument("--verbose", action="store_true", help="print every query plan")
+    args = parser.parse_args(argv)
+
+    from flask_jwt_extended import create_access_token
+
+    from db import db
+
+    app = create_offline_app("sqlite://")
+    seed(app, Catalog(args.stores, args.items_per_store, args.tags_per_store, users=1))
+    _add_edge_cases(app)
+
+    with app.app_context():
+        headers = {"Authorization": f"Bearer {create_access_token(identity='1')}"}
+        engine = db.engine
+    client = app.test_client()
+    log = StatementLog(engine)
+
+    failures = 0
+    for filters, sort, fast in product(FILTERS, SORTS, (True, False)):
+        url = f"/item?limit={args.limit}&sort={sort}&{filters}"
+        ids, problems = check_case(app, client, log, headers, url, filters, sort, fast, args.verbose)
+
+        path = "compiled" if fast else "marshmallow"
+        print(f"{'FAIL' if problems else 'ok  '}  {path:<12}{url}  ({len(ids)} items)")
+        for problem in problems:
+            print(f"      {problem}")
+        failures += bool(problems)
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""
+Read-replica routing (replicas.py) against local SQLite replicas.
+
+    python -m benchmarks.replicas
+
+Seeds a primary SQLite file and copies it to two replica files. A third
+replica URL points into a directory that does not exist, so it can never
+connect. Nothing replicates between the files, so a row written after the copy
+exists only on the primary. Every statement is recorded with the database it
+ran on, and each case checks where a request's statements went:
+
+- GETs are spread over the two working replicas, and the broken one is skipped,
+- writes go to the primary,
+- the client that wrote reads from the primary for REPLICA_STALENESS_WINDOW
+  seconds, keyed by its IP or by its JWT identity, and other clients do not,
+- response cache misses read from the primary,
+- a GET that writes reads from the primary for the rest of the request,
+- with every replica down, GETs read from the primary.
+
+The run exits with status 1 when any case fails.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from benchmarks.seed import Catalog, seed  # noqa: E402
+from benchmarks.standins import create_offline_app  # noqa: E402
+
+WINDOW = 1.0
+
+
+class StatementLog:
+    """
+    记录每条语句在哪个数据库上执行 ("primary" 或 bind key)。
+    """
+
+    def __init__(self, app):
+        from sqlalchemy import event
+
+        from db import db
+
+        self.names = []
+        with app.app_context():
+            for bind_key, engine in db.engines.items():
+                name = bind_key or "primary"
+                event.listen(engine, "before_cursor_execute", lambda *args, name=name: self._record(name, args[2]))
+
+    def _record(self, name, statement):
+        # 副本的健康检查不算
+        if statement != "SELECT 1":
+            self.names.append(name)
+
+    def during(self, function):
+        self.names = []
+        result = function()
+        return sorted(set(self.names)), result
+
+
+def create_app(primary, replicas):
+    os.environ["DATABASE_REPLICA_URLS"] = ",".join(replicas)
+    os.environ["REPLICA_STALENESS_WINDOW"] = str(WINDOW)
+    os.environ["REPLICA_HEALTH_CHECK_INTERVAL"] = "60"
+    try:
+        return create_offline_app(primary)
+    finally:
+        del os.environ["DATABASE_REPLICA_URLS"]
+
+
+def main(argv=None):
+    from flask_jwt_extended import create_access_token
+    from sqlalchemy import select, update
+
+    from db import db
+    from models import StoreModel
+
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    primary = f"sqlite:///{os.path.join(workdir, 'primary.db')}"
+    seed(create_offline_app(primary), Catalog(stores=5, items_per_store=10))
+
+    # 复制之后不再同步: 之后写入的行只在主库中
+    replicas = []
+    for i in range(2):
+        path = os.path.join(workdir, f"replica-{i}.db")
+        shutil.copy(os.path.join(workdir, "primary.db"), path)
+        replicas.append(f"sqlite:///{path}")
+    broken = f"sqlite:///{os.path.join(workdir, 'missing', 'replica.db')}"
+
+    app = create_app(primary, replicas + [broken])
+    log = StatementLog(app)
+    client = app.test_client()
+    with app.app_context():
+        token = create_access_token(identity="1", fresh=True)
+    auth = {"Authorization": f"Bearer {token}"}
+
+    def request(method, url, ip, headers=None, json=None):
+        return client.open(url, method=method, headers=headers, json=json, environ_base={"REMOTE_ADDR": ip})
+
+    def store_names(response):
+        return {store["name"] for store in response.get_json()}
+
+    failures = 0
+
+    def check(name, ok, detail):
+        nonlocal failures
+        failures += not ok
+        print(f"{'ok  ' if ok else 'FAIL'}  {name:<52}{detail}")
+
+    used = set()
+    for _ in range(4):
+        names, response = log.during(lambda: request("GET", "/store?limit=5", "10.0.0.1"))
+        used.update(names)
+        check("GET reads from one replica", response.status_code == 200 and len(names) == 1 and names[0] != "primary", names)
+    check("GETs use both working replicas", used == {"replica-0", "replica-1"}, sorted(used))
+
+    names, response = log.during(lambda: request("POST", "/store", "10.0.0.2", json={"name": "written"}))
+    check("POST writes to the primary", response.status_code == 201 and names == ["primary"], names)
+
+    names, response = log.during(lambda: request("GET", "/store?limit=100", "10.0.0.2"))
+    check("writer (same IP) reads from the primary", names == ["primary"] and "written" in store_names(response), names)
+
+    names, response = log.during(lambda: request("GET", "/store?limit=100", "10.0.0.1"))
+    check("other clients read from a replica", names != ["primary"] and "written" not in store_names(response), names)
+
+    item = {"name": "written", "price": 2, "store_id": 1}
+    names, response = log.during(lambda: request("POST", "/item", "10.0.0.3", auth, item))
+    check("POST with a JWT writes to the primary", response.status_code == 201 and names == ["primary"], names)
+
+    names, response = log.during(lambda: request("GET", "/item?limit=100&name=written", "10.0.0.4", auth))
+    check("writer (same JWT, new IP) reads from the primary", names == ["primary"] and len(response.get_json()) == 1, names)
+
+    time.sleep(WINDOW)
+    names, response = log.during(lambda: request("GET", "/store?limit=100", "10.0.0.2"))
+    check("writer reads from a replica after the window", names != ["primary"] and "written" not in store_names(response), names)
+
+    names, response = log.during(lambda: request("GET", "/store/1", "10.0.0.1"))
+    check("cache miss reads from the primary", response.status_code == 200 and names == ["primary"], names)
+    names, response = log.during(lambda: request("GET", "/store/1", "10.0.0.1"))
+    check("cache hit does not query", response.status_code == 200 and names == [], names)
+
+    def write_then_read():
+        with app.test_request_context("/", method="GET"):
+            db.session.execute(update(StoreModel).where(StoreModel.id == 2).values(name="store-2"))
+            db.session.scalars(select(StoreModel.id)).all()
+            db.session.rollback()
+
+    names, _ = log.during(write_then_read)
+    check("GET that writes reads from the primary", names == ["primary"], names)
+
+    app = create_app(primary, [broken])
+    log = StatementLog(app)
+    client = app.test_client()
+    names, response = log.during(lambda: request("GET", "/store?limit=5", "10.0.0.1"))
+    check("every replica down: GET reads from the primary", response.status_code == 200 and names == ["primary"], names)
+
+    shutil.rmtree(workdir)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""
+Full-text search (``GET /item/search``) on a large catalog.
+
+    python -m benchmarks.search
+    python -m benchmarks.search --items 100000 --requests 50
+    python -m benchmarks.search --database postgresql://localhost/bench
+
+Seeds a catalog of --items items (1M by default), with the search index kept in
+sync by the database while the rows are inserted. Then it times searches for:
+
+- a word that matches one item,
+- words that match 1/13 and 1/7 of the catalog,
+- two words that must both match,
+- a word in every item (the worst case when every match is ranked).
+
+For each one it reports the first page, a page deep into the results (followed
+with X-Next-Cursor) and the same search done as ``LIKE '%word%'`` over name and
+description, which is what a client had to do before. Searches rank at most
+--max-ranked matches (SEARCH_MAX_RANKED, 0 ranks every match). Finally it
+checks that the index and the table agree (FTS5 integrity-check on SQLite).
+
+The default database is a SQLite file in a temporary directory. It is deleted
+afterwards.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from benchmarks.seed import Catalog, seed  # noqa: E402
+from benchmarks.standins import create_offline_app  # noqa: E402
+
+PAGE_SIZE = 20
+
+
+def searches(items):
+    # (说明, q)；词表见 benchmarks/seed.py
+    return [
+        ("1 item", f"number {items // 2}"),
+        ("1/13 of items", "lamp"),
+        ("1/7 of items", "purple"),
+        ("two words", "ceramic mug"),
+        ("every item", "benchmark"),
+    ]
+
+
+def _timed(function, requests):
+    timings = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        result = function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), result
+
+
+def _get(client, url, headers):
+    response = client.get(url, headers=headers)
+    assert response.status_code == 200, (url, response.status_code, response.get_data(as_text=True))
+    return response
+
+
+def _deep_cursor(client, q, headers, pages):
+    """
+    跟着 X-Next-Cursor 翻 pages 页，返回那一页的 cursor (结果不够多时返回 None)。
+    """
+    after = None
+    for _ in range(pages):
+        url = f"/item/search?q={q}&limit={PAGE_SIZE}&fields=id" + (f"&after={after}" if after else "")
+        after = _get(client, url, headers).headers.get("X-Next-Cursor")
+        if after is None:
+            return None
+    return after
+
+
+def _like_search(app, q):
+    from db import db
+    from models import ItemModel
+
+    with app.app_context():
+        query = ItemModel.query
+        for word in q.split():
+            pattern = f"%{word}%"
+            query = query.filter(db.or_(ItemModel.name.like(pattern), ItemModel.description.like(pattern)))
+        return query.order_by(ItemModel.id).limit(PAGE_SIZE).all()
+
+
+def check_index(app):
+    from db import db
+
+    with app.app_context():
+        if db.engine.dialect.name == "sqlite":
+            # 索引与 items 表不一致时抛出 "database disk image is malformed"
+            db.session.execute(db.text("INSERT INTO items_fts (items_fts, rank) VALUES ('integrity-check', 1)"))
+            return "FTS5 integrity-check ok"
+        return "generated column, nothing to check"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=1_000_000)
+    parser.add_argument("--items-per-store", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=20, help="timed requests per search")
+    parser.add_argument("--deep-page", type=int, default=50, help="page number timed after the first one")
+    parser.add_argument("--max-ranked", type=int, default=10000, help="SEARCH_MAX_RANKED, 0 ranks every match")
+    parser.add_argument("--database", help="database URL (default: a temporary SQLite file)")
+    args = parser.parse_args(argv)
+
+    from flask_jwt_extended import create_access_token
+
+    from db import db
+    from search import search_items
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = args.database or f"sqlite:///{os.path.join(tmp, 'search.db')}"
+        app = create_offline_app(url)
+        app.config["SEARCH_MAX_RANKED"] = args.max_ranked
+        stores = max(1, args.items // args.items_per_store)
+
+        started = time.perf_counter()
+        seed(app, Catalog(stores, args.items_per_store, tags_per_store=1, users=1))
+        seconds = time.perf_counter() - started
+        items = stores * args.items_per_store
+        print(f"seeded {items} items with the search index in {seconds:.1f}s ({items / seconds:,.0f} items/s)")
+
+        with app.app_context():
+            headers = {"Authorization": f"Bearer {create_access_token(identity='1')}"}
+        client = app.test_client()
+
+        print()
+        print(f"{'search':<16}{'q':<20}{'matches':>9}{'page 1 ms':>11}{f'page {args.deep_page} ms':>12}{'LIKE ms':>10}")
+        for name, q in searches(items):
+            first, response = _timed(lambda: _get(client, f"/item/search?q={q}&limit={PAGE_SIZE}", headers), args.requests)
+
+            after = _deep_cursor(client, q, headers, args.deep_page - 1)
+            if after is None:
+                deep = "-"
+            else:
+                deep_url = f"/item/search?q={q}&limit={PAGE_SIZE}&after={after}"
+                deep = f"{_timed(lambda: _get(client, deep_url, headers), args.requests)[0]:.2f}"
+
+            with app.app_context():
+                matches = search_items(q, db.engine.dialect.name)[0].count()
+            like, _ = _timed(lambda: _like_search(app, q), max(1, args.requests // 4))
+            print(f"{name:<16}{q:<20}{matches:>9}{first:>11.2f}{deep:>12}{like:>10.2f}")
+            assert len(response.get_json()) == min(PAGE_SIZE, matches)
+
+        print()
+        print(check_index(app))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
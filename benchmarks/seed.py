@@ -0,0 +1,101 @@
+"""
+Seeds a benchmark catalog: N stores x M items x K tags, plus users.
+
+Rows are written with Core executemany INSERTs, so seeding large catalogs is
+quick. Every item is linked to one tag of its own store. Every user gets the
+password "password". Item descriptions mix words from small vocabularies, so a
+search word matches a known share of the catalog (see ``description``).
+The Core INSERTs bypass the endpoints, so store_stats is rebuilt at the end.
+"""
+
+from dataclasses import dataclass
+
+from sqlalchemy import insert
+
+from db import db
+from models import ItemModel, ItemTags, StoreModel, TagModel, UserModel
+from store_stats import rebuild_store_stats
+
+PASSWORD = "password"
+
+# 每个词出现在 1/len(词表) 的 item 中
+COLOURS = ("red", "green", "blue", "black", "white", "yellow", "purple")
+MATERIALS = ("wooden", "steel", "ceramic", "glass", "cotton", "leather", "plastic", "bamboo", "copper", "wool", "stone")
+PRODUCTS = ("mug", "chair", "lamp", "bottle", "scarf", "basket", "knife", "clock", "vase", "bowl", "shelf", "bag", "pen")
+
+
+def description(i):
+    return f"A {COLOURS[i % len(COLOURS)]} {MATERIALS[i % len(MATERIALS)]} {PRODUCTS[i % len(PRODUCTS)]}, benchmark item number {i}"
+
+
+@dataclass
+class Catalog:
+    stores: int = 10
+    items_per_store: int = 100
+    tags_per_store: int = 5
+    users: int = 10
+
+    @property
+    def items(self):
+        return self.stores * self.items_per_store
+
+    @property
+    def tags(self):
+        return self.stores * self.tags_per_store
+
+
+def _insert(model, rows, chunk_size=5000):
+    for start in range(0, len(rows), chunk_size):
+        db.session.execute(insert(model), rows[start:start + chunk_size])
+
+
+def seed(app, catalog):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        _insert(StoreModel, [{"id": s, "name": f"store-{s}"} for s in range(1, catalog.stores + 1)])
+        _insert(
+            TagModel,
+            [
+                {"id": t, "name": f"tag-{t}", "store_id": (t - 1) // catalog.tags_per_store + 1}
+                for t in range(1, catalog.tags + 1)
+            ],
+        )
+        _insert(
+            ItemModel,
+            [
+                {
+                    "id": i,
+                    "name": f"item-{i}",
+                    "price": round(1 + (i % 997) * 0.37, 2),
+                    "description": description(i),
+                    "store_id": (i - 1) // catalog.items_per_store + 1,
+                }
+                for i in range(1, catalog.items + 1)
+            ],
+        )
+        _insert(
+            ItemTags,
+            [
+                {
+                    "item_id": i,
+                    "tag_id": ((i - 1) // catalog.items_per_store) * catalog.tags_per_store
+                    + (i % catalog.tags_per_store)
+                    + 1,
+                }
+                for i in range(1, catalog.items + 1)
+            ],
+        )
+
+        # pbkdf2 很慢: 所有用户共用同一个 hash
+        password = app.password_hasher.hash(PASSWORD)
+        _insert(
+            UserModel,
+            [
+                {"id": u, "username": f"user-{u}", "email": f"user-{u}@example.com", "password": password}
+                for u in range(1, catalog.users + 1)
+            ],
+        )
+        rebuild_store_stats()
+        db.session.commit()
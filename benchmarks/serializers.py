@@ -0,0 +1,153 @@
+"""
+Parity and speed of the compiled list serializers (serializers.py).
+
+    python -m benchmarks.serializers
+    python -m benchmarks.serializers --stores 50 --items-per-store 1000 --requests 20
+
+Every list endpoint is paged through from the first page to the last, at
+several page sizes and with several ?fields= / ?include= combinations, once
+with FAST_SERIALIZER_ENABLED on and once off (marshmallow). The detail
+endpoints are compared the same way. The JSON bodies and X-Next-Cursor headers
+must be identical; the run exits with status 1 on the first mismatch. The
+catalog also contains a store with no tags, an item with no tags and non-ASCII
+names. test_serializers.py runs the same parity checks in the test suite.
+
+Then both paths are timed on full pages of each endpoint, and a names-only
+store listing is timed against the full one.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from benchmarks.seed import Catalog, seed  # noqa: E402
+from benchmarks.standins import create_offline_app  # noqa: E402
+
+PAGE_SIZES = (7, 100, 1000)
+
+FIELDSETS = {
+    "/store": ("", "fields=name", "include=", "include=tags", "fields=name,items.name", "fields=id,items,tags.name"),
+    "/item": ("", "fields=name", "include=store", "fields=price,store.name,tags", "fields=tags.id&include=tags"),
+    "/tag": ("", "fields=name", "include=items", "fields=id,store.name,items.price"),
+}
+
+
+def _add_edge_cases(app):
+    from db import db
+    from models import ItemModel, StoreModel, TagModel
+
+    with app.app_context():
+        store = StoreModel(name="空的商店 ☕")
+        db.session.add(store)
+        db.session.flush()
+        db.session.add(ItemModel(name="没有标签的商品", price=0.1 + 0.2, store_id=store.id))
+        db.session.add(ItemModel(name="integer price", price=3, store_id=store.id))
+        db.session.add(TagModel(name="标签 ünïcode", store_id=1))
+        db.session.commit()
+        return store.id
+
+
+def _get(client, url, headers, fast):
+    client.application.config["FAST_SERIALIZER_ENABLED"] = fast
+    response = client.get(url, headers=headers)
+    assert response.status_code == 200, (url, response.status_code, response.get_data(as_text=True))
+    return response
+
+
+def check_parity(client, url, headers):
+    """
+    从第一页翻到最后一页，逐页比较两条路径的输出。返回比较过的页数。
+    """
+    pages = 0
+    after = None
+    while True:
+        page_url = url + (("&" if "?" in url else "?") + f"after={after}" if after else "")
+        fast = _get(client, page_url, headers, True)
+        slow = _get(client, page_url, headers, False)
+
+        if fast.get_json() != slow.get_json():
+            raise AssertionError(f"{page_url}: body differs\nfast: {fast.data[:500]}\nslow: {slow.data[:500]}")
+        cursor = fast.headers.get("X-Next-Cursor")
+        if cursor != slow.headers.get("X-Next-Cursor"):
+            raise AssertionError(f"{page_url}: X-Next-Cursor differs")
+        if fast.content_type != slow.content_type:
+            raise AssertionError(f"{page_url}: Content-Type differs")
+
+        pages += 1
+        if cursor is None:
+            return pages
+        after = cursor
+
+
+def list_urls(empty_store):
+    endpoints = [
+        ("/store", "/store"),
+        ("/item", "/item"),
+        ("/tag", "/store/1/tag"),
+        ("/tag", f"/store/{empty_store}/tag"),
+    ]
+    for kind, endpoint in endpoints:
+        for fieldset in FIELDSETS[kind]:
+            for size in PAGE_SIZES:
+                yield f"{endpoint}?limit={size}" + (f"&{fieldset}" if fieldset else "")
+
+
+def detail_urls(catalog, empty_store):
+    for kind, entity_id in (("store", empty_store), ("store", 1), ("item", 1), ("item", catalog.items + 1), ("tag", 1)):
+        for fieldset in FIELDSETS[f"/{kind}"]:
+            yield f"/{kind}/{entity_id}" + (f"?{fieldset}" if fieldset else "")
+
+
+def time_requests(client, url, headers, fast, requests):
+    timings = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        _get(client, url, headers, fast).get_data()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stores", type=int, default=20)
+    parser.add_argument("--items-per-store", type=int, default=50)
+    parser.add_argument("--tags-per-store", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=20, help="timed requests per endpoint and path")
+    args = parser.parse_args(argv)
+
+    from flask_jwt_extended import create_access_token
+
+    # 单个实体的响应缓存会让两条路径读到同一份缓存的响应
+    os.environ["RESPONSE_CACHE_BACKEND"] = "null"
+    app = create_offline_app("sqlite://")
+    catalog = Catalog(args.stores, args.items_per_store, args.tags_per_store, users=1)
+    seed(app, catalog)
+    empty_store = _add_edge_cases(app)
+
+    with app.app_context():
+        headers = {"Authorization": f"Bearer {create_access_token(identity='1')}"}
+    client = app.test_client()
+
+    for url in list_urls(empty_store):
+        pages = check_parity(client, url, headers)
+        print(f"parity ok  {url:<52} {pages} pages")
+    for url in detail_urls(catalog, empty_store):
+        check_parity(client, url, headers)
+        print(f"parity ok  {url}")
+
+    print()
+    print(f"{'endpoint':<34}{'marshmallow ms':>16}{'compiled ms':>14}{'speedup':>10}")
+    for endpoint in ("/store?limit=100", "/store?limit=1000&fields=name", "/item?limit=1000", "/store/1/tag?limit=1000"):
+        slow = time_requests(client, endpoint, headers, False, args.requests)
+        fast = time_requests(client, endpoint, headers, True, args.requests)
+        print(f"{endpoint:<34}{slow:>16.2f}{fast:>14.2f}{slow / fast:>9.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+Sync versus gevent gunicorn workers under the same load.
+
+    python -m benchmarks.serving
+    python -m benchmarks.serving --workers 2 --concurrency 200 --db-latency-ms 5
+
+Seeds one catalog (see seed.py), then starts gunicorn once per worker class
+with the same number of workers and drives the same scenarios from
+benchmarks/http_bench.py at --concurrency concurrent clients. Throughput,
+latency percentiles and errors are reported side by side.
+
+SQLite is a local file, so its queries never wait on a server. --db-latency-ms
+adds that wait before every statement (BENCH_DB_LATENCY_MS in standins.py), as
+if the database were across the network. This is where the modes differ: a
+sync worker sleeps through it, a gevent worker serves other requests.
+--db-latency-ms 0 measures the raw CPU cost of each mode instead.
+
+Only read scenarios are run: concurrent writes to a SQLite file lock each other
+in either mode.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from benchmarks.http_bench import Tokens, run_http, scenarios, start_gunicorn  # noqa: E402
+from benchmarks.seed import Catalog, seed  # noqa: E402
+from benchmarks.standins import MailgunStandIn, create_offline_app  # noqa: E402
+
+SCENARIOS = (
+    "list stores",
+    "list store tags",
+    "list items",
+    "filter items by tag",
+    "search items",
+    "get user",
+    "login",
+)
+
+WORKER_CLASSES = ("sync", "gevent")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stores", type=int, default=10)
+    parser.add_argument("--items-per-store", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=1000, help="requests per scenario")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers in both modes")
+    parser.add_argument("--concurrency", type=int, default=200, help="concurrent clients")
+    parser.add_argument("--db-latency-ms", type=float, default=5.0, help="simulated round trip per statement")
+    parser.add_argument("--worker-connections", type=int, default=1000, help="GUNICORN_WORKER_CONNECTIONS")
+    parser.add_argument("--db-pool-size", type=int, default=100, help="DB_POOL_SIZE in gevent mode")
+    args = parser.parse_args(argv)
+
+    catalog = Catalog(args.stores, args.items_per_store, tags_per_store=5, users=10)
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    db_url = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    selected = [scenario for scenario in scenarios(catalog) if scenario.name in SCENARIOS]
+
+    results = {}
+    with MailgunStandIn():
+        app = create_offline_app(db_url)
+        seed(app, catalog)
+        tokens = Tokens(app)
+
+        for worker_class in WORKER_CLASSES:
+            env = {"BENCH_DB_LATENCY_MS": str(args.db_latency_ms)}
+            if worker_class == "gevent":
+                env.update(
+                    GUNICORN_WORKER_CONNECTIONS=str(args.worker_connections),
+                    DB_POOL_SIZE=str(args.db_pool_size),
+                )
+            process, base_url = start_gunicorn(db_url, args.workers, worker_class, env)
+            try:
+                for scenario in selected:
+                    headers = tokens.for_scenario(scenario, args.requests)
+                    results[worker_class, scenario.name] = run_http(
+                        base_url, scenario, headers, args.requests, args.concurrency
+                    )
+            finally:
+                process.terminate()
+                process.wait()
+
+    print(
+        f"{args.workers} workers, {args.concurrency} concurrent clients, "
+        f"{args.db_latency_ms:g} ms per statement"
+    )
+    print()
+    header = f"{'scenario':<22}"
+    for worker_class in WORKER_CLASSES:
+        header += f"{worker_class + ' req/s':>14}{'p95 ms':>10}{'errors':>8}"
+    print(header + f"{'speedup':>9}")
+
+    for scenario in selected:
+        line = f"{scenario.name:<22}"
+        for worker_class in WORKER_CLASSES:
+            result = results[worker_class, scenario.name]
+            line += f"{result['throughput']:>14.1f}{result['p95_ms']:>10.1f}{result['errors']:>8}"
+        sync, gevent = (results[worker_class, scenario.name]["throughput"] for worker_class in WORKER_CLASSES)
+        print(line + f"{gevent / sync if sync else 0:>8.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
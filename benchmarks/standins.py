@@ -0,0 +1,117 @@
+"""
+Offline stand-ins so the benchmarks need neither Redis nor Mailgun.
+
+- Redis: every Redis-backed feature is switched to its in-process backend, and
+  the RQ queues are bound to an in-memory fakeredis server. Jobs are recorded
+  but no worker runs them.
+- Mailgun: MAILGUN_API_URL points at a local HTTP server that accepts every
+  message, in case the email buffer is flushed during a run. It records the
+  messages and can be told to fail the next requests (test_tasks.py).
+- Database latency: BENCH_DB_LATENCY_MS adds a sleep before every SQL
+  statement, like the round trip to a database server that a local SQLite
+  file does not have.
+
+``create_offline_app`` is also what the gunicorn workers load:
+
+    gunicorn "benchmarks.standins:create_offline_app('sqlite:///bench.db')"
+"""
+
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+OFFLINE_ENV = {
+    "REDIS_URL": "redis://localhost:6379",
+    "JWT_BLOCKLIST_BACKEND": "memory",
+    "REPLICA_STALENESS_BACKEND": "memory",
+    "RESPONSE_CACHE_BACKEND": "lru",
+    "RATELIMIT_ENABLED": "false",
+    "PASSWORD_HASH_WORKERS": "0",
+    "PASSWORD_HASH_ROUNDS": "1000",
+    "METRICS_ENABLED": "false",
+}
+
+
+def create_offline_app(db_url="sqlite:///bench.db"):
+    for key, value in OFFLINE_ENV.items():
+        os.environ.setdefault(key, value)
+
+    import fakeredis
+    from rq import Queue
+
+    from app import create_app
+
+    app = create_app(db_url)
+    connection = fakeredis.FakeRedis()
+    app.queue = Queue("emails", connection=connection)
+    app.jobs_queue = Queue("default", connection=connection)
+
+    latency = float(os.environ.get("BENCH_DB_LATENCY_MS", 0)) / 1000
+    if latency:
+        _add_db_latency(app, latency)
+    return app
+
+
+def _add_db_latency(app, latency):
+    import time
+
+    from sqlalchemy import event
+
+    from db import db
+
+    def sleep(*args):
+        # 运行时才取 time.sleep: gevent worker 打过补丁的 sleep 会让出给其它 greenlet
+        time.sleep(latency)
+
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", sleep)
+
+
+class _MailgunHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        stand_in = self.server.stand_in
+        if stand_in.failures:
+            stand_in.failures -= 1
+            self._reply(500, b'{"message": "Internal Server Error"}')
+            return
+
+        stand_in.messages.append(parse_qs(data.decode()))
+        self._reply(200, b'{"id": "<bench@localhost>", "message": "Queued. Thank you."}')
+
+    def _reply(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class MailgunStandIn:
+    """
+    本地的 Mailgun 替身: 启动之后设置 MAILGUN_API_URL 指向它。
+    messages: 接受的每个请求的表单字段 ({字段: [值, ...]})
+    failures: 接下来这么多个请求返回 500
+    """
+
+    def __init__(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _MailgunHandler)
+        self.server.stand_in = self
+        self.url = f"http://127.0.0.1:{self.server.server_port}/v3"
+        self.messages = []
+        self.failures = 0
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        os.environ["MAILGUN_API_URL"] = self.url
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
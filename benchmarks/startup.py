@@ -0,0 +1,129 @@
+"""
+Startup cost of a web worker: ``import app`` and ``create_app()``.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --runs 20 --update-baselines
+    python -m benchmarks.startup --importtime 15
+
+Each run starts a fresh interpreter, the same as a gunicorn worker boot, a test
+session or a ``flask`` CLI call. It times the module import and the app factory
+separately, plus the whole process. The medians are compared with the
+"startup/*" entries of benchmarks/baselines.json, and the run exits with
+status 1 when one rises by more than --tolerance.
+
+--importtime N lists the N slowest imports made by app.py and create_app()
+(from ``python -X importtime``), to find out what made startup slower.
+
+Needs no Redis and no database.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+BASELINES = os.path.join(os.path.dirname(__file__), "baselines.json")
+
+CHILD = """
+import time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+created = time.perf_counter()
+print((imported - started) * 1000, (created - imported) * 1000)
+"""
+
+
+def _env():
+    env = dict(os.environ)
+    # 和生产环境的 gunicorn worker 一样启动: 不 create_all，也不连接 Redis
+    env.pop("FLASK_DEBUG", None)
+    env.pop("REDIS_URL", None)
+    env["DB_CREATE_ALL"] = "false"
+    env["DATABASE_URL"] = "sqlite://"
+    return env
+
+
+def run_once():
+    started = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD], cwd=ROOT, env=_env(), capture_output=True, text=True, check=True
+    ).stdout
+    process = (time.perf_counter() - started) * 1000
+
+    import_ms, create_app_ms = map(float, output.split()[-2:])
+    return {"import": import_ms, "create_app": create_app_ms, "process": process}
+
+
+def slowest_imports(limit):
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app; app.create_app()"],
+        cwd=ROOT, env=_env(), capture_output=True, text=True, check=True,
+    ).stderr
+
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # 每深一层缩进两个空格: 只看 app 直接导入的模块，和 create_app 中才导入的模块
+        depth = (len(name) - len(name.lstrip()) + 1) // 2
+        if depth <= 2 and name.strip() != "app":
+            imports.append((int(cumulative) / 1000, name.strip()))
+    return sorted(imports, reverse=True)[:limit]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--importtime", type=int, default=0, metavar="N", help="list the N slowest imports")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--baselines", default=BASELINES)
+    parser.add_argument("--update-baselines", action="store_true")
+    args = parser.parse_args(argv)
+
+    # 第一次运行会写 __pycache__，不计入结果
+    run_once()
+    runs = [run_once() for _ in range(args.runs)]
+
+    results = {}
+    print(f"{'phase':<14}{'median ms':>12}{'min ms':>10}{'max ms':>10}")
+    for phase in ("import", "create_app", "process"):
+        values = [run[phase] for run in runs]
+        results[f"startup/{phase}"] = {"median_ms": statistics.median(values), "runs": len(values)}
+        print(f"{phase:<14}{statistics.median(values):>12.1f}{min(values):>10.1f}{max(values):>10.1f}")
+
+    if args.importtime:
+        print()
+        for cumulative, name in slowest_imports(args.importtime):
+            print(f"{cumulative:>10.1f} ms  {name}")
+
+    baselines = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines) as f:
+            baselines = json.load(f)
+
+    if args.update_baselines:
+        baselines.update(results)
+        with open(args.baselines, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"baselines written to {args.baselines}")
+        return 0
+
+    regressions = [
+        f"{key}: median {result['median_ms']:.1f}ms > baseline {baselines[key]['median_ms']:.1f}ms"
+        for key, result in results.items()
+        if key in baselines and result["median_ms"] > baselines[key]["median_ms"] * (1 + args.tolerance)
+    ]
+    for regression in regressions:
+        print("REGRESSION", regression)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,46 @@
+"""
+Per-email render cost of the registration email.
+
+    python benchmarks/template_render.py
+
+- cold: a fresh Environment per email, what every RQ work-horse paid before
+  templates were preloaded in the worker process
+- render_template: compiled template, full Jinja render
+- render_static_template: static parts rendered once, per-user substitution only
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.chdir(os.path.join(os.path.dirname(__file__), ".."))
+
+import jinja2
+
+import tasks
+
+NUMBER = 2000
+
+
+def cold():
+    env = jinja2.Environment(loader=jinja2.FileSystemLoader("templates"))
+    return env.get_template("email/registration.html").render(username="alice")
+
+
+def main():
+    tasks.preload_templates()
+    assert tasks.render_static_template("email/registration.html", username="alice") == cold()
+
+    cases = {
+        "cold": cold,
+        "render_template": lambda: tasks.render_template("email/registration.html", username="alice"),
+        "render_static_template": lambda: tasks.render_static_template("email/registration.html", username="alice"),
+    }
+    for name, func in cases.items():
+        seconds = min(timeit.repeat(func, number=NUMBER, repeat=3)) / NUMBER
+        print(f"{name:>24}: {seconds * 1e6:9.1f} us/email")
+
+
+if __name__ == "__main__":
+    main()
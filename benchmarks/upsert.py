@@ -0,0 +1,135 @@
+"""
+Throughput of the bulk upsert ``PUT /item`` against one ``PUT /item/<id>`` per row.
+
+    python -m benchmarks.upsert
+    python -m benchmarks.upsert --rows 100000 --db-latency-ms 1
+
+Seeds a catalog holding half of --rows items, then upserts --rows rows: the
+first half replaces the seeded items (new names, new prices and every tenth
+item moved to another store), the second half inserts new items. The rows are
+sent as NDJSON bodies of at most BULK_MAX_ROWS rows. --per-row-sample rows of
+the first half are also written with ``PUT /item/<id>``, one request each, and
+its rate is extrapolated to the same number of rows.
+
+After the run the inserted / updated counts, the items table and store_stats
+(against ``rebuild_store_stats``) are checked. The run exits with status 1 when
+a check fails.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from benchmarks.seed import Catalog, seed  # noqa: E402
+from benchmarks.standins import create_offline_app  # noqa: E402
+
+
+def upsert_rows(catalog, rows):
+    for i in range(1, rows + 1):
+        store_id = (i - 1) % catalog.stores + 1
+        if i <= catalog.items and i % 10:
+            # 更新时大多数 item 留在原来的 store 中
+            store_id = (i - 1) // catalog.items_per_store + 1
+        yield {"id": i, "name": f"upserted-{i}", "price": round(2 + (i % 89) * 0.5, 2), "store_id": store_id}
+
+
+def stats_snapshot():
+    from sqlalchemy import select
+
+    from db import db
+    from models import StoreStatsModel
+
+    stats = StoreStatsModel.__table__
+    return [
+        (row.store_id, row.item_count, round(row.price_sum, 2), row.min_price, row.max_price)
+        for row in db.session.execute(select(stats).order_by(stats.c.store_id))
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--stores", type=int, default=10)
+    parser.add_argument("--per-row-sample", type=int, default=1000)
+    parser.add_argument("--db-latency-ms", type=float, default=0.0, help="simulated round trip per statement")
+    args = parser.parse_args(argv)
+
+    from flask_jwt_extended import create_access_token
+    from sqlalchemy import func, select
+
+    from db import db
+    from models import ItemModel
+    from store_stats import rebuild_store_stats
+
+    catalog = Catalog(args.stores, args.rows // 2 // args.stores, tags_per_store=5, users=1)
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    db_url = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["BENCH_DB_LATENCY_MS"] = str(args.db_latency_ms)
+    app = create_offline_app(db_url)
+    seed(app, catalog)
+
+    client = app.test_client()
+    with app.app_context():
+        token = create_access_token(identity="1", fresh=True)
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/x-ndjson"}
+
+    rows = list(upsert_rows(catalog, args.rows))
+    max_rows = app.config["BULK_MAX_ROWS"]
+
+    # 基准: 每行一个 PUT /item/<id> (只更新已存在的 item，之后由批量写入以同样的内容覆盖)
+    sample = rows[: min(args.per_row_sample, catalog.items)]
+    started = time.perf_counter()
+    for row in sample:
+        response = client.put(f"/item/{row['id']}", json={key: value for key, value in row.items() if key != "id"})
+        assert response.status_code == 200, response.get_data(as_text=True)
+    per_row_rate = len(sample) / (time.perf_counter() - started)
+
+    inserted = updated = 0
+    started = time.perf_counter()
+    for start in range(0, len(rows), max_rows):
+        body = "\n".join(json.dumps(row) for row in rows[start:start + max_rows])
+        response = client.put("/item", data=body, headers=headers)
+        assert response.status_code == 200, response.get_data(as_text=True)[:500]
+        result = response.get_json()
+        inserted += result["inserted"]
+        updated += result["updated"]
+    elapsed = time.perf_counter() - started
+    bulk_rate = len(rows) / elapsed
+
+    print(f"{len(rows)} rows ({catalog.items} existing), {args.db_latency_ms:g} ms per statement")
+    print(f"{'PUT /item/<id> per row':<28}{per_row_rate:>10.0f} rows/s  ({len(rows) / per_row_rate:.1f} s extrapolated)")
+    print(f"{'PUT /item bulk upsert':<28}{bulk_rate:>10.0f} rows/s  ({elapsed:.1f} s)")
+    print(f"{'speedup':<28}{bulk_rate / per_row_rate:>10.1f}x")
+    print()
+
+    failures = 0
+
+    def check(name, ok, detail):
+        nonlocal failures
+        failures += not ok
+        print(f"{'ok  ' if ok else 'FAIL'}  {name:<36}{detail}")
+
+    expected_updated = min(catalog.items, len(rows))
+    check("inserted / updated counts", (inserted, updated) == (len(rows) - expected_updated, expected_updated),
+          f"inserted={inserted} updated={updated}")
+    with app.app_context():
+        count, renamed = db.session.execute(
+            select(func.count(), func.count().filter(ItemModel.name.like("upserted-%")))
+        ).one()
+        check("every row written", count == len(rows) and renamed == len(rows), f"{count} items, {renamed} renamed")
+        incremental = stats_snapshot()
+        rebuild_store_stats()
+        check("store_stats match a rebuild", incremental == stats_snapshot(), f"{len(incremental)} stores")
+        db.session.rollback()
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
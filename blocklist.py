@@ -1,9 +1,109 @@
 """
 blocklist.py
 
-This file just contains the blocklist of the JWT tokens. It will be imported by
-app and the logout resource so that tokens can be added to the blocklist when the
-user logs out.
+This file contains the blocklist of the JWT tokens. It is created by create_app
+(as app.blocklist) and used by the logout / refresh resources so that tokens can
+be added to the blocklist when the user logs out.
+
+Revoked JTIs are kept in a shared store (Redis by default) so that a logout in
+one gunicorn worker is seen by all the others. Each JTI expires from the store
+when its token's ``exp`` passes, because an expired token is rejected anyway.
+
+``check_if_token_in_blocklist`` runs on every authenticated request, so answers
+are also kept in a small in-process LRU for JWT_BLOCKLIST_CACHE_TTL seconds.
+Most requests then cost no network round trip. A token revoked in another
+worker can be accepted here for at most that many seconds.
 """
 
-BLOCKLIST = set()
\ No newline at end of file
+import heapq
+import math
+import time
+
+from cache import LRUCache
+
+
+class MemoryBlocklistStore:
+    """
+    进程内的 blocklist (单进程开发 / 测试用)，过期的 JTI 在 add 时顺带清理。
+    """
+
+    def __init__(self):
+        self._expires = {}
+        self._heap = []
+
+    def add(self, jti, exp=None):
+        self._purge()
+        self._expires[jti] = exp
+        if exp is not None:
+            heapq.heappush(self._heap, (exp, jti))
+
+    def __contains__(self, jti):
+        if jti not in self._expires:
+            return False
+        exp = self._expires[jti]
+        return exp is None or exp > time.time()
+
+    def _purge(self):
+        now = time.time()
+        while self._heap and self._heap[0][0] <= now:
+            _, jti = heapq.heappop(self._heap)
+            self._expires.pop(jti, None)
+
+
+class RedisBlocklistStore:
+    def __init__(self, connection, prefix="blocklist:"):
+        self.connection = connection
+        self.prefix = prefix
+
+    def add(self, jti, exp=None):
+        if exp is None:
+            self.connection.set(self.prefix + jti, 1)
+            return
+
+        # 向上取整: 剩余不到 1 秒的 token 仍然有效，也要记录
+        ttl = math.ceil(exp - time.time())
+        # 已经过期的 token 本身就会被拒绝，不需要再记录
+        if ttl > 0:
+            self.connection.set(self.prefix + jti, 1, ex=ttl)
+
+    def __contains__(self, jti):
+        return bool(self.connection.exists(self.prefix + jti))
+
+
+class Blocklist:
+    def __init__(self, store, cache_size=4096, cache_ttl=2):
+        self.store = store
+        # jti -> True / False (是否已被撤销) 的本地缓存
+        self._cache = LRUCache(maxsize=cache_size, ttl=cache_ttl) if cache_ttl else None
+
+    def add(self, jti, exp=None):
+        self.store.add(jti, exp)
+        if self._cache is not None:
+            self._cache.set(jti, True)
+
+    def __contains__(self, jti):
+        if self._cache is None:
+            return jti in self.store
+
+        revoked = self._cache.get(jti)
+        if revoked is None:
+            revoked = jti in self.store
+            self._cache.set(jti, revoked)
+        return revoked
+
+
+def create_blocklist(config, connection=None):
+    backend = config["JWT_BLOCKLIST_BACKEND"]
+
+    if backend == "redis":
+        store = RedisBlocklistStore(connection)
+    elif backend == "memory":
+        store = MemoryBlocklistStore()
+    else:
+        raise ValueError(f"Unknown JWT_BLOCKLIST_BACKEND: {backend!r}")
+
+    return Blocklist(
+        store,
+        cache_size=config["JWT_BLOCKLIST_CACHE_SIZE"],
+        cache_ttl=config["JWT_BLOCKLIST_CACHE_TTL"],
+    )
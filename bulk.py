@@ -0,0 +1,180 @@
+"""
+bulk.py
+
+Helpers shared by the bulk write endpoints.
+
+A bulk request body is either a JSON array or NDJSON (one JSON object per line,
+``Content-Type: application/x-ndjson``). Rows are validated one by one with the
+endpoint's schema so a bad row is reported by its index instead of failing the
+whole request.
+
+``upsert`` writes a chunk of rows with one ``INSERT ... ON CONFLICT DO UPDATE``
+on PostgreSQL and SQLite. Other databases get an UPDATE for the rows that
+exist and an INSERT for the rest. It returns the previous values of the rows
+it updated, so callers can tell inserted rows from updated ones. On PostgreSQL
+they come from the upsert's own RETURNING; SQLite takes the write lock before
+reading them. ``insert_or_ignore`` is the
+``ON CONFLICT DO NOTHING`` counterpart, also used by single-row writes that
+rely on a unique constraint instead of checking for duplicates first.
+"""
+
+import json
+from itertools import islice
+
+from flask import current_app, request
+from flask_smorest import abort
+from marshmallow import ValidationError
+from sqlalchemy import bindparam, false, insert, literal_column, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from db import db
+
+UPSERT_DIALECTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def read_rows():
+    """
+    读取请求体中的所有行 (JSON 数组 或 NDJSON)。
+    """
+    if request.mimetype == "application/x-ndjson":
+        try:
+            rows = [json.loads(line) for line in request.get_data(as_text=True).splitlines() if line.strip()]
+        except ValueError:
+            abort(400, message="Request body is not valid NDJSON.")
+    else:
+        rows = request.get_json(silent=True)
+        if not isinstance(rows, list):
+            abort(400, message="Request body must be a JSON array or NDJSON.")
+
+    if len(rows) > current_app.config["BULK_MAX_ROWS"]:
+        abort(413, message=f"At most {current_app.config['BULK_MAX_ROWS']} rows are accepted per request.")
+    return rows
+
+
+def load_rows(schema, rows):
+    """
+    用 schema 逐行校验。
+
+    返回 (valid, errors):
+    valid:  [(行号, 反序列化后的数据)]
+    errors: {行号: 错误信息}
+    """
+    valid = []
+    errors = {}
+    for index, row in enumerate(rows):
+        try:
+            valid.append((index, schema.load(row)))
+        except ValidationError as err:
+            errors[index] = err.messages
+    return valid, errors
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def insert_or_ignore(table):
+    """
+    INSERT ... ON CONFLICT DO NOTHING: 违反唯一约束的行不插入，也不报错 (rowcount / RETURNING 中没有它)。
+    其它数据库返回普通的 INSERT: 冲突时抛出 IntegrityError，由调用者当作冲突处理。
+    """
+    dialect_insert = UPSERT_DIALECTS.get(db.session.get_bind().dialect.name)
+    if dialect_insert is None:
+        return insert(table)
+    return dialect_insert(table).on_conflict_do_nothing()
+
+
+def ignores_conflicts():
+    """
+    insert_or_ignore 是否用 ON CONFLICT DO NOTHING 跳过冲突的行。
+    是的时候 IntegrityError 来自其它约束，不能当作冲突处理。
+    """
+    return db.session.get_bind().dialect.name in UPSERT_DIALECTS
+
+
+def upsert(table, key, rows, previous):
+    """
+    写入一块行: key 列的值已存在的行整行更新，其余的行插入。rows 中的每一行必须有相同的列。
+    返回 {key 的值: (previous 各列原来的值, ...)}，只包含被更新的行；不在其中的行是新插入的。
+    """
+    columns = [column for column in rows[0] if column != key]
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "postgresql":
+        return _upsert_postgresql(table, key, rows, columns, previous)
+
+    dialect_insert = UPSERT_DIALECTS.get(dialect)
+    if dialect_insert is not None:
+        # SQLite 同时只有一个写事务: 先用一条不修改任何行的 UPDATE 取得写锁，
+        # 之后读到的原来的值在 commit 之前不会被其它连接改变 (SQLite 在进程内执行，没有网络往返)
+        db.session.execute(update(table).where(false()).values({key: table.c[key]}))
+    existing = _previous_values(table, key, rows, previous)
+
+    if dialect_insert is not None:
+        # 一条 executemany: SQLite 上在进程内逐行执行
+        statement = dialect_insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c[key]],
+            set_={column: statement.excluded[column] for column in columns},
+        )
+        db.session.execute(statement, rows)
+        return existing
+
+    # 其它数据库: 没有原子的 upsert，同一个 key 的并发写入可能违反主键约束
+    updates = [row for row in rows if row[key] in existing]
+    inserts = [row for row in rows if row[key] not in existing]
+    if updates:
+        db.session.execute(
+            update(table)
+            .where(table.c[key] == bindparam("b_key"))
+            .values({column: bindparam(f"b_{column}") for column in columns}),
+            [{"b_key": row[key], **{f"b_{column}": row[column] for column in columns}} for row in updates],
+        )
+    if inserts:
+        db.session.execute(insert(table), inserts)
+    return existing
+
+
+def _previous_values(table, key, rows, previous):
+    statement = (
+        select(table.c[key], *(table.c[column] for column in previous))
+        .where(table.c[key].in_([row[key] for row in rows]))
+        .with_for_update()
+    )
+    return {row[0]: tuple(row[1:]) for row in db.session.execute(statement)}
+
+
+def _upsert_postgresql(table, key, rows, columns, previous):
+    """
+    PostgreSQL: 一条 INSERT ... ON CONFLICT DO UPDATE ... RETURNING 同时得到每一行是插入还是更新，以及原来的值。
+    xmax = 0 的行是本语句插入的；RETURNING 中的子查询读的是语句开始时的快照，所以是更新之前的值。
+    """
+    old = table.alias("old")
+    # INSERT 中的子查询不会自动关联到目标表，这里直接写出 "表名.key"
+    target_key = literal_column(f"{table.name}.{key}")
+    visible = select(old.c[key]).where(old.c[key] == target_key)
+    returned = [literal_column("xmax = 0").label("inserted")]
+    returned += [
+        select(old.c[column]).where(old.c[key] == target_key).scalar_subquery().label(column)
+        for column in previous
+    ]
+
+    statement = postgresql.insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c[key]],
+        set_={column: statement.excluded[column] for column in columns},
+        # 并发请求在本语句的快照之后才插入的同一个 key: 快照中读不到它原来的值，这里不更新 (也不返回)，
+        # 下面用新的语句 (新的快照) 重新写入
+        where=visible.exists(),
+    ).returning(table.c[key], *returned)
+
+    existing = {}
+    while rows:
+        written = set()
+        for row in db.session.execute(statement, rows):
+            written.add(row[0])
+            if not row.inserted:
+                existing[row[0]] = tuple(row[2:])
+        rows = [row for row in rows if row[key] not in written]
+    return existing
@@ -0,0 +1,238 @@
+"""
+cache.py
+
+Response cache for the single-entity GET endpoints (store, item, tag).
+
+The serialized JSON body of ``GET /store/<id>``, ``GET /item/<id>`` and
+``GET /tag/<id>`` is cached under an entity key such as ``store:1``. Every
+response carries a strong ETag computed from its body, and a request whose
+``If-None-Match`` matches gets an empty 304.
+
+Write handlers call ``invalidate_entities`` after commit with every entity whose
+payload changed, including parents and linked entities that nest it.
+
+Every invalidation also advances a per-entity generation. A GET that misses
+reads the generation before its query, and the body is only stored if the
+generation is unchanged: an invalidation that lands between the read and the
+set would otherwise leave the old body cached for the whole TTL.
+
+Backends:
+- "lru": in-process LRU (default). Each gunicorn worker has its own copy, so an
+  invalidation only reaches the worker that handled the write; the TTL bounds
+  how long other workers can serve a stale body.
+- "redis": shared by all workers, over the REDIS_URL connection.
+- "null": caching disabled, ETag / 304 handling still applies.
+"""
+
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, request, Response
+
+from replicas import read_from_primary
+
+
+class NullCache:
+    def get(self, key):
+        return None
+
+    def generation(self, key):
+        return None
+
+    def set(self, key, value, generation=None):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+
+class LRUCache:
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        # key -> 最近一次 delete 的序号，最多保留 maxsize 个;
+        # 被挤出去的 key 的 generation 取 _evicted (被挤出的最大序号)，set 只会被多拒绝，不会放进旧内容
+        self._generations = OrderedDict()
+        self._stamp = 0
+        self._evicted = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+
+            self._data.move_to_end(key)
+            return value
+
+    def generation(self, key):
+        with self._lock:
+            return self._generations.get(key, self._evicted)
+
+    def set(self, key, value, generation=None):
+        """
+        generation: 查询之前 generation(key) 的返回值；之后 key 被 delete 过则不写入。
+        """
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if generation is not None and self._generations.get(key, self._evicted) != generation:
+                return
+
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+                self._stamp += 1
+                self._generations[key] = self._stamp
+                self._generations.move_to_end(key)
+            while len(self._generations) > self.maxsize:
+                _, self._evicted = self._generations.popitem(last=False)
+
+
+# KEYS: 缓存的 key, generation 的 key
+# ARGV: 内容, 查询之前读到的 generation, 过期秒数 ("" 表示不过期)
+_SET_IF_GENERATION = """
+if (redis.call("GET", KEYS[2]) or "0") ~= ARGV[2] then
+    return 0
+end
+if ARGV[3] == "" then
+    redis.call("SET", KEYS[1], ARGV[1])
+else
+    redis.call("SET", KEYS[1], ARGV[1], "EX", ARGV[3])
+end
+return 1
+"""
+
+
+class RedisCache:
+    # generation 的 key 保留的秒数: 比任何一个请求的耗时都长得多
+    generation_ttl = 3600
+
+    def __init__(self, connection, ttl=None, prefix="response-cache:"):
+        self.connection = connection
+        self.ttl = ttl
+        self.prefix = prefix
+        self._set_if_generation = connection.register_script(_SET_IF_GENERATION)
+
+    def _generation_key(self, key):
+        return f"{self.prefix}generation:{key}"
+
+    def get(self, key):
+        return self.connection.get(self.prefix + key)
+
+    def generation(self, key):
+        return self.connection.get(self._generation_key(key)) or b"0"
+
+    def set(self, key, value, generation=None):
+        if generation is None:
+            self.connection.set(self.prefix + key, value, ex=self.ttl)
+            return
+
+        # 比较和写入在同一个脚本里: 两者之间不会插入其他 worker 的 delete
+        self._set_if_generation(
+            keys=[self.prefix + key, self._generation_key(key)],
+            args=[value, generation, self.ttl or ""],
+        )
+
+    def delete(self, *keys):
+        if not keys:
+            return
+
+        pipe = self.connection.pipeline()
+        pipe.delete(*(self.prefix + key for key in keys))
+        for key in keys:
+            pipe.incr(self._generation_key(key))
+            pipe.expire(self._generation_key(key), self.generation_ttl)
+        pipe.execute()
+
+
+def create_response_cache(config, connection=None):
+    backend = config["RESPONSE_CACHE_BACKEND"]
+    ttl = config["RESPONSE_CACHE_TTL"]
+
+    if backend == "lru":
+        return LRUCache(maxsize=config["RESPONSE_CACHE_SIZE"], ttl=ttl)
+    if backend == "redis":
+        return RedisCache(connection, ttl=ttl)
+    if backend == "null":
+        return NullCache()
+    raise ValueError(f"Unknown RESPONSE_CACHE_BACKEND: {backend!r}")
+
+
+# 这些 query 参数会改变响应内容 (见 schemas.FieldsetSchema)
+FIELDSET_ARGS = {"fields", "include"}
+
+
+def entity_key(kind, entity_id):
+    return f"{kind}:{entity_id}"
+
+
+def invalidate_entities(stores=(), items=(), tags=()):
+    """
+    写操作 commit 之后调用，删除所有 响应内容 发生变化的实体的缓存。
+    """
+    keys = [entity_key("store", i) for i in set(stores)]
+    keys += [entity_key("item", i) for i in set(items)]
+    keys += [entity_key("tag", i) for i in set(tags)]
+    current_app.response_cache.delete(*keys)
+
+
+def _conditional(body):
+    response = Response(body, mimetype="application/json")
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+def cached_entity(kind, id_arg):
+    """
+    缓存单个实体的 GET 响应，并处理 ETag / If-None-Match。
+
+    放在 @blp.response 之上 (在它外层)，这样缓存的是序列化之后的 JSON。
+    未命中时才会执行数据库查询和 schema 序列化。
+
+    只缓存完整的表示: 带 ?fields= 或 ?include= 的请求不经过缓存，
+    直接执行只查询所需列的 SQL (见 serializers.py)。
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if FIELDSET_ARGS & request.args.keys():
+                return func(*args, **kwargs)
+
+            cache = current_app.response_cache
+            key = entity_key(kind, kwargs[id_arg])
+
+            body = cache.get(key)
+            if body is not None:
+                return _conditional(body)
+
+            # 在查询之前读取: 查询和写入缓存之间有写操作 invalidate 了这个实体，就不写入
+            generation = cache.generation(key)
+            # 写入缓存的内容从主库读: 落后的副本会把刚失效的旧内容重新放回缓存
+            read_from_primary()
+            response = func(*args, **kwargs)
+            if response.status_code != 200:
+                return response
+
+            body = response.get_data()
+            cache.set(key, body, generation)
+            return _conditional(body)
+
+        return wrapper
+
+    return decorator
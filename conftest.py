@@ -1,5 +1,19 @@
 import pytest
+from sqlalchemy import event
+
 from app import create_app
+from benchmarks.standins import OFFLINE_ENV
+from db import db
+
+@pytest.fixture()
+def offline_env(request, monkeypatch):
+    """
+    在 app fixture 创建 app 之前使用: 所有用到 Redis 的功能换成进程内的实现 (见 benchmarks/standins.py)。
+    可以用 indirect 参数化传入 FAST_SERIALIZER_ENABLED。
+    """
+    for key, value in OFFLINE_ENV.items():
+        monkeypatch.setenv(key, value)
+    monkeypatch.setenv("FAST_SERIALIZER_ENABLED", getattr(request, "param", "true"))
 
 @pytest.fixture()
 def app():
@@ -7,6 +21,8 @@ def app():
     app.config.update(
         {
             "TESTING": True,
+            # 超出 @query_budget 声明的 SQL 语句数时，请求抛出 QueryBudgetExceeded，测试失败
+            "QUERY_BUDGET_ENFORCE": True,
         }
     )
 
@@ -14,4 +30,42 @@ def app():
 
 @pytest.fixture()
 def client(app):
-    return app.test_client()
\ No newline at end of file
+    return app.test_client()
+
+class QueryCounter:
+    """
+    记录 with 代码块内执行的 SQL 语句，用来断言某个接口的查询次数
+    不随数据行数增长 (没有 N+1 查询)。
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def __enter__(self):
+        self.statements = []
+        event.listen(self.engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._record)
+
+@pytest.fixture()
+def count_queries(app):
+    """
+    用法:
+        with count_queries() as queries:
+            client.get("/store")
+        assert queries.count == 3
+    """
+    with app.app_context():
+        engine = db.engine
+
+    return lambda: QueryCounter(engine)
@@ -0,0 +1,52 @@
+"""
+connections.py
+
+The Redis connection and the RQ queues ("emails", and "default" for other
+background jobs), created on first use.
+
+create_app() only records REDIS_URL. Importing redis-py and rq, and building
+the client, happen the first time a request actually needs Redis. Booting a
+gunicorn worker, a test or a CLI command therefore never depends on Redis
+being configured or reachable.
+
+``lazy_redis(app)`` and ``lazy_queue(app)`` return proxies that can be handed to
+the cache, blocklist and rate limiter backends at startup.
+"""
+
+import threading
+
+from werkzeug.local import LocalProxy
+
+_lock = threading.Lock()
+
+
+def get_redis(app):
+    with _lock:
+        if "redis" not in app.extensions:
+            url = app.config["REDIS_URL"]
+            if not url:
+                raise RuntimeError("REDIS_URL is not set.")
+
+            import redis
+
+            app.extensions["redis"] = redis.from_url(url)
+        return app.extensions["redis"]
+
+
+def get_queue(app, name="emails"):
+    connection = get_redis(app)
+    key = "rq" if name == "emails" else f"rq:{name}"
+    with _lock:
+        if key not in app.extensions:
+            from rq import Queue
+
+            app.extensions[key] = Queue(name, connection=connection)
+        return app.extensions[key]
+
+
+def lazy_redis(app):
+    return LocalProxy(lambda: get_redis(app))
+
+
+def lazy_queue(app, name="emails"):
+    return LocalProxy(lambda: get_queue(app, name))
@@ -1,3 +1,6 @@
 from flask_sqlalchemy import SQLAlchemy
 
-db = SQLAlchemy()
+from replicas import RoutingSession
+
+# RoutingSession: GET 请求的读查询发往只读副本 (见 replicas.py)
+db = SQLAlchemy(session_options={"class_": RoutingSession})
@@ -1,5 +1,14 @@
 #!/bin/sh 
 
+# 表由 flask db upgrade 创建，create_app 不要再 db.create_all()
+export DB_CREATE_ALL=false
+
 flask db upgrade
 
+# prometheus 多进程模式: 每个 gunicorn worker 把指标写到这个目录, /metrics 汇总所有 worker
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
+# GUNICORN_WORKER_CLASS=gevent: 每个 worker 同时处理很多请求 (见 gunicorn.conf.py)
 exec gunicorn --bind 0.0.0.0:80 "app:create_app()"
\ No newline at end of file
@@ -0,0 +1,112 @@
+"""
+export.py
+
+Streams the whole store -> item -> tag graph as NDJSON, one store per line.
+
+Stores, items and tags are each read through their own server-side cursor
+(``yield_per``), ordered by store, and merged in lockstep. Only one chunk of
+rows per cursor is held in memory at a time, so memory stays flat no matter how
+many items the catalog (or a single store) has.
+"""
+
+import json
+from itertools import groupby, islice
+from operator import attrgetter
+
+from sqlalchemy import select
+
+from db import db
+from models import StoreModel, ItemModel, TagModel
+from schemas import PlainStoreSchema, PlainItemSchema, PlainTagSchema
+
+DEFAULT_CHUNK_SIZE = 1000
+FLUSH_SIZE = 64 * 1024
+
+
+def _stream(statement, chunk_size):
+    return db.session.execute(statement.execution_options(yield_per=chunk_size))
+
+
+def _batched(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def _json_array(rows, schema, chunk_size):
+    # 按 chunk 序列化数组元素，每个 chunk 生成一段 JSON 片段
+    yield "["
+    separator = ""
+    for batch in _batched(rows, chunk_size):
+        yield separator + json.dumps(schema.dump(batch, many=True))[1:-1]
+        separator = ", "
+    yield "]"
+
+
+class _StoreGroups:
+    """
+    按 store_id 排好序的行流，按 store 依次取出每个 store 的那一组行。
+    """
+
+    def __init__(self, rows):
+        self._groups = groupby(rows, key=attrgetter("store_id"))
+        self._current = next(self._groups, None)
+
+    def rows_for(self, store_id):
+        # 跳过 store_id 更小的行 (不属于任何被导出的 store)
+        while self._current is not None and self._current[0] < store_id:
+            self._current = next(self._groups, None)
+
+        if self._current is None or self._current[0] != store_id:
+            return ()
+
+        _, rows = self._current
+        self._current = None
+        return self._advance_after(rows)
+
+    def _advance_after(self, rows):
+        yield from rows
+        self._current = next(self._groups, None)
+
+
+def export_stores_ndjson(chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    生成 NDJSON 片段：每个 store 一行，格式与 StoreSchema 的序列化结果一致。
+    """
+    store_schema = PlainStoreSchema()
+    item_schema = PlainItemSchema()
+    tag_schema = PlainTagSchema()
+
+    stores = _stream(select(StoreModel.id, StoreModel.name).order_by(StoreModel.id), chunk_size)
+    items = _StoreGroups(
+        _stream(
+            select(ItemModel.store_id, ItemModel.id, ItemModel.name, ItemModel.price)
+            .order_by(ItemModel.store_id, ItemModel.id),
+            chunk_size,
+        )
+    )
+    tags = _StoreGroups(
+        _stream(
+            select(TagModel.store_id, TagModel.id, TagModel.name)
+            .order_by(TagModel.store_id, TagModel.id),
+            chunk_size,
+        )
+    )
+
+    for store in stores:
+        line = [json.dumps(store_schema.dump(store))[:-1], ', "items": ']
+        buffered = 0
+
+        for fragment in _json_array(items.rows_for(store.id), item_schema, chunk_size):
+            line.append(fragment)
+            buffered += len(fragment)
+            # 一个 store 的 items 很多时，攒够 FLUSH_SIZE 就先发送出去，不必等整行序列化完
+            if buffered >= FLUSH_SIZE:
+                yield "".join(line)
+                line.clear()
+                buffered = 0
+
+        line.append(', "tags": ')
+        line.extend(_json_array(tags.rows_for(store.id), tag_schema, chunk_size))
+        line.append("}\n")
+        yield "".join(line)
@@ -0,0 +1,43 @@
+"""
+green.py
+
+Cooperative database I/O for the gevent serving mode (see gunicorn.conf.py).
+
+Under GUNICORN_WORKER_CLASS=gevent, each gunicorn worker serves every request
+in its own greenlet, up to GUNICORN_WORKER_CONNECTIONS at once. gevent patches
+the standard library, so Redis and HTTP calls yield to the other greenlets
+while they wait on a socket. The blueprints, schemas and SQLAlchemy sessions
+are the same as in the sync mode.
+
+psycopg2 talks to PostgreSQL in C, which gevent cannot patch. ``patch_psycopg``
+installs a wait callback, so psycopg2 waits for the server through gevent and
+a query in one greenlet no longer blocks the worker. SQLite has no server to
+wait for and needs nothing.
+"""
+
+
+def _gevent_wait(conn, timeout=None):
+    from gevent.socket import wait_read, wait_write
+    from psycopg2 import OperationalError, extensions
+
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            return
+        if state == extensions.POLL_READ:
+            wait_read(conn.fileno(), timeout=timeout)
+        elif state == extensions.POLL_WRITE:
+            wait_write(conn.fileno(), timeout=timeout)
+        else:
+            raise OperationalError(f"Bad result from poll: {state!r}")
+
+
+def patch_psycopg():
+    """
+    让 psycopg2 通过 gevent 等待数据库；没有安装 psycopg2 (只用 SQLite) 时什么都不做。
+    """
+    try:
+        from psycopg2 import extensions
+    except ImportError:
+        return
+    extensions.set_wait_callback(_gevent_wait)
@@ -0,0 +1,38 @@
+"""
+gunicorn.conf.py
+
+gunicorn loads this file automatically from the working directory.
+
+GUNICORN_WORKER_CLASS picks how a worker serves requests:
+
+- "sync" (default): one request at a time per worker. Concurrency is the
+  number of workers.
+- "gevent": every request in its own greenlet. A worker holds up to
+  GUNICORN_WORKER_CONNECTIONS connections (1000 by default) and serves another
+  request while one waits on the database, Redis or the network (see green.py).
+  Raise DB_POOL_SIZE with it, so the requests of a worker do not queue for a
+  database connection.
+
+benchmarks/serving.py compares both modes under the same load.
+"""
+
+import os
+
+from prometheus_client import multiprocess
+
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "sync")
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 1000))
+
+
+def post_fork(server, worker):
+    # gevent 模式: psycopg2 的查询也要让出给其它 greenlet (命令行的 --worker-class 会覆盖上面的设置)
+    if server.cfg.worker_class_str == "gevent":
+        import green
+
+        green.patch_psycopg()
+
+
+def child_exit(server, worker):
+    # worker 退出后，清理它在 PROMETHEUS_MULTIPROC_DIR 中的 live gauge 数据
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,39 @@
+"""
+loaders.py
+
+Eager-loading options matching each response schema in schemas.py.
+
+Every endpoint that serializes a model with one of these schemas should query it
+with the matching options, so all nested relationships the schema dumps are
+loaded up front in a constant number of queries instead of one lazy load per row.
+
+- many-to-one (item.store, tag.store): joinedload, pulled in by the same SELECT
+- collections (store.items, item.tags, ...): selectinload, one extra
+  ``WHERE ... IN (...)`` query per relationship for the whole page of rows
+
+Each mapping is keyed by the schema field it loads, so a request that leaves a
+relationship out with ``?include=`` (see serializers.py) skips its loader.
+Use ``*LOAD.values()`` to load everything.
+"""
+
+from sqlalchemy.orm import joinedload, selectinload
+
+from models import ItemModel, StoreModel, TagModel
+
+# ItemSchema: store (PlainStoreSchema) + tags (PlainTagSchema)
+ITEM_SCHEMA_LOAD = {
+    "store": joinedload(ItemModel.store),
+    "tags": selectinload(ItemModel.tags),
+}
+
+# StoreSchema: items (PlainItemSchema) + tags (PlainTagSchema)
+STORE_SCHEMA_LOAD = {
+    "items": selectinload(StoreModel.items),
+    "tags": selectinload(StoreModel.tags),
+}
+
+# TagSchema: store (PlainStoreSchema) + items (PlainItemSchema)
+TAG_SCHEMA_LOAD = {
+    "store": joinedload(TagModel.store),
+    "items": selectinload(TagModel.items),
+}
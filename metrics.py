@@ -0,0 +1,169 @@
+"""
+metrics.py
+
+Prometheus metrics, exposed in text exposition format at ``GET /metrics``.
+
+- per-endpoint request counts, latency histograms and in-flight gauges
+  (endpoint is the Flask endpoint, e.g. "Stores.StoreList", so the blueprint
+  is its prefix)
+- SQLAlchemy pool size, checked-out connections and checkout wait time
+- depth of the RQ "emails" queue
+- password hashing latency and pool saturation (see passwords.py)
+- requests that ran more SQL statements than their declared budget
+  (see query_budget.py)
+
+Under gunicorn every worker is a separate process. When PROMETHEUS_MULTIPROC_DIR
+is set (docker-entrypoint.sh does this), each worker writes its samples there and
+/metrics aggregates all of them, whichever worker serves the scrape.
+gunicorn.conf.py cleans up after workers that exit.
+"""
+
+import os
+import time
+
+from flask import Response, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+
+from db import db
+
+REQUEST_COUNT = Counter(
+    "http_requests_total",
+    "HTTP requests handled.",
+    ["endpoint", "method", "status"],
+)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency.",
+    ["endpoint", "method"],
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests currently being handled.",
+    ["endpoint"],
+    multiprocess_mode="livesum",
+)
+
+DB_POOL_SIZE = Gauge(
+    "db_pool_size",
+    "Configured size of the SQLAlchemy connection pool.",
+    multiprocess_mode="livesum",
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out",
+    "Connections currently checked out of the SQLAlchemy pool.",
+    multiprocess_mode="livesum",
+)
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection from the SQLAlchemy pool.",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
+QUEUE_DEPTH = Gauge(
+    "rq_queue_depth",
+    "Jobs waiting in the RQ queue.",
+    ["queue"],
+    multiprocess_mode="livemax",
+)
+
+PASSWORD_HASH_LATENCY = Histogram(
+    "password_hash_duration_seconds",
+    "Time to hash or verify a password, including time queued for the pool.",
+    ["operation"],
+)
+PASSWORD_HASH_IN_FLIGHT = Gauge(
+    "password_hash_in_flight",
+    "Password hash / verify calls queued or running in the process pool.",
+    multiprocess_mode="livesum",
+)
+PASSWORD_HASH_REJECTED = Counter(
+    "password_hash_rejected_total",
+    "Password hash / verify calls rejected because the pool was saturated.",
+)
+
+QUERY_BUDGET_EXCEEDED = Counter(
+    "http_query_budget_exceeded_total",
+    "Requests that ran more SQL statements than their endpoint's query budget.",
+    ["endpoint", "method"],
+)
+
+
+def _start_request():
+    g.metrics_endpoint = request.endpoint or "unmatched"
+    g.metrics_started = time.perf_counter()
+    REQUESTS_IN_FLIGHT.labels(g.metrics_endpoint).inc()
+
+
+def _record_status(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+def _finish_request(exc):
+    # teardown 在异常时也会执行，此时没有 response，按 500 记录
+    if "metrics_started" not in g:
+        return
+
+    endpoint = g.metrics_endpoint
+    REQUESTS_IN_FLIGHT.labels(endpoint).dec()
+    REQUEST_LATENCY.labels(endpoint, request.method).observe(time.perf_counter() - g.metrics_started)
+    REQUEST_COUNT.labels(endpoint, request.method, g.get("metrics_status", 500)).inc()
+
+
+def _instrument_pool(engine):
+    pool = engine.pool
+    if hasattr(pool, "size"):
+        # set 而不是 inc: 同一个进程中多次 create_app() 不会累加
+        DB_POOL_SIZE.set(pool.size())
+
+    # Engine 通过 pool.connect() 取得连接，在这里计时就是等待连接池的时间
+    connect = pool.connect
+
+    def timed_connect():
+        started = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            DB_POOL_CHECKOUT_WAIT.observe(time.perf_counter() - started)
+
+    pool.connect = timed_connect
+
+    event.listen(pool, "checkout", lambda *args: DB_POOL_CHECKED_OUT.inc())
+    event.listen(pool, "checkin", lambda *args: DB_POOL_CHECKED_OUT.dec())
+
+
+def init_metrics(app):
+    app.before_request(_start_request)
+    app.after_request(_record_status)
+    app.teardown_request(_finish_request)
+
+    with app.app_context():
+        _instrument_pool(db.engine)
+
+    @app.route("/metrics")
+    def metrics():
+        from redis.exceptions import RedisError
+
+        try:
+            QUEUE_DEPTH.labels(app.queue.name).set(len(app.queue))
+        except (RedisError, RuntimeError):
+            # redis 不可用 (或没有配置 REDIS_URL) 时不影响其他指标的输出
+            pass
+
+        if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
@@ -90,9 +90,20 @@ def run_migrations_online():
                 directives[:] = []
                 logger.info('No changes in schema detected.')
 
+    # the full-text search index (search.py) is created by raw DDL and is not
+    # part of the models: keep autogenerate from dropping it
+    def include_object(object, name, type_, reflected, compare_to):
+        if type_ == 'table' and name.startswith('items_fts'):
+            return False
+        if name in ('search_vector', 'ix_items_search_vector'):
+            return False
+        return True
+
     conf_args = current_app.extensions['migrate'].configure_args
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
+    if conf_args.get("include_object") is None:
+        conf_args["include_object"] = include_object
 
     connectable = get_engine()
 
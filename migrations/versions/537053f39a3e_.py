@@ -1,7 +1,7 @@
 """empty message
 
 Revision ID: 537053f39a3e
-Revises: 
+Revises: 1a0c5e7d9b24
 Create Date: 2024-01-06 12:36:13.998028
 
 """
@@ -11,7 +11,7 @@ import sqlalchemy as sa
 
 # revision identifiers, used by Alembic.
 revision = '537053f39a3e'
-down_revision = None
+down_revision = '1a0c5e7d9b24'
 branch_labels = None
 depends_on = None
 
@@ -0,0 +1,88 @@
+"""full-text search index over item name and description
+
+Revision ID: e4b7a2c9d1f6
+Revises: 9c2e4f1a7b3d
+Create Date: 2026-10-16 14:03:27.118540
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b7a2c9d1f6'
+down_revision = '9c2e4f1a7b3d'
+branch_labels = None
+depends_on = None
+
+
+# 和 search.py 中 create_all 用的 DDL 相同
+SQLITE_UPGRADE = (
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(
+        name, description, content='items', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS items_fts_insert AFTER INSERT ON items BEGIN
+        INSERT INTO items_fts (rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS items_fts_delete AFTER DELETE ON items BEGIN
+        INSERT INTO items_fts (items_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS items_fts_update AFTER UPDATE OF id, name, description ON items BEGIN
+        INSERT INTO items_fts (items_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO items_fts (rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+    # 把已有的 item 写入索引
+    "INSERT INTO items_fts (items_fts) VALUES ('rebuild')",
+)
+
+SQLITE_DOWNGRADE = (
+    "DROP TRIGGER IF EXISTS items_fts_update",
+    "DROP TRIGGER IF EXISTS items_fts_delete",
+    "DROP TRIGGER IF EXISTS items_fts_insert",
+    "DROP TABLE IF EXISTS items_fts",
+)
+
+# 生成列在 ALTER TABLE 时就为已有的行计算好
+POSTGRES_UPGRADE = (
+    """
+    ALTER TABLE items ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(name, '')), 'A')
+        || setweight(to_tsvector('simple', coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_items_search_vector ON items USING gin (search_vector)",
+)
+
+POSTGRES_DOWNGRADE = (
+    "DROP INDEX IF EXISTS ix_items_search_vector",
+    "ALTER TABLE items DROP COLUMN IF EXISTS search_vector",
+)
+
+
+def _execute(statements):
+    for statement in statements:
+        op.execute(sa.text(statement))
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        _execute(SQLITE_UPGRADE)
+    elif dialect == 'postgresql':
+        _execute(POSTGRES_UPGRADE)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        _execute(SQLITE_DOWNGRADE)
+    elif dialect == 'postgresql':
+        _execute(POSTGRES_DOWNGRADE)
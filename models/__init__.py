@@ -1,5 +1,6 @@
 from models.item import ItemModel
 from models.store import StoreModel
+from models.store_stats import StoreStatsModel
 from models.tag import TagModel
 from models.item_tags import ItemTags
 from models.user import UserModel
\ No newline at end of file
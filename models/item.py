@@ -1,11 +1,16 @@
 from db import db
+from search import install_search_index
 
 class ItemModel(db.Model):
     __tablename__ = "items"
+    __table_args__ = (
+        # 按 store 过滤 item，以及 store_stats 中每个 store 的最低 / 最高价格 (只读索引的一端)
+        db.Index("ix_items_store_id_price", "store_id", "price"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(80), unique=False, nullable=False)
-    price = db.Column(db.Float(precision=2), unique=False, nullable=False)
+    name = db.Column(db.String(80), unique=False, nullable=False, index=True)
+    price = db.Column(db.Float(precision=2), unique=False, nullable=False, index=True)
     '''
     注意!!! 如果不用migrations, 就要手动更改数据库中的 item 表，加入description 列
     '''
@@ -14,4 +19,10 @@ class ItemModel(db.Model):
     store_id = db.Column(db.Integer, db.ForeignKey("stores.id"), unique=False, nullable=False)
     store = db.relationship("StoreModel", back_populates="items")
 
-    tags = db.relationship("TagModel", back_populates = "items", secondary = "items_tags")
+    tags = db.relationship("TagModel", back_populates = "items", secondary = "items_tags", order_by = "TagModel.id")
+
+    # GET /item/search 的相关度 (见 search.py)，只在搜索查询中才有值
+    search_rank = db.query_expression()
+
+# items 表的全文索引 (SQLite FTS5 / PostgreSQL tsvector) 随 create_all 一起创建
+install_search_index(ItemModel.__table__)
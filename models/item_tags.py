@@ -2,6 +2,12 @@ from db import db
 
 class ItemTags(db.Model):
     __tablename__ = "items_tags"
+    __table_args__ = (
+        # 同一个 tag 只能关联同一个 item 一次；也是按 item_id 查询 tags 的索引
+        db.UniqueConstraint("item_id", "tag_id", name="uq_items_tags_item_id_tag_id"),
+        # 按 tag 过滤 item (GET /item?tag_id=) 和查询 tag 的 items，只读这个索引就能得到 item_id
+        db.Index("ix_items_tags_tag_id", "tag_id", "item_id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     item_id = db.Column(db.Integer, db.ForeignKey("items.id"))
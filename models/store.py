@@ -6,10 +6,16 @@ class StoreModel(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), unique=True, nullable=False)
 
-    # lazy="dynamic": 设置加载关系的方式
-    # "dynamic" 使得这个关系成为一个在实际访问时才加载的查询，允许在其上执行进一步的查询操作，例如过滤和排序
+    # lazy="select": 设置加载关系的方式
+    # 默认在访问时才加载；但不同于 "dynamic"，它可以被 selectinload 等选项预加载 (见 loaders.py)，
+    # 这样序列化多个 store 时不会每个 store 各查询一次 items 和 tags
 
     # cascade="all, delete": 指定级联行为
     # 在这种情况下，当删除 StoreModel 实例时，所有与之关联的 ItemModel 实例也将被删除。
-    items = db.relationship("ItemModel", back_populates="store", lazy="dynamic", cascade="all, delete")
-    tags = db.relationship("TagModel", back_populates = "store", lazy="dynamic")
+
+    # order_by: 集合按 id 排序，序列化结果是确定的 (serializers.py 的快速路径也按同样的顺序输出)
+    items = db.relationship("ItemModel", back_populates="store", lazy="select", cascade="all, delete", order_by="ItemModel.id")
+    tags = db.relationship("TagModel", back_populates = "store", lazy="select", order_by="TagModel.id")
+
+    # store 的统计 (见 store_stats.py)，随 store 一起创建和删除
+    stats = db.relationship("StoreStatsModel", back_populates="store", uselist=False, cascade="all, delete-orphan")
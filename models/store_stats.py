@@ -0,0 +1,20 @@
+from db import db
+
+class StoreStatsModel(db.Model):
+    '''
+    每个 store 一行的统计 (见 store_stats.py)，在 item 和 tag 的写操作的同一个事务中增量更新
+    '''
+    __tablename__ = "store_stats"
+
+    store_id = db.Column(db.Integer, db.ForeignKey("stores.id"), primary_key=True)
+    item_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    tag_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    # 所有 item 的价格之和，用来算平均价格
+    price_sum = db.Column(db.Float, nullable=False, default=0, server_default="0")
+    # 没有 item 时为 NULL
+    min_price = db.Column(db.Float(precision=2))
+    max_price = db.Column(db.Float(precision=2))
+
+    avg_price = db.column_property(price_sum / db.func.nullif(item_count, 0))
+
+    store = db.relationship("StoreModel", back_populates="stats")
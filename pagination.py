@@ -0,0 +1,94 @@
+"""
+pagination.py
+
+Keyset (cursor) pagination helpers shared by the list endpoints.
+
+A page is fetched with ``WHERE key > last_key ORDER BY key LIMIT n`` so the cost
+only depends on the page size, never on how deep the client has paged. The cursor
+handed to the client is an opaque, url-safe token that encodes the key of the
+last row of the previous page.
+
+A key can span several columns, e.g. ``(price, id)`` to sort by a column that
+is not unique: the page then starts at ``WHERE (price, id) > (:price, :id)``.
+Pages can also run in descending order.
+"""
+
+import base64
+import binascii
+import json
+
+from flask_smorest import abort
+from sqlalchemy import tuple_
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# 下一页的 cursor 通过这个 响应头 返回给客户端
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(key):
+    payload = json.dumps(list(key), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor, key_columns):
+    """
+    解码 cursor，并把每个值转换成 key_columns 中对应列的类型。
+    cursor 是客户端给出的: 格式不对、值不是 int / float / str 或者不能转换成列的类型时返回 400，
+    不能让它在数据库中出错 (500)。
+    """
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError):
+        abort(400, message="Invalid pagination cursor.")
+
+    if not isinstance(key, list) or len(key) != len(key_columns):
+        abort(400, message="Invalid pagination cursor.")
+    try:
+        return [_coerce(value, column) for value, column in zip(key, key_columns)]
+    except (TypeError, ValueError, OverflowError):
+        abort(400, message="Invalid pagination cursor.")
+
+
+def _coerce(value, column):
+    # bool 是 int 的子类，但不是合法的 key
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise TypeError(value)
+    python_type = column.type.python_type
+    if python_type is object:
+        # 计算出来的 key 没有类型 (NullType)，例如搜索的相关度 (见 search.py): 只接受数字
+        if isinstance(value, str):
+            raise TypeError(value)
+        return value
+    if python_type is int and isinstance(value, float) and not value.is_integer():
+        raise ValueError(value)
+    return python_type(value)
+
+
+def paginate(query, key_column, limit=DEFAULT_PAGE_SIZE, after=None, descending=False):
+    """
+    按 key_column 升序 (descending 时降序) 取一页数据。
+    key_column 是一个列，或者多个列的 tuple，例如 (ItemModel.price, ItemModel.id)，最后一列必须唯一。
+
+    返回 (rows, headers)，headers 中带有下一页的 cursor（如果还有下一页）。
+    多取一行 (limit + 1) 用来判断是否还有下一页，避免额外的 COUNT 查询。
+    """
+    key_columns = key_column if isinstance(key_column, tuple) else (key_column,)
+    if after is not None:
+        last_key = decode_cursor(after, key_columns)
+        # 单列时用普通的比较；多列时用 row value 比较，数据库可以直接用 (列, 主键) 的索引定位
+        key = key_columns[0] if len(key_columns) == 1 else tuple_(*key_columns)
+        last = last_key[0] if len(key_columns) == 1 else tuple_(*last_key)
+        query = query.filter(key < last if descending else key > last)
+
+    order_by = [column.desc() if descending else column for column in key_columns]
+    rows = query.order_by(*order_by).limit(limit + 1).all()
+
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers[NEXT_CURSOR_HEADER] = encode_cursor([getattr(rows[-1], column.key) for column in key_columns])
+
+    return rows, headers
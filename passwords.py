@@ -0,0 +1,119 @@
+"""
+passwords.py
+
+pbkdf2 password hashing and verification run in a dedicated process pool.
+
+Each hash or verify burns tens of milliseconds of CPU. Done inline, it holds the
+GIL of the gunicorn worker and stalls every other request in it. Here the work
+is sent to a bounded pool of PASSWORD_HASH_WORKERS processes. At most
+PASSWORD_HASH_MAX_PENDING calls may be queued or running; beyond that the
+request is rejected with 503 instead of piling up. A call that does not finish
+within the timeout (10 s by default) is also answered with 503; it is cancelled
+if it has not started, and keeps its slot until the pool is done with it.
+
+PASSWORD_HASH_ROUNDS sets the pbkdf2 cost. When it changes, stored hashes are
+upgraded on the next successful login (see ``verify_and_update``).
+PASSWORD_HASH_WORKERS=0 hashes inline, which is useful for tests.
+
+Latency, in-flight calls and rejections are exported on /metrics.
+"""
+
+import functools
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+
+from flask_smorest import abort
+
+from metrics import PASSWORD_HASH_IN_FLIGHT, PASSWORD_HASH_LATENCY, PASSWORD_HASH_REJECTED
+
+
+@functools.lru_cache(maxsize=None)
+def _context(rounds):
+    # passlib 导入较慢，只在真正 hash 的进程中导入
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=["pbkdf2_sha256"], pbkdf2_sha256__rounds=rounds)
+
+
+# 以下两个函数在进程池的子进程中执行
+def _hash(rounds, password):
+    return _context(rounds).hash(password)
+
+
+def _verify_and_update(rounds, password, password_hash):
+    return _context(rounds).verify_and_update(password, password_hash)
+
+
+class PasswordHasher:
+    def __init__(self, workers=2, rounds=29000, max_pending=64, timeout=10):
+        self.workers = workers
+        self.rounds = rounds
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _get_pool(self):
+        # 第一次使用时才创建进程池: gunicorn fork 出 worker 之后，每个 worker 各自创建
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._pool
+
+    def _run(self, operation, func, *args):
+        if not self.workers:
+            with PASSWORD_HASH_LATENCY.labels(operation).time():
+                return func(self.rounds, *args)
+
+        if not self._slots.acquire(blocking=False):
+            PASSWORD_HASH_REJECTED.inc()
+            abort(503, message="Server is busy, please try again later.")
+
+        PASSWORD_HASH_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            future = self._get_pool().submit(func, self.rounds, *args)
+        except BaseException:
+            self._release()
+            raise
+
+        # 任务结束 (完成 / 失败 / 取消) 时才归还名额: 超时返回 503 之后任务可能还在排队或执行
+        future.add_done_callback(self._release)
+        try:
+            return future.result(self.timeout)
+        except FutureTimeoutError:
+            # 还在排队的任务不再执行；已经在执行的只能等它结束
+            future.cancel()
+            # 等待超过 timeout: 和进程池饱和时一样返回 503
+            PASSWORD_HASH_REJECTED.inc()
+            abort(503, message="Server is busy, please try again later.")
+        finally:
+            PASSWORD_HASH_LATENCY.labels(operation).observe(time.perf_counter() - started)
+
+    def _release(self, future=None):
+        PASSWORD_HASH_IN_FLIGHT.dec()
+        self._slots.release()
+
+    def hash(self, password):
+        return self._run("hash", _hash, password)
+
+    def verify_and_update(self, password, password_hash):
+        """
+        返回 (是否匹配, 新的 hash)。
+        新的 hash 只有在存储的 hash 使用了旧参数 (例如 rounds 变了) 时才不为 None。
+        """
+        return self._run("verify", _verify_and_update, password, password_hash)
+
+
+def create_password_hasher(config):
+    return PasswordHasher(
+        workers=config["PASSWORD_HASH_WORKERS"],
+        rounds=config["PASSWORD_HASH_ROUNDS"],
+        max_pending=config["PASSWORD_HASH_MAX_PENDING"],
+    )
@@ -0,0 +1,140 @@
+"""
+profiling.py
+
+Opt-in per-request profiler.
+
+When PROFILER_ENABLED is set, a request is profiled with cProfile if either
+- it carries the header ``X-Profile: <PROFILER_TOKEN>``, or
+- it is picked by random sampling at PROFILER_SAMPLE_RATE (0 to 1).
+
+The profile is written as a pstats file to PROFILER_DIR. Open it with
+``python -m pstats`` or snakeviz. The response gets a ``Server-Timing`` header
+that splits the request time into database, serialization (marshmallow dump,
+or the compiled serializers' row conversion and orjson encoding, see
+serializers.py) and the rest of the handler.
+
+Only one request per process is profiled at a time. cProfile allows one
+active profiler per thread, and under the gevent worker (see green.py) all
+greenlets share the thread. A request picked while another one is being
+profiled runs unprofiled. The profiler is stopped in ``teardown_request`` as
+well, so a request that ends with an unhandled exception does not leave it
+enabled.
+
+When PROFILER_ENABLED is off no hook is registered, so there is no overhead.
+"""
+
+import cProfile
+import os
+import pstats
+import random
+import threading
+import time
+import uuid
+
+from flask import g, request
+
+PROFILE_HEADER = "X-Profile"
+
+# 同一时间只分析一个请求 (见模块说明)
+_active = threading.Lock()
+
+# (文件路径结尾, 函数名): 用 cProfile 统计中这些函数的累计时间拆分请求耗时
+DB_FUNCTIONS = {
+    ("sqlalchemy/engine/default.py", "do_execute"),
+    ("sqlalchemy/engine/default.py", "do_executemany"),
+    ("sqlalchemy/engine/default.py", "do_execute_no_params"),
+}
+# CompiledSerializer.build 中还有 to-many 关系的查询，所以只算它把行转换成 dict 的 _dict
+SERIALIZATION_FUNCTIONS = {
+    ("marshmallow/schema.py", "dump"),
+    ("serializers.py", "_dict"),
+    ("serializers.py", "render_json"),
+    # C 扩展函数在 cProfile 中的文件名是 "~"
+    ("~", "<orjson.dumps>"),
+}
+
+
+def _matches(function, functions):
+    filename, _, funcname = function
+    filename = filename.replace(os.sep, "/")
+    return any(filename.endswith(path) and funcname == name for path, name in functions)
+
+
+def _cumulative_time(stats, functions):
+    """
+    functions 的累计时间之和；被 functions 中另一个函数调用的部分不重复计算 (例如 render_json 中的 orjson.dumps)。
+    """
+    total = 0.0
+    for function, (_, _, _, cumulative, callers) in stats.stats.items():
+        if _matches(function, functions):
+            nested = sum(
+                edge[3] for caller, edge in callers.items() if caller != function and _matches(caller, functions)
+            )
+            total += cumulative - nested
+    return total
+
+
+def _should_profile(app):
+    token = app.config["PROFILER_TOKEN"]
+    if token and request.headers.get(PROFILE_HEADER) == token:
+        return True
+    return random.random() < app.config["PROFILER_SAMPLE_RATE"]
+
+
+def _stop_profile():
+    """
+    停止当前请求的 profiler 并释放 _active，返回 (profiler, 耗时)；当前请求没有被分析时返回 (None, None)。
+    """
+    profiler = g.pop("profiler", None)
+    if profiler is None:
+        return None, None
+    profiler.disable()
+    _active.release()
+    return profiler, time.perf_counter() - g.profiler_started
+
+
+def init_profiler(app):
+    directory = app.config["PROFILER_DIR"]
+    os.makedirs(directory, exist_ok=True)
+
+    @app.before_request
+    def start_profile():
+        # 另一个请求正在被分析时不分析这个请求
+        if _should_profile(app) and _active.acquire(blocking=False):
+            g.profiler = cProfile.Profile()
+            g.profiler_started = time.perf_counter()
+            g.profiler.enable()
+
+    @app.after_request
+    def finish_profile(response):
+        profiler, total = _stop_profile()
+        if profiler is None:
+            return response
+
+        # 时间只精确到秒: 加上随机后缀，同一秒内同一个接口的多个请求不会互相覆盖
+        filename = (
+            f"{time.strftime('%Y%m%d-%H%M%S')}-{request.endpoint or 'unmatched'}-{os.getpid()}-{uuid.uuid4().hex[:8]}.prof"
+        )
+        profiler.dump_stats(os.path.join(directory, filename))
+
+        stats = pstats.Stats(profiler)
+        db_time = _cumulative_time(stats, DB_FUNCTIONS)
+        serialization = _cumulative_time(stats, SERIALIZATION_FUNCTIONS)
+        handler = max(total - db_time - serialization, 0.0)
+
+        # Server-Timing 的 dur 单位是毫秒
+        response.headers["Server-Timing"] = ", ".join(
+            f"{name};dur={seconds * 1000:.2f}"
+            for name, seconds in (
+                ("db", db_time),
+                ("serialization", serialization),
+                ("handler", handler),
+                ("total", total),
+            )
+        )
+        return response
+
+    @app.teardown_request
+    def stop_profile(exc):
+        # 未处理的异常不会执行 after_request: 在这里停止 profiler
+        _stop_profile()
@@ -0,0 +1,93 @@
+"""
+query_budget.py
+
+Declared per-endpoint SQL query budgets.
+
+``@query_budget(n)`` on a view method declares that one request to it sends at
+most n SQL statements to the database. Statements are counted per request on
+every engine (the primary and the read replicas). An executemany counts once,
+since it is a single round trip. Endpoints without a declaration are not
+checked. Bulk endpoints, whose statement count grows with the number of chunks
+in the body, are left undeclared on purpose, except ``POST /tag/link``: its
+budget holds for a body of up to BULK_CHUNK_SIZE links.
+
+- With QUERY_BUDGET_ENFORCE on (conftest.py turns it on for the tests), a
+  request over its budget raises QueryBudgetExceeded. The test that sent it
+  fails.
+- Otherwise the response is left alone and the overrun is counted in
+  ``http_query_budget_exceeded_total`` (see metrics.py).
+
+test_query_budgets.py sends every case of benchmarks/query_budgets.py through
+the test client, so a case over its budget fails the tests. The benchmark
+itself prints the statement count of each case and exits with status 1 when
+one is over budget.
+"""
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+from metrics import QUERY_BUDGET_EXCEEDED
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(limit):
+    """
+    声明一次请求最多执行 limit 条 SQL 语句。放在 view 方法最外层。
+    """
+
+    def decorator(func):
+        func.query_budget = limit
+        return func
+
+    return decorator
+
+
+def _count_statement(*args):
+    # 请求之外 (CLI 命令、RQ 任务) 的语句不计数
+    if has_request_context():
+        g.query_count = g.get("query_count", 0) + 1
+
+
+def endpoint_budget(view_function, method):
+    """
+    view function 中 method 对应的方法声明的 budget，没有声明时返回 None。
+    """
+    view_class = getattr(view_function, "view_class", None)
+    if view_class is None:
+        return getattr(view_function, "query_budget", None)
+
+    handler = getattr(view_class, method.lower(), None)
+    if handler is None and method == "HEAD":
+        handler = getattr(view_class, "get", None)
+    return getattr(handler, "query_budget", None)
+
+
+def _check_budget(response):
+    view_function = current_app.view_functions.get(request.endpoint)
+    budget = endpoint_budget(view_function, request.method) if view_function else None
+    count = g.get("query_count", 0)
+    if budget is None or count <= budget:
+        return response
+
+    QUERY_BUDGET_EXCEEDED.labels(request.endpoint, request.method).inc()
+    if current_app.config["QUERY_BUDGET_ENFORCE"]:
+        raise QueryBudgetExceeded(
+            f"{request.method} {request.path} ({request.endpoint}) ran {count} SQL statements, "
+            f"its budget is {budget}."
+        )
+    return response
+
+
+def init_query_budgets(app):
+    """
+    在 db.init_app(app) 和 init_replicas 之后调用。
+    """
+    from db import db
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, "before_cursor_execute", _count_statement)
+    app.after_request(_check_budget)
@@ -0,0 +1,162 @@
+"""
+ratelimit.py
+
+Token-bucket rate limiting for the expensive auth endpoints (/login, /register).
+
+Every request takes one token from a bucket per client IP and one per username.
+A bucket holds at most RATELIMIT_AUTH_BURST tokens and refills at
+RATELIMIT_AUTH_PER_MINUTE tokens per minute. When any bucket is empty the
+request is rejected with 429 and a Retry-After header. This happens before the
+body is validated, before the database is touched and before any pbkdf2 work.
+
+With the "redis" backend all buckets of one request are checked and updated by
+a single Lua script, atomically and in one round trip, so limits are shared by
+every gunicorn worker. The script reads the clock with Redis ``TIME``, so the
+workers' own clocks do not matter. If Redis is unreachable, or with the "memory" backend,
+buckets are kept in a bounded in-process LRU instead.
+"""
+
+import functools
+import math
+import threading
+import time
+
+from flask import current_app, request
+from flask_smorest import abort
+
+from cache import LRUCache
+
+# KEYS: 本次请求涉及的所有 bucket
+# ARGV: capacity, 每秒补充的 token 数
+# 当前时间取 Redis 的 TIME: 所有 worker 用同一个时钟，worker 之间的时钟偏差不影响 bucket
+# 只有所有 bucket 都有 token 时才扣减; 返回 {是否允许, 需要等待的秒数}
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local time = redis.call("TIME")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local ttl = math.ceil(capacity / rate) + 1
+
+local levels = {}
+local retry_after = 0
+for i, key in ipairs(KEYS) do
+    local bucket = redis.call("HMGET", key, "tokens", "ts")
+    local tokens = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    levels[i] = tokens
+    if tokens < 1 then
+        retry_after = math.max(retry_after, (1 - tokens) / rate)
+    end
+end
+
+local allowed = retry_after == 0
+for i, key in ipairs(KEYS) do
+    local tokens = levels[i]
+    if allowed then
+        tokens = tokens - 1
+    end
+    redis.call("HSET", key, "tokens", tostring(tokens), "ts", tostring(now))
+    redis.call("EXPIRE", key, ttl)
+end
+
+if allowed then
+    return {1, "0"}
+end
+return {0, tostring(retry_after)}
+"""
+
+
+class MemoryTokenBuckets:
+    def __init__(self, capacity, rate, maxsize=10000):
+        self.capacity = capacity
+        self.rate = rate
+        # 被 LRU 淘汰的 bucket 相当于一直空闲、已经补满
+        self._buckets = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    def hit(self, keys):
+        now = time.time()
+        with self._lock:
+            levels = []
+            for key in keys:
+                tokens, ts = self._buckets.get(key) or (self.capacity, now)
+                levels.append(min(self.capacity, tokens + max(0.0, now - ts) * self.rate))
+
+            retry_after = max([(1 - tokens) / self.rate for tokens in levels if tokens < 1], default=0)
+            for key, tokens in zip(keys, levels):
+                self._buckets.set(key, (tokens - 1 if not retry_after else tokens, now))
+            return retry_after
+
+
+class RedisTokenBuckets:
+    def __init__(self, connection, capacity, rate, prefix="ratelimit:"):
+        self.capacity = capacity
+        self.rate = rate
+        self.prefix = prefix
+        self.connection = connection
+        self._script = None
+        # redis 不可用时退回到进程内的 bucket
+        self._fallback = MemoryTokenBuckets(capacity, rate)
+
+    def hit(self, keys):
+        # redis-py 只有 redis 后端需要，启动时不导入
+        from redis.exceptions import RedisError
+
+        try:
+            # 第一次使用时才注册脚本: 启动时不需要 redis 连接
+            if self._script is None:
+                self._script = self.connection.register_script(TOKEN_BUCKET_SCRIPT)
+            allowed, retry_after = self._script(
+                keys=[self.prefix + key for key in keys],
+                args=[self.capacity, self.rate],
+            )
+        except RedisError:
+            return self._fallback.hit(keys)
+        return 0 if allowed else float(retry_after)
+
+
+def create_rate_limiter(config, connection=None):
+    if not config["RATELIMIT_ENABLED"]:
+        return None
+
+    capacity = config["RATELIMIT_AUTH_BURST"]
+    rate = config["RATELIMIT_AUTH_PER_MINUTE"] / 60.0
+    backend = config["RATELIMIT_BACKEND"]
+
+    if backend == "redis":
+        return RedisTokenBuckets(connection, capacity, rate)
+    if backend == "memory":
+        return MemoryTokenBuckets(capacity, rate)
+    raise ValueError(f"Unknown RATELIMIT_BACKEND: {backend!r}")
+
+
+def rate_limited(scope):
+    """
+    按客户端 IP 和请求体中的 username 限流。
+    放在 @blp.arguments 之上，这样在校验请求体之前就会拒绝。
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            limiter = current_app.rate_limiter
+            if limiter is not None:
+                keys = [f"{scope}:ip:{request.remote_addr}"]
+                body = request.get_json(silent=True)
+                if isinstance(body, dict) and isinstance(body.get("username"), str):
+                    keys.append(f"{scope}:user:{body['username']}")
+
+                retry_after = limiter.hit(keys)
+                if retry_after:
+                    abort(
+                        429,
+                        message="Too many requests, please try again later.",
+                        headers={"Retry-After": str(math.ceil(retry_after))},
+                    )
+
+            return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,252 @@
+"""
+replicas.py
+
+Read-replica routing for ``db.session``.
+
+DATABASE_REPLICA_URLS lists read replicas of the primary database, separated by
+commas. Each one becomes a Flask-SQLAlchemy bind named ``replica-<n>``. Without
+replicas nothing changes: every statement goes to the primary.
+
+``RoutingSession.get_bind`` sends a statement to a replica only when it is a
+read in a GET or HEAD request and none of the rules below apply. Everything
+else goes to the primary: writes, every statement of other methods, and work
+outside a request such as CLI commands and RQ jobs.
+
+- Read-after-write in a request: once the session flushed or ran an INSERT,
+  UPDATE, DELETE or text statement, the rest of the request reads from the
+  primary.
+- Read-after-write across requests: after a request that wrote, its client
+  (JWT identity and IP) reads from the primary for REPLICA_STALENESS_WINDOW
+  seconds. The writers are kept in Redis (shared by all workers) or in memory
+  (REPLICA_STALENESS_BACKEND). If Redis is unreachable, reads go to the primary.
+- Cache fills: a response cache miss (see cache.py) reads from the primary.
+  A lagging replica could otherwise put a body back in the cache right after a
+  write invalidated it, and it would stay there for the whole TTL.
+
+A request uses one replica for all its reads, chosen round-robin. Each replica
+is checked with ``SELECT 1`` at most every REPLICA_HEALTH_CHECK_INTERVAL
+seconds, and a failed connection marks it down until its next check. Requests
+skip replicas that are down. When every replica is down, reads go to the
+primary.
+
+benchmarks/replicas.py checks these rules with local SQLite replicas.
+"""
+
+import itertools
+import time
+
+from flask import current_app, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Select, TextClause, event, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.sql.dml import UpdateBase
+
+READ_METHODS = frozenset(("GET", "HEAD"))
+
+# db.session.info 中的键: 每个请求一个新的 session，请求结束时随 session 一起丢弃
+WROTE = "replicas.wrote"
+PRIMARY = "replicas.primary"
+REPLICA = "replicas.replica"
+
+
+class MemoryWriterStore:
+    """
+    进程内: 只有处理写请求的 worker 知道这个客户端刚写过 (单进程开发 / 测试用)。
+    """
+
+    def __init__(self, window, maxsize=10000):
+        # cache.py 导入了本模块，这里才导入 LRUCache
+        from cache import LRUCache
+
+        self._writers = LRUCache(maxsize=maxsize, ttl=window)
+
+    def add(self, keys):
+        for key in keys:
+            self._writers.set(key, True)
+
+    def recent(self, keys):
+        return any(self._writers.get(key) for key in keys)
+
+
+class RedisWriterStore:
+    def __init__(self, connection, window, prefix="replicas:writer:"):
+        self.connection = connection
+        self.window_ms = max(1, int(window * 1000))
+        self.prefix = prefix
+
+    def add(self, keys):
+        from redis.exceptions import RedisError
+
+        try:
+            pipeline = self.connection.pipeline(transaction=False)
+            for key in keys:
+                pipeline.set(self.prefix + key, 1, px=self.window_ms)
+            pipeline.execute()
+        except RedisError:
+            pass
+
+    def recent(self, keys):
+        from redis.exceptions import RedisError
+
+        try:
+            return bool(self.connection.exists(*(self.prefix + key for key in keys)))
+        except RedisError:
+            # 不知道这个客户端是否刚写过: 读主库
+            return True
+
+
+class Replica:
+    def __init__(self, bind_key):
+        self.bind_key = bind_key
+        self.healthy = True
+        self.checked_at = float("-inf")
+
+    def mark_down(self):
+        self.healthy = False
+        self.checked_at = time.monotonic()
+
+
+class ReplicaRouter:
+    def __init__(self, bind_keys, writers, check_interval=5):
+        self.replicas = [Replica(bind_key) for bind_key in bind_keys]
+        self.writers = writers
+        self.check_interval = check_interval
+        self._next = itertools.count()
+
+    def watch(self, engines):
+        """
+        副本连接失败时立即标记为不可用，不等下一次检查。
+        """
+        for replica in self.replicas:
+            def handle_error(context, replica=replica):
+                # connection 为 None: 建立连接时就失败了
+                if context.is_disconnect or context.connection is None:
+                    replica.mark_down()
+
+            event.listen(engines[replica.bind_key], "handle_error", handle_error)
+
+    def choose(self, engines):
+        """
+        轮流选择一个可用的副本，所有副本都不可用时返回 None。
+        """
+        healthy = [replica for replica in self.replicas if self._is_healthy(replica, engines[replica.bind_key])]
+        if not healthy:
+            return None
+        return healthy[next(self._next) % len(healthy)].bind_key
+
+    def _is_healthy(self, replica, engine):
+        now = time.monotonic()
+        if now - replica.checked_at >= self.check_interval:
+            replica.checked_at = now
+            try:
+                with engine.connect() as connection:
+                    connection.execute(text("SELECT 1"))
+                replica.healthy = True
+            except SQLAlchemyError:
+                replica.healthy = False
+        return replica.healthy
+
+    def after_request(self, response):
+        # 本次请求写过数据库: 记住这个客户端，它接下来的读请求走主库
+        from db import db
+
+        if db.session.registry.has() and db.session.info.get(WROTE) and response.status_code < 400:
+            self.writers.add(_client_keys())
+        return response
+
+
+def _client_keys():
+    keys = [f"ip:{request.remote_addr}"]
+    try:
+        from flask_jwt_extended import get_jwt_identity
+
+        identity = get_jwt_identity()
+    except RuntimeError:
+        # 没有经过 jwt_required 的接口
+        identity = None
+    if identity is not None:
+        keys.append(f"user:{identity}")
+    return keys
+
+
+def _is_write(clause):
+    if isinstance(clause, (UpdateBase, TextClause)):
+        return True
+    # SELECT ... FOR UPDATE 要锁主库中的行
+    return isinstance(clause, Select) and clause._for_update_arg is not None
+
+
+class RoutingSession(Session):
+    """
+    db.session 的类: 按上面的规则在主库和副本之间选择 engine。
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or not has_request_context():
+            return engine
+
+        router = current_app.extensions.get("replicas")
+        engines = self._db.engines
+        if router is None or engine is not engines[None]:
+            return engine
+
+        if self._flushing or _is_write(clause):
+            self.info[WROTE] = True
+            return engine
+        if self.info.get(WROTE) or self.info.get(PRIMARY):
+            return engine
+
+        if REPLICA not in self.info:
+            self.info[REPLICA] = self._choose_replica(router, engines)
+        bind_key = self.info[REPLICA]
+        return engine if bind_key is None else engines[bind_key]
+
+    def _choose_replica(self, router, engines):
+        if request.method not in READ_METHODS or router.writers.recent(_client_keys()):
+            return None
+        return router.choose(engines)
+
+
+def read_from_primary():
+    """
+    本次请求接下来的查询都读主库。
+    """
+    from db import db
+
+    db.session.info[PRIMARY] = True
+
+
+def replica_binds(urls):
+    """
+    DATABASE_REPLICA_URLS -> SQLALCHEMY_BINDS
+    """
+    urls = [url.strip() for url in urls.split(",") if url.strip()]
+    return {f"replica-{i}": url for i, url in enumerate(urls)}
+
+
+def init_replicas(app, connection=None):
+    """
+    在 db.init_app(app) 之后调用；没有配置副本时什么都不做。
+    """
+    bind_keys = [key for key in app.config.get("SQLALCHEMY_BINDS", {}) if key.startswith("replica-")]
+    if not bind_keys:
+        return None
+
+    window = app.config["REPLICA_STALENESS_WINDOW"]
+    backend = app.config["REPLICA_STALENESS_BACKEND"]
+    if backend == "redis":
+        writers = RedisWriterStore(connection, window)
+    elif backend == "memory":
+        writers = MemoryWriterStore(window)
+    else:
+        raise ValueError(f"Unknown REPLICA_STALENESS_BACKEND: {backend!r}")
+
+    from db import db
+
+    router = ReplicaRouter(bind_keys, writers, app.config["REPLICA_HEALTH_CHECK_INTERVAL"])
+    with app.app_context():
+        router.watch(db.engines)
+    app.extensions["replicas"] = router
+    app.after_request(router.after_request)
+    return router
@@ -1,11 +1,23 @@
 from flask.views import MethodView
-from flask_smorest import Blueprint, abort
+from flask_smorest import abort
 from flask_jwt_extended import jwt_required, get_jwt
+from flask import current_app
+from sqlalchemy import func, insert, select, text
 from sqlalchemy.exc import SQLAlchemyError
 
+from bulk import read_rows, load_rows, chunked, upsert
+from cache import cached_entity, invalidate_entities
 from db import db
-from models import ItemModel
-from schemas import ItemSchema, ItemUpdateSchema
+from loaders import ITEM_SCHEMA_LOAD
+from query_budget import query_budget
+from models import ItemModel, ItemTags, StoreModel
+from schemas import (
+    ItemSchema, ItemUpsertSchema, FieldsetSchema, ItemListArgsSchema, ItemSearchArgsSchema,
+    BulkResultSchema, BulkUpsertResultSchema,
+)
+from search import TRUNCATED_HEADER, search_items, search_truncated
+from serializers import Blueprint, Page, Single
+from store_stats import record_item_changes
 
 ''' 
     "Items": 这是蓝图的名字，用于标识蓝图。这个名字在整个应用中需要是唯一的。
@@ -24,99 +36,202 @@ from schemas import ItemSchema, ItemUpdateSchema
 
 blp = Blueprint("Items", __name__, description="Operations on items")
 
+# GET /item 的 sort 参数 -> keyset 分页的 key。price 和 name 不唯一，用 id 区分相同的值
+ITEM_SORT_KEYS = {
+    "id": (ItemModel.id,),
+    "price": (ItemModel.price, ItemModel.id),
+    "name": (ItemModel.name, ItemModel.id),
+}
+
+def _name_prefix(query, prefix):
+    '''
+    name 以 prefix 开头: 写成范围 prefix <= name < (prefix 最后一个字符 + 1)，
+    这样可以用 name 上的 B-tree 索引 (LIKE 'abc%' 在 SQLite 中默认不区分大小写，用不上索引)
+    '''
+    query = query.filter(ItemModel.name >= prefix)
+    # 去掉末尾已经是最大码位的字符，它们没有 "下一个字符"
+    stem = prefix.rstrip(chr(0x10FFFF))
+    if stem:
+        query = query.filter(ItemModel.name < stem[:-1] + chr(ord(stem[-1]) + 1))
+    return query
+
+def _filtered_items(args):
+    '''
+    按 ItemListArgsSchema 的过滤参数生成 ItemModel.query。
+    每个条件都能用上索引 (见 migrations 中的 items / items_tags 索引，以及 benchmarks/query_plans.py):
+    store_id -> ix_items_store_id_price，价格 -> ix_items_price，name 前缀 -> ix_items_name，
+    tag_id -> ix_items_tags_tag_id (tag_id, item_id)，只读索引就能找到 item id。
+    '''
+    query = ItemModel.query
+    if "store_id" in args:
+        query = query.filter(ItemModel.store_id == args["store_id"])
+    if "min_price" in args:
+        query = query.filter(ItemModel.price >= args["min_price"])
+    if "max_price" in args:
+        query = query.filter(ItemModel.price <= args["max_price"])
+    if "name" in args:
+        query = _name_prefix(query, args["name"])
+
+    if "tag_id" in args:
+        tag_ids = set(args["tag_id"])
+        tagged = select(ItemTags.item_id).where(ItemTags.tag_id.in_(tag_ids))
+        if args["tag_match"] == "all" and len(tag_ids) > 1:
+            # (item_id, tag_id) 是唯一的，带有全部 tag 的 item 恰好出现 len(tag_ids) 次
+            tagged = tagged.group_by(ItemTags.item_id).having(func.count() == len(tag_ids))
+        query = query.filter(ItemModel.id.in_(tagged))
+    return query
+
+def _with_existing_stores(valid, errors):
+    '''
+    一条 IN 查询检查所有用到的 store 是否存在，store 不存在的行记录在 errors 中。
+    返回 (剩下的行, 它们的 store ids)。
+    '''
+    store_ids = {item_data["store_id"] for _, item_data in valid}
+    existing = set(db.session.scalars(select(StoreModel.id).where(StoreModel.id.in_(store_ids))))
+    for index, item_data in valid:
+        if item_data["store_id"] not in existing:
+            errors[index] = {"store_id": ["Store not found."]}
+    return [(index, item_data) for index, item_data in valid if index not in errors], store_ids & existing
+
+def _upsert_items(chunk):
+    '''
+    写入一块 PUT /item 的行，返回 {item_id: (原来的 store_id, 原来的价格)}，只包含被更新的 item。
+    '''
+    # 插入还是更新、原来的 store 和价格都由 upsert 本身给出 (见 bulk.upsert)，
+    # 同一个新 id 的并发写入不会被两个请求都算作插入
+    old = {}
+    # 多行语句中每一行的列必须相同: 没有给出 description 的行保持原来的 description
+    groups = {}
+    for _, item_data in chunk:
+        groups.setdefault(frozenset(item_data), []).append(item_data)
+    for rows in groups.values():
+        old.update(upsert(ItemModel.__table__, "id", rows, ["store_id", "price"]))
+    return old
+
+def _add_item_change(changes, item_data, old):
+    '''
+    把写入的一行加到 store_stats 的变化 changes ({store_id: (个数变化, 价格总和变化)}) 中。
+    old: _upsert_items 的返回值；被更新的 item 可能换了 store: 从原来的 store 中减去，加到新的 store 中
+    '''
+    item_id, store_id, price = item_data["id"], item_data["store_id"], item_data["price"]
+    if item_id in old:
+        old_store_id, old_price = old[item_id]
+        count, price_sum = changes.get(old_store_id, (0, 0))
+        changes[old_store_id] = (count - 1, price_sum - old_price)
+    count, price_sum = changes.get(store_id, (0, 0))
+    changes[store_id] = (count + 1, price_sum + price)
+
 @blp.route("/item/<int:item_id>")   
 class Item(MethodView):
+    @query_budget(2)
     @jwt_required()
+    @cached_entity("item", "item_id")
+    @blp.arguments(FieldsetSchema, location="query")
     @blp.response(200, ItemSchema)   
     # item_id来自路由
-    def get(self, item_id):   
-        item = ItemModel.query.get_or_404(item_id)
+    def get(self, fieldset, item_id):   
+        # 返回 Single: 按 ?fields= / ?include= 只查询需要的列和关系 (见 serializers.py)
+        # 退回 marshmallow 时用 ITEM_SCHEMA_LOAD 预加载 store 和 tags，避免序列化时逐个懒加载
 
         # 由于方法被 @blp.response(200, ItemSchema) 装饰器装饰，
         # Flask-Smorest 将会自动使用 ItemSchema 对 item 实例进行序列化，
         # 并将序列化后的 JSON 数据作为 HTTP 响应的主体返回给客户端。
-        return item
+        return Single(ItemModel.query.filter(ItemModel.id == item_id), options=ITEM_SCHEMA_LOAD, **fieldset)
     
     # item_id来自路由
+    @query_budget(6)
     @jwt_required()
     def delete(self, item_id):
         jwt = get_jwt()
         if not jwt.get("is_admin"):
             abort(401, message = "Admin privilege required.")
         item = ItemModel.query.get_or_404(item_id)
+
+        # 删除之前记下 嵌套了该 item 的 store 和 tags，commit 之后使它们的缓存失效
+        store_id = item.store_id
+        tag_ids = [tag.id for tag in item.tags]
+
         db.session.delete(item)
+        # store_stats 在同一个事务中更新
+        record_item_changes({store_id: (-1, -item.price)})
         db.session.commit()
+
+        invalidate_entities(stores=[store_id], items=[item_id], tags=tag_ids)
         return {"message": "Item deleted."}
     
     '''
-    @blp.arguments(ItemUpdateSchema):
+    @blp.arguments(ItemSchema):
 
     - 这个装饰器用于解析和验证客户端请求体中的数据。
-    - ItemUpdateSchema 是一个 Marshmallow Schema，定义了期望接收的数据结构和验证规则。
-    - 当客户端发起 PUT 请求并发送数据到服务器时，Flask-Smorest 会使用 ItemUpdateSchema 来解析和验证这些数据。
+    - ItemSchema 是一个 Marshmallow Schema，定义了期望接收的数据结构和验证规则。
+    - 当客户端发起 PUT 请求并发送数据到服务器时，Flask-Smorest 会使用 ItemSchema 来解析和验证这些数据。
     - 如果数据有效，它会被转换成 Python 字典，并作为 item_data 参数传递给 put 方法。
     
     '''
 
-    @blp.arguments(ItemUpdateSchema)
+    @query_budget(9)
+    @blp.arguments(ItemSchema)
     @blp.response(200, ItemSchema)
     def put(self, item_data, item_id):
-        # 获取数据库 表 中，对应该 item_id的 item实例对象
-        item = ItemModel.query.get(item_id)
+        # item_data 是 PUT /item 的一行 (id 来自路由): 整行替换已存在的 item，不存在时用 item_id 插入
+        # description 是可选的: 没有给出时保持原值
+        if not _with_existing_stores([(0, item_data)], {})[0]:
+            abort(404, message="Store not found.")
 
-        # 如果找到了：
-
-        # item_data 是一个 由 ItemUpdateSchema 转换成 的 字典 
-        # 对应 ItemUpdateSchema 中的 name属性 与 price属性
-        if item:
-            item.price = item_data["price"]
-            item.name = item_data["name"]
+        changes = {}
+        tag_ids = []
+        try:
+            # 和 PUT /item 一样用一条 INSERT ... ON CONFLICT (id) DO UPDATE 写入 (见 bulk.upsert)，不先查询 item 再修改:
+            # 插入还是更新、原来的 store 和价格都由 upsert 给出，同一个新 id 的并发写入不会都被算作插入
+            row = {"id": item_id, **item_data}
+            old = _upsert_items([(0, row)])
+            _add_item_change(changes, row, old)
+            # 嵌套了被更新的 item 的 tags
+            if old:
+                tag_ids = db.session.scalars(select(ItemTags.tag_id).where(ItemTags.item_id == item_id)).all()
 
-        # 如果没有找到:
-            
-        # 根据 item_data 和 item_id 创建一个新的 ItemModel 实例
-        # 因为 item_data 是 字典，所以 这边用 **item_data
-        else:
-            item = ItemModel(id=item_id, **item_data)
+            record_item_changes(changes)
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            abort(500, message="An error occurred while writing the item.")
 
-        db.session.add(item)
-        db.session.commit()
+        # item 自身，以及嵌套了它的 store (包括原来的 store) 和 tags 的缓存都失效
+        invalidate_entities(stores=changes, items=[item_id], tags=tag_ids)
 
-        ''' 
-        {
-            "id": 1,
-            "name": "Example Item",
-            "price": 19.99,
-            "store": {
-                // 这里是 store 对象的详细信息，根据 PlainStoreSchema 结构
-            },
-            "tags": [
-                // 这里是与该 item 相关联的 tags 列表
-            ]
-        }
-        
-        '''
-        # 由于方法被 @blp.response(200, ItemSchema) 装饰器装饰，
-        # Flask-Smorest 将会自动使用 ItemSchema 对 item 实例进行序列化，
-        # 并将序列化后的 JSON 数据作为 HTTP 响应的主体返回给客户端。
-        return item
+        # 返回 Single: 和 GET /item/<id> 一样查询并序列化写入之后的 item (见 serializers.py)
+        return Single(ItemModel.query.filter(ItemModel.id == item_id), options=ITEM_SCHEMA_LOAD)
 
 @blp.route("/item")
 class ItemList(MethodView):
+    @query_budget(2)
     @jwt_required()
+    @blp.arguments(ItemListArgsSchema, location="query")
     @blp.response(200, ItemSchema(many=True))
-    def get(self):
+    def get(self, list_args):
 
-        # 查询并返回 ItemModel 表中的所有数据记录
-        # 这些记录将是包含一系列 ItemModel 的实例的 列表
-
-        items = ItemModel.query
+        # 按 store / 价格 / tag / name 前缀过滤 (见 _filtered_items)
+        # 按 sort 参数 (默认 id) 做 keyset 分页，只查询并返回一页 ItemModel 数据记录
+        # 下一页的 cursor 放在响应头 X-Next-Cursor 中
+        # 返回 Page: 由编译好的 serializer 只查询 ItemSchema 需要的列 (见 serializers.py)
+        # 退回 marshmallow 时，ITEM_SCHEMA_LOAD 让整页 item 的 store 和 tags 用固定数量的查询一次性加载
 
         # 由于方法被 @blp.response(200, ItemSchema(many=True)) 装饰器装饰，
         # Flask-Smorest 将会自动使用 ItemSchema 对 列表中 的 每一个 item 实例进行序列化，
         # 并将序列化后的 一个列表 的 JSON 数据作为 HTTP 响应的主体返回给客户端。
-        return items.all()
+        sort = list_args["sort"]
+        return Page(
+            _filtered_items(list_args),
+            ITEM_SORT_KEYS[sort.lstrip("-")],
+            descending=sort.startswith("-"),
+            options=ITEM_SCHEMA_LOAD,
+            limit=list_args["limit"],
+            after=list_args.get("after"),
+            fieldset=list_args.get("fieldset"),
+            include=list_args.get("include"),
+        )
 
+    @query_budget(6)
     @jwt_required(fresh = True)
     @blp.arguments(ItemSchema)
     @blp.response(201, ItemSchema)
@@ -127,11 +242,145 @@ class ItemList(MethodView):
 
         try:
             db.session.add(item)
+            # store 的 item_count、价格统计在同一个事务中更新
+            record_item_changes({item.store_id: (1, item.price)})
             db.session.commit()
         except SQLAlchemyError:
             abort(500, message="An error occurred while inserting the item.")
 
+        # 新 item 会出现在所属 store 的 items 中
+        invalidate_entities(stores=[item.store_id])
+
         # 由于方法被 @blp.response(201, ItemSchema) 装饰器装饰，
         # Flask-Smorest 将会自动使用 ItemSchema 对 item 实例进行序列化，
         # 并将序列化后的 JSON 数据作为 HTTP 响应的主体返回给客户端。
         return item
+
+    @jwt_required(fresh = True)
+    @blp.response(
+        200,
+        BulkUpsertResultSchema,
+        description="Inserts or replaces many items from a JSON array or NDJSON body of ItemUpsertSchema payloads.",
+    )
+    def put(self):
+        rows = read_rows()
+
+        # 逐行用 ItemUpsertSchema 校验，失败的行记录在 errors 中
+        valid, errors = load_rows(ItemUpsertSchema(), rows)
+
+        # 同一个 id 出现多次时，只写入最后一行
+        last = {item_data["id"]: index for index, item_data in valid}
+        for index, item_data in valid:
+            if last[item_data["id"]] != index:
+                errors[index] = {"id": [f"Replaced by row {last[item_data['id']]} with the same id."]}
+        valid = [(index, item_data) for index, item_data in valid if index not in errors]
+        valid, _ = _with_existing_stores(valid, errors)
+
+        inserted = updated = 0
+        changes = {}
+        item_ids, tag_ids = [], set()
+        try:
+            # 分块执行 INSERT ... ON CONFLICT (id) DO UPDATE (见 bulk.upsert)，所有块在同一个事务中提交
+            for chunk in chunked(valid, current_app.config["BULK_CHUNK_SIZE"]):
+                old = _upsert_items(chunk)
+
+                for _, item_data in chunk:
+                    item_ids.append(item_data["id"])
+                    _add_item_change(changes, item_data, old)
+
+                inserted += len(chunk) - len(old)
+                updated += len(old)
+                # 嵌套了被更新的 item 的 tags
+                if old:
+                    tag_ids.update(
+                        db.session.scalars(select(ItemTags.tag_id).where(ItemTags.item_id.in_(list(old))).distinct())
+                    )
+
+            if inserted and db.session.get_bind().dialect.name == "postgresql":
+                # 客户端给出的 id 不经过序列: 把序列推到最大的 id 之后，POST /item 才不会用到这些 id
+                db.session.execute(
+                    text(
+                        "SELECT setval(pg_get_serial_sequence('items', 'id'), "
+                        "GREATEST(:max_id, pg_sequence_last_value(pg_get_serial_sequence('items', 'id')::regclass)))"
+                    ),
+                    {"max_id": max(item_ids)},
+                )
+
+            record_item_changes(changes)
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            abort(500, message="An error occurred while writing the items.")
+
+        # item 自身，以及嵌套了它们的 store (包括原来的 store，都在 changes 中) 和 tags 的缓存都失效
+        invalidate_entities(stores=changes, items=item_ids, tags=tag_ids)
+
+        result = {"inserted": inserted, "updated": updated, "errors": errors}
+        if valid:
+            return result
+        return result, 422
+
+@blp.route("/item/search")
+class ItemSearch(MethodView):
+    @query_budget(3)
+    @jwt_required()
+    @blp.arguments(ItemSearchArgsSchema, location="query")
+    @blp.response(200, ItemSchema(many=True))
+    def get(self, search_args):
+
+        # 在 name 和 description 中全文搜索 q (SQLite FTS5 / PostgreSQL tsvector，见 search.py)
+        # 按相关度排序，用 (相关度, id) 做 keyset 分页，下一页的 cursor 放在响应头 X-Next-Cursor 中
+        q, dialect, max_ranked = search_args.pop("q"), db.engine.dialect.name, current_app.config["SEARCH_MAX_RANKED"]
+        query, key_columns = search_items(q, dialect, max_ranked)
+
+        # 只排序了前 SEARCH_MAX_RANKED 个匹配: 更相关的匹配可能没有返回，用响应头告诉客户端
+        headers = {TRUNCATED_HEADER: "true"} if search_truncated(q, dialect, max_ranked) else {}
+        return Page(query, key_columns, options=ITEM_SCHEMA_LOAD, **search_args), 200, headers
+
+@blp.route("/item/bulk")
+class ItemBulk(MethodView):
+    @jwt_required(fresh = True)
+    @blp.response(
+        201,
+        BulkResultSchema,
+        description="Creates many items from a JSON array or NDJSON body of ItemSchema payloads.",
+    )
+    def post(self):
+        rows = read_rows()
+
+        # 逐行用 ItemSchema 校验，失败的行记录在 errors 中
+        valid, errors = load_rows(ItemSchema(), rows)
+
+        valid, store_ids = _with_existing_stores(valid, errors)
+
+        ids = [None] * len(rows)
+        try:
+            # 分块执行多行 INSERT ... VALUES (...), (...) RETURNING id，所有块在同一个事务中提交
+            # sort_by_parameter_order: 返回的 id 按参数 (行) 的顺序排列，才能和行一一对应
+            for chunk in chunked(valid, current_app.config["BULK_CHUNK_SIZE"]):
+                new_ids = db.session.scalars(
+                    insert(ItemModel).returning(ItemModel.id, sort_by_parameter_order=True),
+                    [item_data for _, item_data in chunk],
+                ).all()
+                for (index, _), item_id in zip(chunk, new_ids):
+                    ids[index] = item_id
+
+            # 每个 store 的 item 个数和价格之和，一条 executemany UPDATE 更新 store_stats
+            changes = {}
+            for _, item_data in valid:
+                count, price_sum = changes.get(item_data["store_id"], (0, 0))
+                changes[item_data["store_id"]] = (count + 1, price_sum + item_data["price"])
+            record_item_changes(changes)
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            abort(500, message="An error occurred while inserting the items.")
+
+        # 新 item 会出现在所属 store 的 items 中
+        invalidate_entities(stores=store_ids)
+
+        result = {"ids": ids, "errors": errors}
+        if valid:
+            return result
+        return result, 422
+
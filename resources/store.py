@@ -1,10 +1,19 @@
+from flask import Response, current_app, stream_with_context, url_for
 from flask.views import MethodView
-from flask_smorest import Blueprint, abort
+from flask_smorest import abort
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 
+from sqlalchemy import select
+
+from cache import cached_entity, invalidate_entities
 from db import db
-from models import StoreModel
-from schemas import StoreSchema
+from export import export_stores_ndjson
+from loaders import STORE_SCHEMA_LOAD
+from models import StoreModel, StoreStatsModel, ItemModel
+from query_budget import query_budget
+from schemas import StoreSchema, StoreStatsSchema, StoreStatsArgsSchema, StoreDeleteJobSchema, FieldsetSchema, ListArgsSchema
+from serializers import Blueprint, Page, Single
+from store_delete import delete_store, fetch_store_delete, queue_store_delete, running_store_delete
 
 ''' 
     "Stores": 这是蓝图的名字，用于标识蓝图。这个名字在整个应用中需要是唯一的。
@@ -25,42 +34,86 @@ blp = Blueprint("Stores", __name__, description="Operations on stores")
 
 @blp.route("/store/<int:store_id>")
 class Store(MethodView):
+    @query_budget(3)
+    @cached_entity("store", "store_id")
+    @blp.arguments(FieldsetSchema, location="query")
     @blp.response(200, StoreSchema)
     # store_id来自路由
-    def get(self, store_id):
-        store = StoreModel.query.get_or_404(store_id)
+    def get(self, fieldset, store_id):
+        # 返回 Single: 按 ?fields= / ?include= 只查询需要的列和关系 (见 serializers.py)
+        # 退回 marshmallow 时用 STORE_SCHEMA_LOAD 预加载 items 和 tags
 
         # 由于方法被 @blp.response(200, StoreSchema) 装饰器装饰，
         # Flask-Smorest 将会自动使用 StoreSchema 对 store 实例进行序列化，
         # 并将序列化后的 JSON 数据作为 HTTP 响应的主体返回给客户端。
-        return store
+        return Single(StoreModel.query.filter(StoreModel.id == store_id), options=STORE_SCHEMA_LOAD, **fieldset)
 
     # store_id来自路由
     def delete(self, store_id):
         store = StoreModel.query.get_or_404(store_id)
-        db.session.delete(store)
+
+        # 删除任务还在执行: 任务每删除一块就 commit，store_stats 中的个数会变小，
+        # 但不能因此在请求中同时删除同一个 store，返回正在执行的任务
+        job = running_store_delete(current_app.jobs_queue, store_id)
+
+        # item 的个数从 store_stats 中读取 (见 store_stats.py)
+        if job is None:
+            item_count = store.stats.item_count if store.stats else db.session.scalar(
+                select(db.func.count()).select_from(ItemModel).where(ItemModel.store_id == store_id)
+            )
+            # 很大的 store 交给 RQ 任务分块删除，每块一个事务 (见 store_delete.py)
+            if item_count > current_app.config["STORE_DELETE_SYNC_MAX_ITEMS"]:
+                job = queue_store_delete(current_app.jobs_queue, store_id)
+
+        if job is not None:
+            return (
+                {"message": "Store deletion queued.", "job_id": job.id},
+                202,
+                {"Location": url_for("Stores.StoreDeleteJob", store_id=store_id)},
+            )
+
+        # 用集合操作的 DELETE 删除 store 的 items, tags, items_tags 和 store_stats 中的行，不加载 ORM 对象
+        _, item_ids, tag_ids = delete_store(store_id, current_app.config["STORE_DELETE_CHUNK_SIZE"])
         db.session.commit()
+
+        # 删除的 items 和 tags，以及嵌套了它们的 items 和 tags 的缓存都要失效
+        invalidate_entities(stores=[store_id], items=item_ids, tags=tag_ids)
         return {"message": "Store deleted"}, 200
 
+@blp.route("/store/<int:store_id>/delete-job")
+class StoreDeleteJob(MethodView):
+    @query_budget(0)
+    @blp.response(200, StoreDeleteJobSchema)
+    def get(self, store_id):
+        job = fetch_store_delete(current_app.jobs_queue, store_id)
+        if job is None:
+            abort(404, message="No deletion job for this store.")
+
+        return {"job_id": job.id, "store_id": store_id, "status": job.get_status().value, **job.get_meta()}
+
 @blp.route("/store")
 class StoreList(MethodView):
+    @query_budget(3)
+    @blp.arguments(ListArgsSchema, location="query")
     @blp.response(200, StoreSchema(many=True))
-    def get(self):
-
-        # 查询并返回 StoreModel 表中的所有数据记录
-        # 这些记录将是包含一系列 StoreModel 的实例的 列表
+    def get(self, page_args):
 
-        stores = StoreModel.query
+        # 按 id 做 keyset 分页，只查询并返回一页 StoreModel 数据记录
+        # 下一页的 cursor 放在响应头 X-Next-Cursor 中
+        # 返回 Page: 由编译好的 serializer 只查询 StoreSchema 需要的列 (见 serializers.py)
+        # 两条路径下，整页 store 的 items 和 tags 都各用一条 IN 查询加载 (marshmallow 路径用 STORE_SCHEMA_LOAD)
 
         # 由于方法被 @blp.response(200, StoreSchema(many=True)) 装饰器装饰，
         # Flask-Smorest 将会自动使用 StoreSchema 对 列表中 的 每一个 store 实例进行序列化，
         # 并将序列化后的 一个列表 的 JSON 数据作为 HTTP 响应的主体返回给客户端。
-        return stores.all()
+        return Page(StoreModel.query, StoreModel.id, options=STORE_SCHEMA_LOAD, **page_args)
 
+    @query_budget(5)
     @blp.arguments(StoreSchema)
     @blp.response(201, StoreSchema)
     def post(self, store_data):
-        store = StoreModel(**store_data)
+        # store_stats 中的一行随 store 一起插入 (都是 0)
+        store = StoreModel(**store_data, stats=StoreStatsModel())
         try:
             db.session.add(store)
             db.session.commit()
@@ -76,3 +129,41 @@ class StoreList(MethodView):
         # Flask-Smorest 将会自动使用 StoreSchema 对 store 实例进行序列化，
         # 并将序列化后的 JSON 数据作为 HTTP 响应的主体返回给客户端。
         return store
+
+@blp.route("/store/<int:store_id>/stats")
+class StoreStats(MethodView):
+    @query_budget(1)
+    @blp.arguments(FieldsetSchema, location="query")
+    @blp.response(200, StoreStatsSchema)
+    def get(self, fieldset, store_id):
+        # 读 store_stats 中的一行，不聚合 store 的 items (见 store_stats.py)
+        return Single(StoreStatsModel.query.filter(StoreStatsModel.store_id == store_id), **fieldset)
+
+@blp.route("/store/stats")
+class StoreStatsList(MethodView):
+    @query_budget(1)
+    @blp.arguments(StoreStatsArgsSchema, location="query")
+    @blp.response(200, StoreStatsSchema(many=True))
+    def get(self, stats_args):
+        # 多个 store 的统计: ?store_id=1,2,3 或者按 store_id 做 keyset 分页返回所有 store
+        stats = StoreStatsModel.query
+        if "store_id" in stats_args:
+            stats = stats.filter(StoreStatsModel.store_id.in_(stats_args.pop("store_id")))
+        return Page(stats, StoreStatsModel.store_id, **stats_args)
+
+@blp.route("/store/export")
+class StoreExport(MethodView):
+    @blp.response(
+        200,
+        description="Streams every store with its items and tags, one store per line (NDJSON).",
+        content_type="application/x-ndjson",
+    )
+    def get(self):
+        chunk_size = current_app.config["EXPORT_CHUNK_SIZE"]
+
+        # stream_with_context: 生成器在整个响应发送期间保持 request/app context，
+        # 这样 db.session 和 server-side cursor 在流式输出时依然可用
+        return Response(
+            stream_with_context(export_stores_ndjson(chunk_size)),
+            mimetype="application/x-ndjson",
+        )
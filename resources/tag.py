@@ -1,10 +1,20 @@
+from itertools import product
+
+from flask import current_app
 from flask.views import MethodView
-from flask_smorest import Blueprint, abort
-from sqlalchemy.exc import SQLAlchemyError
+from flask_smorest import abort
+from sqlalchemy import delete, literal, select, tuple_
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 
+from bulk import chunked, ignores_conflicts, insert_or_ignore
+from cache import cached_entity, invalidate_entities
 from db import db
-from models import TagModel, StoreModel, ItemModel
-from schemas import TagSchema, TagAndItemSchema
+from loaders import TAG_SCHEMA_LOAD
+from query_budget import query_budget
+from models import TagModel, StoreModel, ItemModel, ItemTags
+from schemas import TagSchema, TagAndItemSchema, FieldsetSchema, ListArgsSchema, BulkTagLinkSchema, BulkTagLinkResultSchema
+from serializers import Blueprint, Page, Single
+from store_stats import record_tag_changes
 
 ''' 
     "Tags": 这是蓝图的名字，用于标识蓝图。这个名字在整个应用中需要是唯一的。
@@ -25,61 +35,102 @@ blp = Blueprint("Tags", __name__, description="Operations on tags")
 
 @blp.route("/store/<int:store_id>/tag")
 class TagsInStore(MethodView):
+    @query_budget(3)
+    @blp.arguments(ListArgsSchema, location="query")
     @blp.response(200, TagSchema(many=True))
     # store_id来自路由
-    def get(self, store_id):
+    def get(self, page_args, store_id):
         store = StoreModel.query.get_or_404(store_id)
 
         # 一个 store 可能 包含 多个 tags
+        # 按 id 做 keyset 分页，只取一页
+        # 返回 Page: 由编译好的 serializer 只查询 TagSchema 需要的列 (见 serializers.py)，
+        # 退回 marshmallow 时用 TAG_SCHEMA_LOAD 预加载 store 和 items
 
         # 由于方法被 @blp.response(200, TagSchema(many=True)) 装饰器装饰，
         # Flask-Smorest 将会自动使用 TagSchema 对 列表中的 每一个 tag 实例进行序列化，
         # 并将序列化后的 JSON 数据作为 HTTP 响应的主体返回给客户端。
-        return store.tags.all()
+        tags = TagModel.query.filter(TagModel.store_id == store.id)
+        return Page(tags, TagModel.id, options=TAG_SCHEMA_LOAD, **page_args)
     
+    @query_budget(4)
     @blp.arguments(TagSchema)
     @blp.response(201, TagSchema)
     def post(self, tag_data, store_id):
-        # .first(): 从上述过滤后的记录中获取第一个匹配的记录
-        if TagModel.query.filter(TagModel.store_id == store_id, TagModel.name == tag_data["name"]).first():
-            abort(400, message = "A tag with that name already exists in that store.")
-
-        tag = TagModel(**tag_data, store_id = store_id)
+        # 一条 INSERT ... SELECT ... ON CONFLICT DO NOTHING RETURNING id:
+        # store 不存在时 SELECT 没有行，name 重复时唯一约束让这一行被跳过，两种情况都不插入
+        statement = (
+            insert_or_ignore(TagModel.__table__)
+            .from_select(
+                ["name", "store_id"],
+                select(literal(tag_data["name"]), StoreModel.id).where(StoreModel.id == store_id),
+            )
+            .returning(TagModel.id)
+        )
 
         try:
-            db.session.add(tag)
+            tag_id = db.session.scalar(statement)
+            if tag_id is not None:
+                # store 的 tag_count 在同一个事务中 +1
+                record_tag_changes({store_id: 1})
             db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            if ignores_conflicts():
+                # 重名的行已经被 ON CONFLICT 跳过: 这是其它约束的错误，不是重名
+                abort(500, message = str(e))
+            # 没有 ON CONFLICT 的数据库: 冲突时抛出 IntegrityError
+            tag_id = None
         except SQLAlchemyError as e:
             abort(
                 500,
                 message = str(e)
             )
 
-        # 由于方法被 @blp.response(201, TagSchema) 装饰器装饰，
-        # Flask-Smorest 将会自动使用 TagSchema 对 tag 实例进行序列化，
-        # 并将序列化后的 JSON 数据作为 HTTP 响应的主体返回给客户端。
-        return tag
+        if tag_id is None:
+            # 没有插入时才多查询一次，区分 store 不存在 和 tag 重名
+            StoreModel.query.get_or_404(store_id)
+            abort(400, message = "A tag with that name already exists.")
+
+        # 新 tag 会出现在所属 store 的 tags 中
+        invalidate_entities(stores=[store_id])
+
+        # 返回 Single: 由编译好的 serializer 查询并序列化新的 tag (见 serializers.py)
+        return Single(TagModel.query.filter(TagModel.id == tag_id), options=TAG_SCHEMA_LOAD)
     
 @blp.route("/item/<int:item_id>/tag/<int:tag_id>")
 class LinkTagsToItem(MethodView):
+    @query_budget(4)
     @blp.response(201, TagSchema)
     # item_id, tag_id 来自路由
     def post(self, item_id, tag_id):
-        item = ItemModel.query.get_or_404(item_id)
-        tag = TagModel.query.get_or_404(tag_id)
-
-        # item.tags 是一个 列表
-        # 往列表中加入新的 tag
-        item.tags.append(tag)
+        # 一条 INSERT ... SELECT ... ON CONFLICT DO NOTHING 插入关联，不加载 item、tag 和 item.tags:
+        # item 或 tag 不存在时 SELECT 没有行;
+        # (item_id, tag_id) 是唯一的: 已经关联过时唯一约束让这一行被跳过，重复请求同样返回 201
+        statement = insert_or_ignore(ItemTags.__table__).from_select(
+            ["item_id", "tag_id"],
+            # 两边各最多一行: 用 JOIN ... ON tags.id = :tag_id 代替 FROM items, tags
+            select(ItemModel.id, TagModel.id).join(TagModel, TagModel.id == tag_id).where(ItemModel.id == item_id),
+        )
 
         try:
-            db.session.add(item)
+            linked = db.session.execute(statement).rowcount
             db.session.commit()
+        except IntegrityError:
+            # 没有 ON CONFLICT 的数据库: 冲突时抛出 IntegrityError
+            db.session.rollback()
+            linked = 0
         except SQLAlchemyError:
             abort(500, message="An error occurred while inserting the tag.")
 
-        return tag
+        if not linked:
+            # 已经关联过，或者 item / tag 不存在: item 不存在时 404，tag 不存在时下面的 Single 返回 404
+            ItemModel.query.get_or_404(item_id)
+        else:
+            invalidate_entities(items=[item_id], tags=[tag_id])
+        return Single(TagModel.query.filter(TagModel.id == tag_id), options=TAG_SCHEMA_LOAD)
 
+    @query_budget(9)
     @blp.response(200, TagAndItemSchema)
     # item_id, tag_id 来自路由
     def delete(self, item_id, tag_id):
@@ -96,20 +147,113 @@ class LinkTagsToItem(MethodView):
         except SQLAlchemyError:
             abort(500, message="An error occurred while inserting the tag.")
 
+        invalidate_entities(items=[item_id], tags=[tag_id])
         return {"message": "Item removed from tag", "item": item, "tag": tag}
+
+def _resolve_pairs(link_data):
+    '''
+    把请求展开成去重后的 (item_id, tag_id) 集合，
+    并用 item 和 tag 各一条 IN 查询检查它们是否都存在。
+    '''
+    if "pairs" in link_data:
+        pairs = {(pair["item_id"], pair["tag_id"]) for pair in link_data["pairs"]}
+    else:
+        pairs = set(product(link_data["item_ids"], link_data["tag_ids"]))
+
+    item_ids = {item_id for item_id, _ in pairs}
+    tag_ids = {tag_id for _, tag_id in pairs}
+
+    missing_items = item_ids - set(db.session.scalars(select(ItemModel.id).where(ItemModel.id.in_(item_ids))))
+    missing_tags = tag_ids - set(db.session.scalars(select(TagModel.id).where(TagModel.id.in_(tag_ids))))
+    if missing_items or missing_tags:
+        abort(
+            404,
+            message="Some items or tags were not found.",
+            errors={"item_ids": sorted(missing_items), "tag_ids": sorted(missing_tags)},
+        )
+
+    return pairs, item_ids, tag_ids
+
+@blp.route("/tag/link")
+class LinkTagsToItems(MethodView):
+    '''
+    批量版本的 LinkTagsToItem: 一次请求关联 / 取消关联多个 (item, tag)，
+    用集合操作的 INSERT / DELETE 在同一个事务中完成。
+    '''
+    @query_budget(3)
+    @blp.arguments(BulkTagLinkSchema)
+    @blp.response(200, BulkTagLinkResultSchema)
+    def post(self, link_data):
+        pairs, item_ids, tag_ids = _resolve_pairs(link_data)
+        requested = len(pairs)
+        chunk_size = current_app.config["BULK_CHUNK_SIZE"]
+
+        try:
+            if not ignores_conflicts():
+                # 没有 ON CONFLICT 的数据库: 先查询并跳过已经存在的关联
+                for chunk in chunked(set(pairs), chunk_size):
+                    pairs -= set(
+                        db.session.execute(
+                            select(ItemTags.item_id, ItemTags.tag_id).where(
+                                tuple_(ItemTags.item_id, ItemTags.tag_id).in_(chunk)
+                            )
+                        ).tuples()
+                    )
+
+            # INSERT ... ON CONFLICT DO NOTHING RETURNING: 已经存在的关联 (包括并发请求刚插入的) 被跳过，
+            # 不在 RETURNING 中；不超过 BULK_CHUNK_SIZE 个关联时只有一条语句
+            linked = 0
+            statement = insert_or_ignore(ItemTags.__table__).returning(ItemTags.id)
+            for chunk in chunked(pairs, chunk_size):
+                linked += len(
+                    db.session.execute(
+                        statement, [{"item_id": item_id, "tag_id": tag_id} for item_id, tag_id in chunk]
+                    ).all()
+                )
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            abort(500, message="An error occurred while inserting the tags.")
+
+        invalidate_entities(items=item_ids, tags=tag_ids)
+        return {"linked": linked, "skipped": requested - linked}
+
+    @blp.arguments(BulkTagLinkSchema)
+    @blp.response(200, BulkTagLinkResultSchema)
+    def delete(self, link_data):
+        pairs, item_ids, tag_ids = _resolve_pairs(link_data)
+        unlinked = 0
+
+        try:
+            for chunk in chunked(pairs, current_app.config["BULK_CHUNK_SIZE"]):
+                result = db.session.execute(
+                    delete(ItemTags).where(tuple_(ItemTags.item_id, ItemTags.tag_id).in_(chunk))
+                )
+                unlinked += result.rowcount
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            abort(500, message="An error occurred while removing the tags.")
+
+        invalidate_entities(items=item_ids, tags=tag_ids)
+        return {"unlinked": unlinked}
     
 @blp.route("/tag/<int:tag_id>")
 class Tag(MethodView):
+    @query_budget(2)
+    @cached_entity("tag", "tag_id")
+    @blp.arguments(FieldsetSchema, location="query")
     @blp.response(200, TagSchema)
     # tag_id来自路由
-    def get(self, tag_id):
+    def get(self, fieldset, tag_id):
 
-        tag = TagModel.query.get_or_404(tag_id)
+        # 返回 Single: 按 ?fields= / ?include= 只查询需要的列和关系 (见 serializers.py)
+        # 退回 marshmallow 时用 TAG_SCHEMA_LOAD 预加载 store 和 items
 
         # 由于方法被 @blp.response(200, TagSchema) 装饰器装饰，
         # Flask-Smorest 将会自动使用 TagSchema 对 tag 实例进行序列化，
         # 并将序列化后的 JSON 数据作为 HTTP 响应的主体返回给客户端。
-        return tag
+        return Single(TagModel.query.filter(TagModel.id == tag_id), options=TAG_SCHEMA_LOAD, **fieldset)
     
     '''
     这段代码定义了一个用于删除标签（Tag）的方法，并且它包含了多个装饰器来处理不同的响应场景。我将逐个解释这些装饰器以及方法的逻辑。
@@ -152,12 +296,18 @@ class Tag(MethodView):
         400,
         description="Returned if the tag is assigned to one or more items. In this case, the tag is not deleted.",
     )
+    @query_budget(4)
     def delete(self, tag_id):
         tag = TagModel.query.get_or_404(tag_id)
 
         if not tag.items:
+            store_id = tag.store_id
             db.session.delete(tag)
+            record_tag_changes({store_id: -1})
             db.session.commit()
+
+            # tag 自身，以及嵌套了它的 store 的缓存失效
+            invalidate_entities(stores=[store_id], tags=[tag_id])
             return {"message": "Tag deleted."}
         abort(
             400,
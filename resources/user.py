@@ -1,10 +1,8 @@
-import requests
 import os
 
 from flask import current_app
 from flask.views import MethodView
-from flask_smorest import Blueprint, abort
-from passlib.hash import pbkdf2_sha256
+from flask_smorest import abort
 from flask_jwt_extended import create_access_token
 from flask_jwt_extended import (
     create_access_token,
@@ -14,12 +12,15 @@ from flask_jwt_extended import (
     jwt_required,
 )
 
-from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from bulk import insert_or_ignore
 from db import db
 from models import UserModel
+from query_budget import query_budget
+from ratelimit import rate_limited
 from schemas import UserSchema, UserRegisterSchema
-from blocklist import BLOCKLIST
-from tasks import send_user_registration_email
+from serializers import Blueprint
+from tasks import queue_user_registration_email
 
 ''' 
     "Users": 这是蓝图的名字，用于标识蓝图。这个名字在整个应用中需要是唯一的。
@@ -40,39 +41,58 @@ blp = Blueprint("Users", __name__, description="Operations on users")
 
 @blp.route("/register")
 class UserRegister(MethodView):
+    @query_budget(1)
+    @rate_limited("register")
+    @blp.alt_response(429, description="Too many registration attempts from this client or for this username.")
     @blp.arguments(UserRegisterSchema)
     def post(self, user_data):
 
-        # 通过 UserSchema 将 user_data从 JSON 转换 为 Python 字典
-        if UserModel.query.filter(
-            or_(
-                UserModel.username == user_data["username"],
-                UserModel.email == user_data["email"]
-                )
-            ).first():
-            abort(409, message = "A user with that username or email already exists.")
-        
-        user = UserModel(
+        # 一条 INSERT ... ON CONFLICT DO NOTHING RETURNING id:
+        # username 或 email 已存在时，唯一约束让这一行被跳过，不需要先查询
+        statement = insert_or_ignore(UserModel.__table__).values(
             username = user_data["username"],
             email = user_data["email"],
-            password = pbkdf2_sha256.hash(user_data["password"])
-        )
-
-        db.session.add(user)
-        db.session.commit()
+            # pbkdf2 计算放到进程池中执行，不占用当前 worker 的 GIL
+            password = current_app.password_hasher.hash(user_data["password"])
+        ).returning(UserModel.id)
+
+        try:
+            user_id = db.session.scalar(statement)
+            db.session.commit()
+        except IntegrityError:
+            # 没有 ON CONFLICT 的数据库: 冲突时抛出 IntegrityError
+            db.session.rollback()
+            user_id = None
+
+        if user_id is None:
+            abort(409, message = "A user with that username or email already exists.")
 
-        # 将 send_user_registration_email 任务 加入 当前app 的 队列
-        current_app.queue.enqueue(send_user_registration_email, user.email, user.username)
+        # 将注册邮件 放入 当前app 队列 的批量发送缓冲区
+        queue_user_registration_email(current_app.queue, user_data["email"], user_data["username"])
 
         return {"message": "User created successfully."}, 201
     
 @blp.route("/login")
 class UserLogin(MethodView):
+    @query_budget(2)
+    @rate_limited("login")
+    @blp.alt_response(429, description="Too many login attempts from this client or for this username.")
     @blp.arguments(UserSchema)
     def post(self, user_data): 
         user = UserModel.query.filter(UserModel.username == user_data["username"]).first()
 
-        if user and pbkdf2_sha256.verify(user_data["password"], user.password):
+        if user:
+            # pbkdf2 校验放到进程池中执行，不占用当前 worker 的 GIL
+            # 如果存储的 hash 使用的是旧参数 (例如 rounds 变了)，new_hash 为升级后的 hash
+            valid, new_hash = current_app.password_hasher.verify_and_update(user_data["password"], user.password)
+        else:
+            valid, new_hash = False, None
+
+        if valid:
+            if new_hash:
+                user.password = new_hash
+                db.session.commit()
+
             access_token = create_access_token( identity = user.id, fresh = True )
             refresh_token = create_refresh_token(identity = user.id)
             return {"access_token": access_token, "refresh_token": refresh_token}
@@ -81,6 +101,7 @@ class UserLogin(MethodView):
 
 @blp.route("/refresh")
 class TokenRefresh(MethodView):
+    @query_budget(0)
     @jwt_required(refresh = True)
     def post(self): 
         current_user = get_jwt_identity()
@@ -88,21 +109,24 @@ class TokenRefresh(MethodView):
         # get_jwt() 返还一个 字典
         # 获取当前请求的 JWT
         # "jti" 是 JWT 的一个标准字段，代表 "JWT ID"。这是一个唯一标识符，用于标识该令牌的实例
-        # 这行代码的作用是从当前请求的 JWT 中提取 jti 值，并将其存储在变量 jti 中
-        jti = get_jwt()["jti"]
-        BLOCKLIST.add(jti)
+        # 这里从当前请求的 JWT 中提取 jti 值，并将其加入 blocklist
+        # "exp" 是令牌的过期时间，过期之后 jti 会自动从 blocklist 中移除
+        jwt = get_jwt()
+        current_app.blocklist.add(jwt["jti"], jwt.get("exp"))
         return {"access_token": new_token}
 
 @blp.route("/logout")
 class UserLogout(MethodView):
+    @query_budget(0)
     @jwt_required()
     def post(self):
         # get_jwt() 返还一个 字典
         # 获取当前请求的 JWT
         # "jti" 是 JWT 的一个标准字段，代表 "JWT ID"。这是一个唯一标识符，用于标识该令牌的实例
-        # 这行代码的作用是从当前请求的 JWT 中提取 jti 值，并将其存储在变量 jti 中
-        jti = get_jwt()["jti"]
-        BLOCKLIST.add(jti)
+        # 这里从当前请求的 JWT 中提取 jti 值，并将其加入 blocklist
+        # "exp" 是令牌的过期时间，过期之后 jti 会自动从 blocklist 中移除
+        jwt = get_jwt()
+        current_app.blocklist.add(jwt["jti"], jwt.get("exp"))
         return {"message": "Successfully logged out"}, 200
 
 @blp.route("/user/<int:user_id>")
@@ -114,12 +138,14 @@ class User(MethodView):
     when we are manipulating data regarding the users.
     """ 
     # 从路由获取user_id
+    @query_budget(1)
     @blp.response(200, UserSchema)
     def get(self, user_id):
         user = UserModel.query.get_or_404(user_id)
         return user
 
     # 从路由获取user_id
+    @query_budget(2)
     def delete(self, user_id):
         user = UserModel.query.get_or_404(user_id)
         db.session.delete(user)
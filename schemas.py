@@ -1,4 +1,7 @@
-from marshmallow import Schema, fields
+from marshmallow import Schema, fields, validate, validates_schema, ValidationError
+from webargs.fields import DelimitedList
+
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 
 '''
 在软件开发和数据处理中，schema（模式）扮演了非常重要的角色。特别是在使用像 Marshmallow 这样的库进行序列化和反序列化操作时，schema 显得尤为重要。
@@ -61,7 +64,7 @@ class PlainTagSchema(Schema):
     # 标记为 dump_only 表示它仅用于序列化数据时,
     # 即返回给客户端的响应中会包含这个字段，但不会用于接收客户端的输入。
     id = fields.Int(dump_only=True)
-    name = fields.Str()
+    name = fields.Str(required=True)
 
 '''
 对应 ItemModel 的 store_id, store, tags 属性
@@ -73,6 +76,9 @@ class ItemSchema(PlainItemSchema):
     # 但它不会包含在序列化（返回给客户端）的数据中。
     store_id = fields.Int(required=True, load_only=True)
 
+    # 自由文本的描述，和 name 一起被 GET /item/search 搜索
+    description = fields.Str(allow_none=True)
+
     # store 字段是一个嵌套的对象,
     # 其结构和数据应按照 PlainStoreSchema 模式来序列化。
     store = fields.Nested(PlainStoreSchema(), dump_only=True)
@@ -80,11 +86,11 @@ class ItemSchema(PlainItemSchema):
     tags = fields.List(fields.Nested(PlainTagSchema()), dump_only=True)
 
 '''
-对应 ItemModel 的 name, price 属性
+PUT /item 的一行: 对应 ItemModel 的全部属性
 '''
-class ItemUpdateSchema(Schema):
-    name = fields.Str()
-    price = fields.Float()
+class ItemUpsertSchema(ItemSchema):
+    # id 由客户端给出，已存在的 item 被整行替换，不存在时用这个 id 插入
+    id = fields.Int(required=True, strict=True, validate=validate.Range(min=1))
 
 '''
 对应 StoreModel 的 items, tags 属性
@@ -114,6 +120,28 @@ class TagSchema(PlainTagSchema):
 
     items = fields.List(fields.Nested(PlainItemSchema()), dump_only=True)
 
+'''
+对应 StoreStatsModel: 一个 store 的统计，没有 item 时价格为 null
+'''
+class StoreStatsSchema(Schema):
+    store_id = fields.Int(dump_only = True)
+    item_count = fields.Int(dump_only = True)
+    tag_count = fields.Int(dump_only = True)
+    min_price = fields.Float(dump_only = True)
+    max_price = fields.Float(dump_only = True)
+    avg_price = fields.Float(dump_only = True)
+
+'''
+删除很大的 store 的后台任务 (见 store_delete.py)
+status: queued / started / finished / failed 等 RQ 任务状态
+'''
+class StoreDeleteJobSchema(Schema):
+    job_id = fields.Str(dump_only = True)
+    store_id = fields.Int(dump_only = True)
+    status = fields.Str(dump_only = True)
+    deleted_items = fields.Int(dump_only = True)
+    deleted_tags = fields.Int(dump_only = True)
+
 class TagAndItemSchema(Schema):
     message = fields.Str()
     item = fields.Nested(ItemSchema)
@@ -125,4 +153,105 @@ class UserSchema(Schema):
     password = fields.Str(required = True, load_only = True)
 
 class UserRegisterSchema(UserSchema):
-    email = fields.Str(required = True)
\ No newline at end of file
+    email = fields.Str(required = True)
+
+'''
+列表接口的 keyset 分页参数 (query string)
+limit: 每页条数
+after: 上一页响应头 X-Next-Cursor 中返回的 cursor
+'''
+class PaginationSchema(Schema):
+    limit = fields.Int(load_default = DEFAULT_PAGE_SIZE, validate = validate.Range(min = 1, max = MAX_PAGE_SIZE))
+    after = fields.Str()
+
+'''
+item / store / tag 接口的稀疏字段参数 (query string)，见 serializers.resolve_fieldset
+fields: 逗号分隔，要输出的字段，例如 name,items.name (Schema 自己有 fields 属性，所以这里叫 fieldset)
+include: 逗号分隔，要嵌入的关系，例如 items,tags；include= 表示不嵌入任何关系
+'''
+class FieldsetSchema(Schema):
+    fieldset = DelimitedList(fields.Str(), data_key = "fields")
+    include = DelimitedList(fields.Str())
+
+class ListArgsSchema(PaginationSchema, FieldsetSchema):
+    pass
+
+'''
+GET /item 的过滤和排序参数 (query string)，每个过滤条件都有对应的索引
+store_id: 只返回这个 store 的 item
+min_price / max_price: 价格范围 (包含两端)
+tag_id: 逗号分隔的 tag id；tag_match=any 时 item 带有其中任意一个 tag，all 时要带有全部 tag
+name: name 的前缀 (区分大小写)
+sort: id / price / name，前面加 - 表示降序，例如 -price；after 的 cursor 要用同一个 sort
+'''
+class ItemListArgsSchema(ListArgsSchema):
+    store_id = fields.Int()
+    min_price = fields.Float()
+    max_price = fields.Float()
+    tag_id = DelimitedList(fields.Int(), validate = validate.Length(min = 1))
+    tag_match = fields.Str(load_default = "any", validate = validate.OneOf(["any", "all"]))
+    name = fields.Str(validate = validate.Length(min = 1))
+    sort = fields.Str(load_default = "id", validate = validate.OneOf(["id", "-id", "price", "-price", "name", "-name"]))
+
+    @validates_schema
+    def validate_price_range(self, data, **kwargs):
+        if "min_price" in data and "max_price" in data and data["min_price"] > data["max_price"]:
+            raise ValidationError("min_price must not be greater than max_price.")
+
+'''
+GET /store/stats 的参数 (query string)
+store_id: 逗号分隔，只返回这些 store 的统计；没有给出时分页返回所有 store
+'''
+class StoreStatsArgsSchema(ListArgsSchema):
+    store_id = DelimitedList(fields.Int(), validate = validate.Length(min = 1, max = MAX_PAGE_SIZE))
+
+'''
+GET /item/search 的参数 (query string)，见 search.py
+q: 要搜索的词，在 name 和 description 中搜索，每个词都要匹配；结果按相关度排序
+after 的 cursor 只能用于同一个 q
+'''
+class ItemSearchArgsSchema(ListArgsSchema):
+    q = fields.Str(required = True, validate = validate.Length(min = 1, max = 200))
+
+'''
+POST /item/bulk 的响应
+ids: 与请求中的行一一对应，新建 item 的 id；校验失败的行为 null
+errors: {行号: 错误信息}
+'''
+class BulkResultSchema(Schema):
+    ids = fields.List(fields.Int(allow_none = True))
+    errors = fields.Dict(keys = fields.Str(), values = fields.Raw())
+
+class BulkUpsertResultSchema(Schema):
+    inserted = fields.Int()
+    updated = fields.Int()
+    errors = fields.Dict(keys = fields.Str(), values = fields.Raw())
+
+class ItemTagPairSchema(Schema):
+    item_id = fields.Int(required = True)
+    tag_id = fields.Int(required = True)
+
+'''
+批量关联 / 取消关联 tag 与 item，两种写法二选一:
+pairs: [{"item_id": 1, "tag_id": 2}, ...]
+tag_ids + item_ids: 每个 tag 与每个 item 两两组合
+'''
+class BulkTagLinkSchema(Schema):
+    pairs = fields.List(fields.Nested(ItemTagPairSchema()))
+    tag_ids = fields.List(fields.Int())
+    item_ids = fields.List(fields.Int())
+
+    @validates_schema
+    def validate_spec(self, data, **kwargs):
+        has_pairs = "pairs" in data
+        has_product = "tag_ids" in data or "item_ids" in data
+        if has_pairs == has_product:
+            raise ValidationError("Provide either pairs, or tag_ids and item_ids.")
+        if has_product and not ("tag_ids" in data and "item_ids" in data):
+            raise ValidationError("tag_ids and item_ids must be provided together.")
+
+class BulkTagLinkResultSchema(Schema):
+    linked = fields.Int()
+    unlinked = fields.Int()
+    skipped = fields.Int()
+
@@ -0,0 +1,180 @@
+"""
+search.py
+
+Full-text search over item name and description (``GET /item/search?q=``).
+
+The index lives in the database and depends on the dialect:
+
+- SQLite: an FTS5 external-content table ``items_fts`` over ``items``, kept in
+  sync by AFTER INSERT / UPDATE / DELETE triggers on ``items``.
+- PostgreSQL: a generated ``tsvector`` column ``items.search_vector`` with a GIN
+  index.
+
+The database updates the index in the same statement as the write. Every path
+that writes items therefore keeps it in sync: the item resource,
+``POST /item/bulk``, deleting a store and its items, and plain SQL.
+``install_search_index`` attaches the DDL to the items table so
+``db.create_all()`` creates it. Existing databases get it from the migration.
+
+Every word of the query must match (AND). Results are ranked with bm25 (SQLite)
+or ts_rank_cd (PostgreSQL), and a match in the name counts more than a match in
+the description. Pages use keyset cursors on (rank, id), like the other lists.
+
+Ranking costs time for every match: a word found in 1M items takes seconds.
+SEARCH_MAX_RANKED caps how many matches are ranked (10000 by default). Past the
+cap, only the first matches in index order are ranked and returned, so the
+cost of a search is bounded, but better matches further along the index can
+be left out. Such responses carry ``X-Search-Truncated: true``; finding out
+takes one more statement that skips past the cap without ranking anything. A
+query that lists more words gets fewer and better matches.
+benchmarks/search.py times this on a 1M item catalog.
+"""
+
+import re
+
+from flask_smorest import abort
+from sqlalchemy import DDL, event, func, literal_column, select, table
+
+# name 中的匹配比 description 中的重要
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+# 最多使用的查询词个数
+MAX_TERMS = 16
+
+# 匹配的个数超过 max_ranked，只排序了其中一部分时，响应带有这个头
+TRUNCATED_HEADER = "X-Search-Truncated"
+
+_SQLITE_DDL = (
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(
+        name, description, content='items', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS items_fts_insert AFTER INSERT ON items BEGIN
+        INSERT INTO items_fts (rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS items_fts_delete AFTER DELETE ON items BEGIN
+        INSERT INTO items_fts (items_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS items_fts_update AFTER UPDATE OF id, name, description ON items BEGIN
+        INSERT INTO items_fts (items_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO items_fts (rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+    # 已有的 item 也写入索引 (create_all 建表时是空表，什么都不做)
+    "INSERT INTO items_fts (items_fts) VALUES ('rebuild')",
+)
+
+_POSTGRES_DDL = (
+    """
+    ALTER TABLE items ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(name, '')), 'A')
+        || setweight(to_tsvector('simple', coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_items_search_vector ON items USING gin (search_vector)",
+)
+
+
+def install_search_index(items):
+    """
+    让 create_all / drop_all 同时创建 / 删除 items 表的全文索引。
+    """
+    for statement in _SQLITE_DDL:
+        event.listen(items, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+    for statement in _POSTGRES_DDL:
+        event.listen(items, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+    # 触发器、生成列和 GIN 索引随 items 表一起删除，只有 FTS5 表要单独删除
+    event.listen(items, "before_drop", DDL("DROP TABLE IF EXISTS items_fts").execute_if(dialect="sqlite"))
+
+
+def query_terms(q):
+    """
+    查询中的词 (去掉标点和 FTS 语法)，没有任何词时返回 400。
+    """
+    terms = re.findall(r"\w+", q)[:MAX_TERMS]
+    if not terms:
+        abort(400, message="The search query must contain at least one word.")
+    return terms
+
+
+def _sqlite_match(terms):
+    # 每个词都加上引号，作为普通的词匹配 (不会被当成 FTS5 的 AND / OR / NEAR / 列过滤等语法)
+    return literal_column("items_fts").op("MATCH")(" ".join(f'"{term}"' for term in terms))
+
+
+def _postgres_tsquery(terms):
+    return func.plainto_tsquery(literal_column("'simple'::regconfig"), " ".join(terms))
+
+
+def _sqlite_hits(terms, max_ranked):
+    fts = literal_column("items_fts")
+    # 没有 ORDER BY 的 LIMIT: SQLite 取到 max_ranked 个匹配就停止，只为它们计算 bm25
+    return select(
+        literal_column("items_fts.rowid").label("item_id"),
+        func.bm25(fts, NAME_WEIGHT, DESCRIPTION_WEIGHT).label("search_rank"),
+    ).select_from(table("items_fts")).where(_sqlite_match(terms)).limit(max_ranked or None)
+
+
+def _postgres_hits(model, terms, max_ranked):
+    vector = literal_column("items.search_vector")
+    query = _postgres_tsquery(terms)
+    # 先用 GIN 索引取出最多 max_ranked 个匹配，再只为它们计算 ts_rank_cd
+    matches = select(model.id, vector.label("search_vector")).where(vector.op("@@")(query))
+    matches = matches.limit(max_ranked or None).subquery("matches")
+    # ts_rank_cd 越大越相关；取负数，和 bm25 一样按升序排列
+    weights = literal_column(f"'{{0.1, 0.2, {DESCRIPTION_WEIGHT / NAME_WEIGHT}, 1.0}}'::float4[]")
+    return select(
+        matches.c.id.label("item_id"),
+        (-func.ts_rank_cd(weights, matches.c.search_vector, query)).label("search_rank"),
+    )
+
+
+def search_items(q, dialect, max_ranked=None):
+    """
+    返回 (query, key_columns): 匹配 q 的 ItemModel.query，以及按相关度分页用的 (rank, id)。
+    每个 ItemModel 的 search_rank 是它的相关度 (越小越相关)。
+    max_ranked: 最多排序多少个匹配 (见 SEARCH_MAX_RANKED)，None 或 0 表示全部
+    """
+    from sqlalchemy.orm import with_expression
+
+    from models import ItemModel
+
+    terms = query_terms(q)
+    if dialect == "sqlite":
+        hits = _sqlite_hits(terms, max_ranked)
+    elif dialect == "postgresql":
+        hits = _postgres_hits(ItemModel, terms, max_ranked)
+    else:
+        abort(501, message=f"Full-text search is not supported on {dialect}.")
+    hits = hits.subquery("hits")
+
+    query = ItemModel.query.join(hits, ItemModel.id == hits.c.item_id).options(
+        with_expression(ItemModel.search_rank, hits.c.search_rank)
+    )
+    return query, (hits.c.search_rank, ItemModel.id)
+
+
+def search_truncated(q, dialect, max_ranked):
+    """
+    匹配 q 的 item 是否多于 max_ranked 个 (只有前 max_ranked 个被排序和返回)。
+    跳过前 max_ranked 个匹配，看还有没有下一个: 只读索引，不计算相关度。
+    """
+    from db import db
+    from models import ItemModel
+
+    if not max_ranked:
+        return False
+
+    terms = query_terms(q)
+    if dialect == "sqlite":
+        beyond = select(literal_column("items_fts.rowid")).select_from(table("items_fts")).where(_sqlite_match(terms))
+    else:
+        beyond = select(ItemModel.id).where(literal_column("items.search_vector").op("@@")(_postgres_tsquery(terms)))
+    return db.session.scalar(beyond.offset(max_ranked).limit(1)) is not None
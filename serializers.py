@@ -0,0 +1,385 @@
+"""
+serializers.py
+
+Compiled serializers and sparse fieldsets for the item, store and tag endpoints.
+
+For large responses marshmallow builds ORM objects, then dumps every field of
+every object one at a time. ``compile_serializer`` reads a schema from
+schemas.py once and turns it into a plan of plain columns:
+
+- Int / Float / Str / Bool fields are columns of the model,
+- a Nested to-one field comes from an outer join in the same query,
+- a List(Nested) or Nested(many=True) to-many field is loaded with one IN
+  query for the whole page.
+
+Rows come back as tuples and are turned into dicts, then encoded with orjson.
+The JSON matches what marshmallow and jsonify produce. A schema the compiler
+does not understand (other field types, pre/post_dump hooks, deeper nesting)
+compiles to None and keeps the marshmallow path.
+
+Clients can narrow a response with two query parameters (see FieldsetSchema):
+
+- ``fields=name,items.name`` keeps only these fields (``fieldset``), and
+- ``include=items,tags`` chooses which relationships are embedded.
+
+Both prune the schema before it is compiled, so the SQL only selects the
+requested columns and only joins or loads the requested relationships.
+``GET /store?fields=name`` is a single narrow query over ``stores``.
+
+Views opt in by returning a ``Page`` (list) or ``Single`` (one entity). The
+``Blueprint`` below then serves it through the compiled serializer, or loads ORM
+objects for marshmallow if the schema does not compile or
+FAST_SERIALIZER_ENABLED is off. benchmarks/serializers.py checks that both
+paths return the same JSON.
+"""
+
+import functools
+
+import orjson
+from flask import current_app, jsonify
+from flask_smorest import Blueprint as BaseBlueprint
+from flask_smorest import abort
+from flask_smorest.utils import resolve_schema_instance, unpack_tuple_response
+from marshmallow import fields
+from sqlalchemy import inspect, select
+from sqlalchemy.orm import aliased
+from sqlalchemy.orm.interfaces import MANYTOMANY, MANYTOONE, ONETOMANY
+
+from db import db
+from pagination import DEFAULT_PAGE_SIZE, paginate
+
+# 字段类型 -> marshmallow dump 时对值做的转换
+SCALAR_FIELDS = {
+    fields.Integer: int,
+    fields.Float: float,
+    fields.String: str,
+    fields.Boolean: bool,
+}
+
+# 和 selectinload 一样，每条 IN 查询最多带这么多个 id
+IN_CHUNK_SIZE = 500
+
+
+class Selection:
+    """
+    视图返回的 "要序列化什么"，还没有查询。由 Blueprint 决定怎么查询和序列化。
+
+    query: 过滤好的 Model.query，不带 loader options
+    options: {schema 字段名: loader option}，走 marshmallow 路径时只用被 include 的关系 (见 loaders.py)
+    fieldset / include: 请求中的 ?fields= 和 ?include= (见 FieldsetSchema)
+    """
+
+    def __init__(self, query, options=None, fieldset=None, include=None):
+        self.query = query
+        self.options = options or {}
+        self.fieldset = fieldset
+        self.include = include
+
+    @property
+    def model(self):
+        return self.query.column_descriptions[0]["entity"]
+
+    def _orm_query(self, relations):
+        return self.query.options(*(self.options[name] for name in relations if name in self.options))
+
+
+class Page(Selection):
+    """
+    列表接口的一页数据，按 key_column 做 keyset 分页 (见 pagination.py)。
+    key_column 可以是多个列的 tuple，例如按价格排序时的 (ItemModel.price, ItemModel.id)。
+    """
+
+    def __init__(self, query, key_column, limit=DEFAULT_PAGE_SIZE, after=None, descending=False, **kwargs):
+        super().__init__(query, **kwargs)
+        self.key_columns = key_column if isinstance(key_column, tuple) else (key_column,)
+        self.limit = limit
+        self.after = after
+        self.descending = descending
+
+    def load(self, relations):
+        # marshmallow 路径: 查询 ORM 对象
+        return paginate(self._orm_query(relations), self.key_columns, self.limit, self.after, self.descending)
+
+    def dump(self, serializer):
+        rows, headers = paginate(
+            serializer.select(self.query, self.key_columns), self.key_columns, self.limit, self.after, self.descending
+        )
+        return serializer.build(rows, len(self.key_columns)), headers
+
+
+class Single(Selection):
+    """
+    单个实体: query 最多匹配一行，没有匹配时返回 404。
+    """
+
+    def load(self, relations):
+        return self._orm_query(relations).first_or_404(), {}
+
+    def dump(self, serializer):
+        rows = serializer.select(self.query, (serializer.primary_key,)).limit(1).all()
+        if not rows:
+            abort(404)
+        return serializer.build(rows, 1)[0], {}
+
+
+def _has_dump_hooks(schema):
+    # marshmallow 3 的 _hooks 的 key 是 "post_dump" 或 ("post_dump", many)，取决于版本
+    return any(
+        names and (key[0] if isinstance(key, tuple) else key) in ("pre_dump", "post_dump")
+        for key, names in schema._hooks.items()
+    )
+
+
+def _nested_schema(field):
+    if type(field) is fields.Nested:
+        return field.schema, field.many
+    if type(field) is fields.List and type(field.inner) is fields.Nested:
+        return field.inner.schema, True
+    return None, False
+
+
+def _scalar_fields(schema, mapper):
+    """
+    schema 的所有 dump 字段都对应 mapper 的一个列时，返回 [(data_key, 属性名, 转换函数)]；否则返回 None。
+    """
+    if _has_dump_hooks(schema):
+        return None
+
+    scalars = []
+    for name, field in schema.dump_fields.items():
+        attribute = field.attribute or name
+        convert = SCALAR_FIELDS.get(type(field))
+        if convert is None or attribute not in mapper.column_attrs:
+            return None
+        scalars.append((field.data_key or name, attribute, convert))
+    return scalars
+
+
+def _dict(row, scalars, offset):
+    # 与 marshmallow 一致: None 原样输出，其他值按字段类型转换
+    return {
+        key: None if row[offset + i] is None else convert(row[offset + i])
+        for i, (key, _, convert) in enumerate(scalars)
+    }
+
+
+class CompiledSerializer:
+    def __init__(self, model, scalars, to_one, to_many):
+        self.model = model
+        # [(data_key, 属性名, 转换函数)]
+        self.scalars = scalars
+        # [(data_key, relationship, aliased 目标 model, 目标的 scalars)]
+        self.to_one = to_one
+        # [(data_key, relationship, 目标的 scalars)]
+        self.to_many = to_many
+        self.primary_key = getattr(model, inspect(model).primary_key[0].key)
+
+    def select(self, query, key_columns):
+        """
+        把 query 改成只查询需要的列: 开头的 key_columns 给 paginate 生成 cursor 用，然后是主键，之后是各个字段。
+        """
+        for _, relationship, target, _ in self.to_one:
+            query = query.outerjoin(relationship.class_attribute.of_type(target))
+
+        entities = [self.primary_key]
+        entities += [getattr(self.model, attribute) for _, attribute, _ in self.scalars]
+        for _, _, target, scalars in self.to_one:
+            # 目标的主键用来区分 "没有关联对象" (输出 null)
+            entities.append(getattr(target, inspect(target).mapper.primary_key[0].key))
+            entities += [getattr(target, attribute) for _, attribute, _ in scalars]
+
+        # 除 key_columns 外都用匿名 label，避免 store.id 和 item.id 这样的同名列冲突
+        return query.with_entities(
+            *(column.label(column.key) for column in key_columns), *(entity.label(None) for entity in entities)
+        )
+
+    def _load_many(self, relationship, scalars, ids):
+        """
+        一次查询所有父对象的 to-many 关系，返回 {父对象 id: [dict, ...]}。
+        """
+        target = relationship.mapper.class_
+        columns = [getattr(target, attribute) for _, attribute, _ in scalars]
+        order_by = relationship.order_by or relationship.mapper.primary_key
+
+        ((_, parent_key),) = relationship.synchronize_pairs
+        if relationship.secondary is None:
+            statement = select(parent_key, *columns)
+        else:
+            ((target_key, secondary_key),) = relationship.secondary_synchronize_pairs
+            statement = select(parent_key, *columns).join_from(
+                relationship.secondary, target, secondary_key == target_key
+            )
+
+        children = {}
+        for start in range(0, len(ids), IN_CHUNK_SIZE):
+            chunk = statement.where(parent_key.in_(ids[start:start + IN_CHUNK_SIZE])).order_by(parent_key, *order_by)
+            for row in db.session.execute(chunk):
+                children.setdefault(row[0], []).append(_dict(row, scalars, 1))
+        return children
+
+    def build(self, rows, keys):
+        """
+        select() 查询出的行 -> 序列化后的 dict 列表。keys 是行开头 key_columns 的列数。
+        """
+        ids = [row[keys] for row in rows]
+        many = [
+            (key, self._load_many(relationship, scalars, ids))
+            for key, relationship, scalars in self.to_many
+        ]
+
+        result = []
+        for row in rows:
+            obj = _dict(row, self.scalars, keys + 1)
+            offset = keys + 1 + len(self.scalars)
+            for key, _, _, scalars in self.to_one:
+                obj[key] = None if row[offset] is None else _dict(row, scalars, offset + 1)
+                offset += 1 + len(scalars)
+            for key, children in many:
+                obj[key] = children.get(row[keys], [])
+            result.append(obj)
+        return result
+
+
+def compile_serializer(schema, model):
+    """
+    把 schema 编译成 model 的 CompiledSerializer；不支持的 schema 返回 None。
+    """
+    mapper = inspect(model)
+    if _has_dump_hooks(schema) or len(mapper.primary_key) != 1:
+        return None
+
+    scalars, to_one, to_many = [], [], []
+    for name, field in schema.dump_fields.items():
+        attribute = field.attribute or name
+        key = field.data_key or name
+
+        convert = SCALAR_FIELDS.get(type(field))
+        if convert is not None:
+            if attribute not in mapper.column_attrs:
+                return None
+            scalars.append((key, attribute, convert))
+            continue
+
+        nested, many = _nested_schema(field)
+        if nested is None or attribute not in mapper.relationships:
+            return None
+        relationship = mapper.relationships[attribute]
+        nested_scalars = _scalar_fields(nested, relationship.mapper)
+        if nested_scalars is None or len(relationship.local_columns) != 1:
+            return None
+
+        if not many and relationship.direction is MANYTOONE:
+            to_one.append((key, relationship, aliased(relationship.mapper.class_), nested_scalars))
+        elif many and relationship.direction in (ONETOMANY, MANYTOMANY):
+            to_many.append((key, relationship, nested_scalars))
+        else:
+            return None
+
+    return CompiledSerializer(model, scalars, to_one, to_many)
+
+
+def resolve_fieldset(schema, fieldset=None, include=None):
+    """
+    把 ?fields= 和 ?include= 换算成 marshmallow 的 only (排好序的 tuple)，
+    两个参数都没有时返回 None (完整输出)。名字不对时返回 400。
+
+    fieldset: 要输出的字段，可以是 "name"、关系 "items"，或者关系中的字段 "items.name"
+    include: 要嵌入的关系；没有给出时，默认是 fieldset 中提到的关系 (fieldset 也没有时是全部关系)
+    """
+    if fieldset is None and include is None:
+        return None
+
+    relations = {name for name, field in schema.dump_fields.items() if _nested_schema(field)[0] is not None}
+    scalars = [name for name in schema.dump_fields if name not in relations]
+
+    if include is None:
+        include = {name.split(".", 1)[0] for name in fieldset if name.split(".", 1)[0] in relations}
+    unknown = set(include) - relations
+    if unknown:
+        abort(400, message=f"Unknown include: {', '.join(sorted(unknown))}. Choose from: {', '.join(sorted(relations))}.")
+
+    only = set()
+    nested = {}
+    for name in scalars if fieldset is None else fieldset:
+        relation, _, sub = name.partition(".")
+        if relation in relations and relation not in include:
+            abort(400, message=f"Field {name!r} needs include={relation}.")
+        if sub:
+            nested_schema, _ = _nested_schema(schema.dump_fields.get(relation))
+            if nested_schema is None or sub not in nested_schema.dump_fields:
+                abort(400, message=f"Unknown field: {name}.")
+            nested.setdefault(relation, set()).add(name)
+        elif name in schema.dump_fields:
+            only.add(name)
+        else:
+            abort(400, message=f"Unknown field: {name}. Choose from: {', '.join(sorted(schema.dump_fields))}.")
+
+    for relation in include:
+        # "items" 表示完整的 item；只给出 "items.name" 时只输出这些字段
+        only |= {relation} if relation in only else nested.get(relation, {relation})
+
+    return tuple(sorted(only))
+
+
+@functools.lru_cache(maxsize=256)
+def _plan(schema, model, only):
+    """
+    (修剪后的 schema, 编译好的 serializer 或 None)，每种 fieldset 只编译一次。
+    """
+    if only is not None:
+        schema = type(schema)(only=only, many=schema.many)
+    return schema, compile_serializer(schema, model)
+
+
+def render_json(data, status_code=200):
+    """
+    用 orjson 编码，输出格式跟随 app.json 的设置 (与 jsonify 一致)。
+    """
+    provider = current_app.json
+    option = orjson.OPT_SORT_KEYS if provider.sort_keys else 0
+    if provider.compact is False or (provider.compact is None and current_app.debug):
+        option |= orjson.OPT_INDENT_2
+
+    return current_app.response_class(
+        orjson.dumps(data, option=option) + b"\n", status=status_code, mimetype=provider.mimetype
+    )
+
+
+class Blueprint(BaseBlueprint):
+    """
+    flask_smorest.Blueprint: 视图返回 Page 或 Single 时，
+    按 fieldset 修剪 schema，并尽量用编译好的 serializer 查询和序列化。
+    """
+
+    def response(self, status_code, schema=None, **kwargs):
+        decorator = super().response(status_code, schema, **kwargs)
+
+        schema = resolve_schema_instance(schema) if schema is not None else None
+        if schema is None:
+            return decorator
+
+        def fast_decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **view_kwargs):
+                rv = func(*args, **view_kwargs)
+                selection, status, headers = unpack_tuple_response(rv)
+                if not isinstance(selection, Selection):
+                    return rv
+
+                only = resolve_fieldset(schema, selection.fieldset, selection.include)
+                pruned, serializer = _plan(schema, selection.model, only)
+
+                if serializer is None or not current_app.config["FAST_SERIALIZER_ENABLED"]:
+                    relations = [name for name, field in pruned.dump_fields.items() if _nested_schema(field)[0]]
+                    result, extra_headers = selection.load(relations)
+                    response = jsonify(pruned.dump(result))
+                else:
+                    data, extra_headers = selection.dump(serializer)
+                    response = render_json(data)
+
+                response.status_code = status or status_code
+                return response, status, {**(headers or {}), **extra_headers}
+
+            return decorator(wrapper)
+
+        return fast_decorator
@@ -4,4 +4,10 @@ from dotenv import load_dotenv
 load_dotenv()
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
-QUEUES = ["emails", "default"]
\ No newline at end of file
+QUEUES = ["emails", "default"]
+
+# rq worker -c settings 会在 worker 主进程中导入本文件:
+# 在这里预先编译邮件模板，fork 出来执行任务的 work-horse 直接继承编译结果
+import tasks
+
+tasks.preload_templates()
@@ -0,0 +1,197 @@
+"""
+store_delete.py
+
+Deleting a store with set-based statements: its items, the items_tags rows of
+those items, its tags, the items_tags rows of those tags, its store_stats row
+and the store itself.
+
+Rows are deleted in chunks of STORE_DELETE_CHUNK_SIZE, each chunk with one
+DELETE per table. A chunk never loads ORM objects. The search index and the
+store statistics are updated as the rows go (see search.py and store_stats.py).
+
+- Small stores (at most STORE_DELETE_SYNC_MAX_ITEMS items, read from
+  store_stats) are deleted in the request, in one transaction.
+- Larger stores are deleted by an RQ job on the "default" queue
+  (``rq worker -c settings``). The job commits after every chunk, so no
+  transaction holds locks for long, and records its progress in the job meta.
+  ``GET /store/<id>/delete-job`` reports it. The job id is derived from the
+  store id, so deleting the same store twice reuses the running job. The last
+  transaction deletes any item or tag added meanwhile, then the store.
+
+The response cache of every deleted entity, and of every entity that nested a
+deleted one, is invalidated after each commit.
+"""
+
+from sqlalchemy import delete, select
+
+from cache import invalidate_entities
+from db import db
+from models import ItemModel, ItemTags, StoreModel, StoreStatsModel, TagModel
+from store_stats import record_item_changes, record_tag_changes
+
+
+def _delete_items(store_id, chunk_size):
+    """
+    删除 store 的最多 chunk_size 个 item 和它们的 items_tags，
+    返回 (删除的 item ids, 与它们关联的 tag ids)。
+    """
+    rows = db.session.execute(
+        select(ItemModel.id, ItemModel.price)
+        .where(ItemModel.store_id == store_id)
+        .order_by(ItemModel.id)
+        .limit(chunk_size)
+    ).all()
+    if not rows:
+        return [], []
+
+    item_ids = [item_id for item_id, _ in rows]
+    tag_ids = db.session.scalars(select(ItemTags.tag_id).where(ItemTags.item_id.in_(item_ids)).distinct()).all()
+    db.session.execute(delete(ItemTags).where(ItemTags.item_id.in_(item_ids)))
+    db.session.execute(delete(ItemModel).where(ItemModel.id.in_(item_ids)))
+    record_item_changes({store_id: (-len(rows), -sum(price for _, price in rows))})
+    return item_ids, tag_ids
+
+
+def _delete_tags(store_id, chunk_size):
+    """
+    删除 store 的最多 chunk_size 个 tag 和它们的 items_tags (包括其它 store 的 item 的关联)，
+    返回 (删除的 tag ids, 与它们关联的 item ids)。
+    """
+    tag_ids = db.session.scalars(
+        select(TagModel.id).where(TagModel.store_id == store_id).order_by(TagModel.id).limit(chunk_size)
+    ).all()
+    if not tag_ids:
+        return [], []
+
+    item_ids = db.session.scalars(select(ItemTags.item_id).where(ItemTags.tag_id.in_(tag_ids)).distinct()).all()
+    db.session.execute(delete(ItemTags).where(ItemTags.tag_id.in_(tag_ids)))
+    db.session.execute(delete(TagModel).where(TagModel.id.in_(tag_ids)))
+    record_tag_changes({store_id: -len(tag_ids)})
+    return tag_ids, item_ids
+
+
+def delete_store(store_id, chunk_size, after_chunk=None):
+    """
+    分块删除 store 的 items 和 tags，最后删除 store_stats 的行和 store 本身，由调用者 commit。
+    after_chunk(progress, items, tags): 每块删除之后调用 (例如 commit 并让缓存失效)，
+    progress 是到目前为止删除的 {"deleted_items": ..., "deleted_tags": ...}
+    返回 (progress, 所有删除的 / 受影响的 item ids, tag ids)。
+    """
+    progress = {"deleted_items": 0, "deleted_tags": 0}
+    affected_items, affected_tags = set(), set()
+
+    def chunk_done(items, tags):
+        affected_items.update(items)
+        affected_tags.update(tags)
+        if after_chunk is not None:
+            after_chunk(progress, items, tags)
+
+    while True:
+        item_ids, linked_tag_ids = _delete_items(store_id, chunk_size)
+        if not item_ids:
+            break
+        progress["deleted_items"] += len(item_ids)
+        chunk_done(item_ids, linked_tag_ids)
+
+    while True:
+        tag_ids, linked_item_ids = _delete_tags(store_id, chunk_size)
+        if not tag_ids:
+            break
+        progress["deleted_tags"] += len(tag_ids)
+        chunk_done(linked_item_ids, tag_ids)
+
+    # 和删除 store 在同一个事务中: 删除上面的块 commit 之后才加入的 items 和 tags (通常没有)
+    item_ids, linked_tag_ids = _delete_items(store_id, None)
+    tag_ids, linked_item_ids = _delete_tags(store_id, None)
+    progress["deleted_items"] += len(item_ids)
+    progress["deleted_tags"] += len(tag_ids)
+    affected_items.update(item_ids, linked_item_ids)
+    affected_tags.update(tag_ids, linked_tag_ids)
+
+    db.session.execute(delete(StoreStatsModel).where(StoreStatsModel.store_id == store_id))
+    db.session.execute(delete(StoreModel).where(StoreModel.id == store_id))
+    return progress, affected_items, affected_tags
+
+
+def job_id(store_id):
+    return f"delete-store-{store_id}"
+
+
+def queue_store_delete(queue, store_id):
+    """
+    把删除 store 的任务加入队列；同一个 store 已经有排队中或执行中的任务时，返回那个任务。
+    """
+    job = running_store_delete(queue, store_id)
+    if job is not None:
+        return job
+
+    return queue.enqueue(
+        delete_store_job,
+        store_id,
+        job_id=job_id(store_id),
+        meta={"store_id": store_id, "deleted_items": 0, "deleted_tags": 0},
+        job_timeout=-1,
+    )
+
+
+def fetch_store_delete(queue, store_id):
+    """
+    删除 store 的任务，没有时返回 None。
+    """
+    from rq.exceptions import NoSuchJobError
+    from rq.job import Job
+
+    try:
+        return Job.fetch(job_id(store_id), connection=queue.connection)
+    except NoSuchJobError:
+        return None
+
+
+def running_store_delete(queue, store_id):
+    """
+    删除 store 的任务还在排队或执行时返回它，否则返回 None。
+    """
+    from rq.job import JobStatus
+
+    job = fetch_store_delete(queue, store_id)
+    if job is not None and job.get_status() in (
+        JobStatus.QUEUED, JobStatus.STARTED, JobStatus.DEFERRED, JobStatus.SCHEDULED
+    ):
+        return job
+    return None
+
+
+_app = None
+
+
+def _worker_app():
+    # rq worker 中没有 Flask 应用: 第一次执行任务时创建，之后的任务复用
+    global _app
+    if _app is None:
+        from app import create_app
+
+        _app = create_app()
+    return _app
+
+
+def delete_store_job(store_id):
+    """
+    RQ 任务: 每块删除之后 commit，并把进度写入 job.meta。
+    """
+    from rq import get_current_job
+
+    job = get_current_job()
+    app = _worker_app()
+
+    def after_chunk(progress, items, tags):
+        db.session.commit()
+        invalidate_entities(items=items, tags=tags)
+        if job is not None:
+            job.meta.update(progress)
+            job.save_meta()
+
+    with app.app_context():
+        progress, _, _ = delete_store(store_id, app.config["STORE_DELETE_CHUNK_SIZE"], after_chunk)
+        db.session.commit()
+        invalidate_entities(stores=[store_id])
+    return progress
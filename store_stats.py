@@ -0,0 +1,137 @@
+"""
+store_stats.py
+
+Per-store statistics (item count, tag count, min / avg / max price), kept in
+the ``store_stats`` table so ``GET /store/<id>/stats`` reads one row instead of
+aggregating all of the store's items.
+
+The write endpoints call ``record_item_changes`` / ``record_tag_changes`` before
+they commit, so a row always changes in the same transaction as the items and
+tags it describes. The updates are incremental:
+
+- item_count, tag_count and price_sum (for the average) are adjusted by the
+  deltas of the write,
+- min_price and max_price are read back from the ``(store_id, price)`` index,
+  which reads one end of the store's range in the index, not the whole store.
+  This happens for every store a write touched, even when its deltas are 0.
+
+The stats rows of the touched stores are locked first (``SELECT ... FOR
+UPDATE``), so on PostgreSQL the min / max read that follows sees the items of
+a concurrent write that committed while this one waited. Every store changed
+by one write is then updated with a single executemany UPDATE.
+Writes that bypass the endpoints, such as plain SQL or the benchmark seeding,
+leave the table stale. ``flask store-stats rebuild`` recomputes it from scratch.
+"""
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, delete, func, insert, select, update
+
+from db import db
+from models import ItemModel, StoreModel, StoreStatsModel, TagModel
+
+store_stats_cli = AppGroup("store-stats", help="Maintain the store_stats table.")
+
+
+def record_item_changes(changes):
+    """
+    changes: {store_id: (item 个数的变化, 价格之和的变化)}，在 item 写入之后、commit 之前调用。
+    changes 中的每个 store 都有 item 被写入过: 即使个数和价格之和都没有变 (例如两个价格互换)，
+    min / max 也可能变了，都要重新读取。
+    """
+    if not changes:
+        return
+
+    # min / max 子查询要看到本事务中刚写入的 item
+    db.session.flush()
+    stats = StoreStatsModel.__table__
+
+    # 先锁住这些 store 的统计行 (按 store_id 排序，并发的写入按同样的顺序加锁，不会死锁)。
+    # PostgreSQL READ COMMITTED 下，UPDATE 中的 min / max 子查询读的是语句开始时的快照:
+    # 等到锁之后再执行的 UPDATE 是新的语句，能看到先提交的并发写入的 item
+    db.session.execute(
+        select(stats.c.store_id)
+        .where(stats.c.store_id.in_(list(changes)))
+        .order_by(stats.c.store_id)
+        .with_for_update()
+    )
+
+    in_store = ItemModel.store_id == bindparam("b_store_id")
+    db.session.execute(
+        update(stats)
+        .where(stats.c.store_id == bindparam("b_store_id"))
+        .values(
+            item_count=stats.c.item_count + bindparam("b_count"),
+            price_sum=stats.c.price_sum + bindparam("b_price_sum"),
+            min_price=select(func.min(ItemModel.price)).where(in_store).scalar_subquery(),
+            max_price=select(func.max(ItemModel.price)).where(in_store).scalar_subquery(),
+        ),
+        [
+            {"b_store_id": store_id, "b_count": count, "b_price_sum": price_sum}
+            for store_id, (count, price_sum) in changes.items()
+        ],
+    )
+
+
+def record_tag_changes(changes):
+    """
+    changes: {store_id: tag 个数的变化}，在 tag 写入之后、commit 之前调用。
+    """
+    rows = [{"b_store_id": store_id, "b_count": count} for store_id, count in changes.items() if count]
+    if not rows:
+        return
+
+    stats = StoreStatsModel.__table__
+    db.session.execute(
+        update(stats)
+        .where(stats.c.store_id == bindparam("b_store_id"))
+        .values(tag_count=stats.c.tag_count + bindparam("b_count")),
+        rows,
+    )
+
+
+def rebuild_store_stats():
+    """
+    按 items 和 tags 表重新计算所有 store 的统计，返回 store 的个数。由调用者 commit。
+    """
+    items = (
+        select(
+            ItemModel.store_id,
+            func.count().label("item_count"),
+            func.sum(ItemModel.price).label("price_sum"),
+            func.min(ItemModel.price).label("min_price"),
+            func.max(ItemModel.price).label("max_price"),
+        )
+        .group_by(ItemModel.store_id)
+        .subquery()
+    )
+    tags = select(TagModel.store_id, func.count().label("tag_count")).group_by(TagModel.store_id).subquery()
+
+    rows = (
+        select(
+            StoreModel.id,
+            func.coalesce(items.c.item_count, 0),
+            func.coalesce(tags.c.tag_count, 0),
+            func.coalesce(items.c.price_sum, 0),
+            items.c.min_price,
+            items.c.max_price,
+        )
+        .outerjoin(items, items.c.store_id == StoreModel.id)
+        .outerjoin(tags, tags.c.store_id == StoreModel.id)
+    )
+
+    db.session.execute(delete(StoreStatsModel))
+    db.session.execute(
+        insert(StoreStatsModel).from_select(
+            ["store_id", "item_count", "tag_count", "price_sum", "min_price", "max_price"], rows
+        )
+    )
+    return db.session.scalar(select(func.count()).select_from(StoreStatsModel))
+
+
+@store_stats_cli.command("rebuild")
+def rebuild_command():
+    """Recompute store_stats from the items and tags tables."""
+    stores = rebuild_store_stats()
+    db.session.commit()
+    click.echo(f"Rebuilt statistics of {stores} stores.")
@@ -1,25 +1,104 @@
-import os 
-import requests
+import os
+import re
+import json
+import functools
 import jinja2
+from datetime import timedelta
 from dotenv import load_dotenv
 
 load_dotenv()
 
 domain = os.getenv("MAILGUN_DOMAIN")
 api_key = os.getenv("MAILGUN_API_KEY")
+# 可以指向本地的 HTTP 替身服务用于测试
+api_url = os.getenv("MAILGUN_API_URL", "https://api.mailgun.net/v3")
+
+# Mailgun 批量发送一次最多 1000 个收件人
+batch_size = min(int(os.getenv("MAILGUN_BATCH_SIZE", 1000)), 1000)
+# 第一封待发邮件进入缓冲区后，最多等待多少秒就发送
+batch_wait = float(os.getenv("MAILGUN_BATCH_WAIT", 10))
+
+# redis list: 等待批量发送的注册邮件
+PENDING_REGISTRATIONS = "emails:pending-registrations"
+
+# 生产环境关闭 auto_reload: 模板编译一次之后不再 stat 文件检查是否修改
+template_auto_reload = os.getenv("TEMPLATE_AUTO_RELOAD", "false").lower() == "true"
+# 编译好的模板字节码缓存目录，多个 worker 进程 / 重启之间共享，不设置则不使用
+template_cache_dir = os.getenv("TEMPLATE_CACHE_DIR")
+
+# worker 启动时预先编译的模板
+PRELOADED_TEMPLATES = ["email/registration.html"]
 
 template_loader = jinja2.FileSystemLoader("templates")
-template_env = jinja2.Environment(loader = template_loader)
+template_env = jinja2.Environment(
+    loader = template_loader,
+    auto_reload = template_auto_reload,
+    bytecode_cache = jinja2.FileSystemBytecodeCache(template_cache_dir) if template_cache_dir else None,
+)
+
+'''
+复用同一个 requests.Session (连接池)，避免每封邮件都重新和 api.mailgun.net 做 TLS 握手。
+fork 出来的子进程 (RQ work-horse) 不能共用父进程的 socket，所以在子进程里重新创建。
+'''
+_session = None
+
+def _reset_session():
+    global _session
+    _session = None
+
+os.register_at_fork(after_in_child = _reset_session)
+
+def get_session():
+    global _session
+    if _session is None:
+        # 在这里才导入 requests: web 进程导入本模块只是为了把邮件放入队列，用不到它
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        _session = requests.Session()
+        _session.auth = ("api", api_key)
+        _session.mount("https://", HTTPAdapter(pool_connections = 1, pool_maxsize = 4))
+        _session.mount("http://", HTTPAdapter(pool_connections = 1, pool_maxsize = 4))
+    return _session
 
 def render_template(template_filename, **content):
     return template_env.get_template(template_filename).render(**content)
 
+def preload_templates():
+    '''
+    在 rq worker 主进程中调用 (见 settings.py)，fork 出来的 work-horse 直接继承编译好的模板，
+    不必每个任务都重新 stat 和编译。
+    '''
+    for template_filename in PRELOADED_TEMPLATES:
+        template_env.get_template(template_filename)
+
+@functools.lru_cache(maxsize = None)
+def _split_template(template_filename, names):
+    '''
+    用占位符渲染一次模板，按占位符切分成 静态片段 和 变量名 交替的列表。
+    '''
+    markers = {name: f"\x00{name}\x00" for name in names}
+    rendered = render_template(template_filename, **markers)
+    if not names:
+        return [rendered]
+    return re.split("\x00(" + "|".join(map(re.escape, names)) + ")\x00", rendered)
+
+def render_static_template(template_filename, **content):
+    '''
+    与 render_template 结果相同，但模板的静态部分只渲染一次并缓存，每次只做变量替换。
+    只适用于变量被原样输出的模板 (没有在 if / for / 过滤器中使用变量)。
+    '''
+    parts = _split_template(template_filename, tuple(sorted(content)))
+    # parts 的奇数位置是变量名
+    return "".join(
+        str(content[part]) if i % 2 else part for i, part in enumerate(parts)
+    )
+
 def send_simple_message(to, subject, body, html):
 
-    return requests.post(
-		f"https://api.mailgun.net/v3/{domain}/messages",
-		auth=("api", api_key),
-		data={"from": "Yiyu Qian <mailgun@{domain}>",
+    return get_session().post(
+		f"{api_url}/{domain}/messages",
+		data={"from": f"Yiyu Qian <mailgun@{domain}>",
 			"to": [to],
 			"subject": subject,
 			"text": body,
@@ -27,12 +106,98 @@ def send_simple_message(to, subject, body, html):
     }
   )
 
+def send_batch_message(recipient_variables, subject, body, html):
+    '''
+    Mailgun 批量发送: 一次请求发给多个收件人，每个收件人只会看到自己的地址。
+    recipient_variables: {email: {变量名: 值}}，正文中的 %recipient.变量名% 会按收件人替换
+    '''
+    response = get_session().post(
+        f"{api_url}/{domain}/messages",
+        data={
+            "from": f"Yiyu Qian <mailgun@{domain}>",
+            "to": list(recipient_variables),
+            "subject": subject,
+            "text": body,
+            "html": html,
+            "recipient-variables": json.dumps(recipient_variables),
+        },
+    )
+    response.raise_for_status()
+    return response
+
 def send_user_registration_email(email, username):
 
     return send_simple_message(
             email,
             "Successfully signed up",
             f"Hi {username}! You have successfully signed up to the Stores REST API.",
-            render_template("email/registration.html", username = username)
+            render_static_template("email/registration.html", username = username)
+
+    )
+
+def send_user_registration_emails(users):
+    '''
+    users: [{"email": ..., "username": ...}]，最多 batch_size 个
+    '''
+    return send_batch_message(
+            {user["email"]: {"username": user["username"]} for user in users},
+            "Successfully signed up",
+            "Hi %recipient.username%! You have successfully signed up to the Stores REST API.",
+            render_static_template("email/registration.html", username = "%recipient.username%")
+    )
+
+def queue_user_registration_email(queue, email, username):
+    '''
+    把注册邮件放入 redis 缓冲区，而不是每个用户单独发送一次:
+    - 缓冲区每攒满 batch_size 封，立刻加入一个发送任务
+    - 第一封邮件进入空的缓冲区时，加入一个 batch_wait 秒后执行的发送任务 (需要 rq worker --with-scheduler)
+    '''
+    pending = queue.connection.rpush(
+        PENDING_REGISTRATIONS, json.dumps({"email": email, "username": username})
+    )
+
+    if pending % batch_size == 0:
+        queue.enqueue(flush_user_registration_emails)
+    elif pending == 1:
+        queue.enqueue_in(timedelta(seconds = batch_wait), flush_user_registration_emails)
+
+def _schedule_flush_retry(connection):
+    from rq import Queue, get_current_job
+
+    job = get_current_job()
+    # 不在 RQ 任务中 (直接调用) 时没有队列可用
+    if job is not None:
+        Queue(job.origin, connection = connection).enqueue_in(
+            timedelta(seconds = batch_wait), flush_user_registration_emails
+        )
+
+def flush_user_registration_emails(connection = None):
+    '''
+    RQ 任务: 分批取出缓冲区中的注册邮件并批量发送，直到缓冲区为空。
+    '''
+    if connection is None:
+        from rq import get_current_job
+
+        connection = get_current_job().connection
+    sent = 0
+
+    while True:
+        # lrange + ltrim 放在同一个事务里，保证多个 worker 不会取到同一批邮件
+        pipe = connection.pipeline()
+        pipe.lrange(PENDING_REGISTRATIONS, 0, batch_size - 1)
+        pipe.ltrim(PENDING_REGISTRATIONS, batch_size, -1)
+        raw, _ = pipe.execute()
+        if not raw:
+            return sent
+
+        try:
+            send_user_registration_emails([json.loads(user) for user in raw])
+        except Exception:
+            # 发送失败时放回缓冲区的开头;
+            # 之后的 rpush 返回的 pending 不再是 1，也不一定是 batch_size 的倍数，不会触发新的发送任务，
+            # 所以在这里安排 batch_wait 秒后重试
+            connection.lpush(PENDING_REGISTRATIONS, *reversed(raw))
+            _schedule_flush_retry(connection)
+            raise
 
-    )
\ No newline at end of file
+        sent += len(raw)
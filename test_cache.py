@@ -0,0 +1,59 @@
+import fakeredis
+import pytest
+from flask import jsonify
+
+from cache import LRUCache, RedisCache, cached_entity, invalidate_entities
+
+@pytest.fixture(params=["lru", "redis"])
+def cache(request):
+    if request.param == "lru":
+        return LRUCache(maxsize=2, ttl=60)
+    return RedisCache(fakeredis.FakeRedis(), ttl=60)
+
+def test_set_after_an_invalidation_is_refused(cache):
+    generation = cache.generation("store:1")
+    # 查询之后、写入缓存之前，写操作 invalidate 了这个实体
+    cache.delete("store:1")
+    cache.set("store:1", b"old", generation)
+    assert cache.get("store:1") is None
+
+    cache.set("store:1", b"new", cache.generation("store:1"))
+    assert cache.get("store:1") == b"new"
+
+def test_invalidation_of_another_entity_does_not_refuse_the_set(cache):
+    generation = cache.generation("store:1")
+    cache.delete("store:2")
+    cache.set("store:1", b"body", generation)
+    assert cache.get("store:1") == b"body"
+
+def test_lru_refuses_the_set_after_the_generation_was_evicted():
+    cache = LRUCache(maxsize=2)
+    generation = cache.generation("store:1")
+    # store:1 的 generation 被后面的 delete 挤出去了
+    cache.delete("store:1", "store:2", "store:3")
+    cache.set("store:1", b"old", generation)
+    assert cache.get("store:1") is None
+
+@pytest.fixture()
+def probe_app(offline_env, app):
+    # offline_env: lru 后端
+    calls = []
+
+    @app.route("/probe/<int:store_id>")
+    @cached_entity("store", "store_id")
+    def probe(store_id):
+        calls.append(store_id)
+        if len(calls) == 1:
+            # 模拟读取之后、写入缓存之前 commit 的写操作
+            invalidate_entities(stores=[store_id])
+        return jsonify(version=len(calls))
+
+    app.probe_calls = calls
+    return app
+
+def test_get_racing_an_invalidation_does_not_cache_the_old_body(probe_app, client):
+    assert client.get("/probe/1").get_json() == {"version": 1}
+    # 旧的 body 没有进入缓存: 再次查询，然后缓存新的 body
+    assert client.get("/probe/1").get_json() == {"version": 2}
+    assert client.get("/probe/1").get_json() == {"version": 2}
+    assert probe_app.probe_calls == [1, 1]
@@ -0,0 +1,65 @@
+import base64
+import json
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+from benchmarks.seed import Catalog, seed
+from pagination import NEXT_CURSOR_HEADER
+
+# 不需要 Redis (见 conftest.offline_env)
+pytestmark = pytest.mark.usefixtures("offline_env")
+
+def cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip("=")
+
+@pytest.fixture()
+def headers(app):
+    seed(app, Catalog(stores=3, items_per_store=4, tags_per_store=1, users=1))
+    with app.app_context():
+        return {"Authorization": f"Bearer {create_access_token(identity='1')}"}
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/store?after=not-base64!",
+        f"/store?after={cursor({'a': 1})}",
+        f"/store?after={cursor([{'a': 1}])}",
+        f"/store?after={cursor([1, 2])}",
+        f"/store?after={cursor([True])}",
+        f"/store?after={cursor([None])}",
+        # store 的 key 是整数 id
+        f"/store?after={cursor(['abc'])}",
+        f"/store?after={cursor([1.5])}",
+        f"/item?sort=price&after={cursor([[1], 2])}",
+        f"/item?sort=price&after={cursor([1.5, 'x'])}",
+        # 搜索的 key 是 (相关度, id)
+        f"/item/search?q=benchmark&after={cursor(['x', 2])}",
+    ],
+)
+def test_invalid_cursor_is_a_bad_request(client, headers, url):
+    response = client.get(url, headers=headers)
+    assert response.status_code == 400, response.get_data(as_text=True)
+
+def test_cursor_values_are_coerced_to_the_key_type(client, headers):
+    # "2" 和 2.0 都是合法的整数 id
+    for key in (["2"], [2.0]):
+        response = client.get(f"/store?after={cursor(key)}", headers=headers)
+        assert [store["id"] for store in response.get_json()] == [3]
+
+def test_next_cursor_fetches_the_next_page(client, headers):
+    first = client.get("/item?sort=price&limit=5", headers=headers)
+    after = first.headers[NEXT_CURSOR_HEADER]
+    second = client.get(f"/item?sort=price&limit=5&after={after}", headers=headers)
+    assert second.status_code == 200
+    ids = [item["id"] for item in first.get_json() + second.get_json()]
+    assert len(set(ids)) == 10
+
+def test_search_cursor_fetches_the_next_page(client, headers):
+    # 第一个 key 是计算出来的相关度，没有列类型
+    first = client.get("/item/search?q=benchmark&limit=5", headers=headers)
+    after = first.headers[NEXT_CURSOR_HEADER]
+    second = client.get(f"/item/search?q=benchmark&limit=5&after={after}", headers=headers)
+    assert second.status_code == 200, second.get_data(as_text=True)
+    ids = [item["id"] for item in first.get_json() + second.get_json()]
+    assert len(set(ids)) == 10
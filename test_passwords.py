@@ -0,0 +1,37 @@
+import time
+
+import pytest
+from werkzeug.exceptions import HTTPException
+
+from passwords import PasswordHasher
+
+@pytest.fixture()
+def hasher():
+    # 一个子进程，一个名额；任务用 time.sleep(rounds) 代替 pbkdf2
+    hasher = PasswordHasher(workers=1, rounds=1, max_pending=1, timeout=0.05)
+    yield hasher
+    hasher._get_pool().shutdown(cancel_futures=True)
+
+def wait_for_slot(hasher, seconds=30):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        if hasher._slots.acquire(blocking=False):
+            hasher._slots.release()
+            return True
+        time.sleep(0.05)
+    return False
+
+def test_timed_out_call_keeps_its_slot_until_the_pool_is_done(hasher):
+    with pytest.raises(HTTPException) as timed_out:
+        hasher._run("hash", time.sleep)
+    assert timed_out.value.code == 503
+
+    # 超时的任务还在排队或执行: 名额没有归还，新的请求直接被拒绝
+    started = time.perf_counter()
+    with pytest.raises(HTTPException) as rejected:
+        hasher._run("hash", time.sleep)
+    assert rejected.value.code == 503
+    assert time.perf_counter() - started < hasher.timeout
+
+    # 任务结束 (或被取消) 之后归还
+    assert wait_for_slot(hasher)
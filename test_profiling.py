@@ -0,0 +1,46 @@
+import sys
+
+import pytest
+
+import profiling
+from db import db
+
+TOKEN = "profile-me"
+
+@pytest.fixture()
+def profiler_dir(offline_env, monkeypatch, tmp_path):
+    # 在 app fixture 创建 app 之前生效
+    monkeypatch.setenv("PROFILER_ENABLED", "true")
+    monkeypatch.setenv("PROFILER_TOKEN", TOKEN)
+    monkeypatch.setenv("PROFILER_DIR", str(tmp_path))
+    return tmp_path
+
+@pytest.fixture()
+def profiled_app(profiler_dir, app):
+    with app.app_context():
+        db.create_all()
+    return app
+
+def test_each_profiled_request_gets_its_own_file(profiled_app, profiler_dir, client):
+    for _ in range(3):
+        response = client.get("/store", headers={profiling.PROFILE_HEADER: TOKEN})
+        assert "total;dur=" in response.headers["Server-Timing"]
+    # 同一秒内同一个接口的请求不互相覆盖
+    assert len(list(profiler_dir.glob("*.prof"))) == 3
+
+def test_profiler_stops_after_an_unhandled_exception(profiled_app, client):
+    @profiled_app.route("/boom")
+    def boom():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        client.get("/boom", headers={profiling.PROFILE_HEADER: TOKEN})
+    assert sys.getprofile() is None
+    assert not profiling._active.locked()
+
+def test_concurrent_request_is_not_profiled(profiled_app, client):
+    # 另一个请求正在被分析
+    with profiling._active:
+        response = client.get("/store", headers={profiling.PROFILE_HEADER: TOKEN})
+    assert response.status_code == 200
+    assert "Server-Timing" not in response.headers
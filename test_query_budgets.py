@@ -0,0 +1,39 @@
+import fakeredis
+import pytest
+from rq import Queue
+
+from benchmarks.query_budgets import CASES, CATALOG, issue_tokens, send
+from benchmarks.seed import seed
+from query_budget import endpoint_budget
+
+# 不需要 Redis (见 conftest.offline_env)
+pytestmark = pytest.mark.usefixtures("offline_env")
+
+@pytest.fixture()
+def catalog_app(app):
+    seed(app, CATALOG)
+    connection = fakeredis.FakeRedis()
+    app.queue = Queue("emails", connection=connection)
+    app.jobs_queue = Queue("default", connection=connection)
+    return app
+
+@pytest.mark.parametrize("offline_env", ["true", "false"], ids=["fast-serializer", "marshmallow"], indirect=True)
+def test_cases_stay_within_query_budgets(catalog_app, client):
+    # conftest 打开了 QUERY_BUDGET_ENFORCE: 超出 budget 的请求抛出 QueryBudgetExceeded
+    tokens = issue_tokens(catalog_app)
+    for case in CASES:
+        response = send(catalog_app, client, tokens, case)
+        assert response.status_code < 500, f"{case[0]} {case[1]}: {response.get_data(as_text=True)}"
+
+def test_every_declared_budget_has_a_case(app):
+    adapter = app.url_map.bind("localhost")
+    covered = {adapter.match(url.split("?")[0], method)[0] + " " + method for method, url, _, _ in CASES}
+
+    uncovered = [
+        f"{method} {rule.rule}"
+        for rule in app.url_map.iter_rules()
+        for method in rule.methods - {"HEAD", "OPTIONS"}
+        if endpoint_budget(app.view_functions[rule.endpoint], method) is not None
+        and f"{rule.endpoint} {method}" not in covered
+    ]
+    assert uncovered == []
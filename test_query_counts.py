@@ -0,0 +1,44 @@
+import pytest
+from flask_jwt_extended import create_access_token
+
+from benchmarks.seed import Catalog, seed
+
+# 每个 store 的 items、tags 和每个 tag 的 items 都变多，总行数超过 10 倍
+SMALL = Catalog(stores=2, items_per_store=5, tags_per_store=2, users=1)
+LARGE = Catalog(stores=20, items_per_store=50, tags_per_store=4, users=1)
+
+URLS = (
+    "/item?limit=100",
+    "/item?limit=100&include=store,tags",
+    "/store?limit=100",
+    "/store?limit=100&include=items,tags",
+    "/store/1/tag?limit=100",
+    "/tag/1",
+    "/tag/1?include=items",
+)
+
+@pytest.fixture()
+def no_response_cache(offline_env, monkeypatch):
+    # 不需要 Redis (见 conftest.offline_env)；重新 seed 之后同一个 URL 要再查询一次数据库，不能命中缓存
+    monkeypatch.setenv("RESPONSE_CACHE_BACKEND", "null")
+
+def statement_counts(app, client, count_queries, catalog):
+    seed(app, catalog)
+    with app.app_context():
+        headers = {"Authorization": f"Bearer {create_access_token(identity='1')}"}
+
+    counts = {}
+    for url in URLS:
+        with count_queries() as queries:
+            response = client.get(url, headers=headers)
+        assert response.status_code == 200, f"{url}: {response.get_data(as_text=True)}"
+        counts[url] = queries.count
+    return counts
+
+@pytest.mark.usefixtures("no_response_cache")
+@pytest.mark.parametrize("offline_env", ["true", "false"], ids=["fast-serializer", "marshmallow"], indirect=True)
+def test_statement_counts_do_not_grow_with_rows(app, client, count_queries):
+    # 没有 N+1 查询: 10 倍的行数，每个接口执行的 SQL 语句数不变
+    small = statement_counts(app, client, count_queries, SMALL)
+    large = statement_counts(app, client, count_queries, LARGE)
+    assert large == small
@@ -0,0 +1,32 @@
+from itertools import product
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+from benchmarks.query_plans import FILTERS, SORTS, StatementLog, _add_edge_cases, check_case
+from benchmarks.seed import Catalog, seed
+from db import db
+
+# 不需要 Redis (见 conftest.offline_env)
+pytestmark = pytest.mark.usefixtures("offline_env")
+
+# FILTERS 用到 store 3 和 tag 9
+CATALOG = Catalog(stores=5, items_per_store=16, tags_per_store=2, users=1)
+
+@pytest.fixture()
+def catalog_app(app):
+    seed(app, CATALOG)
+    _add_edge_cases(app)
+    return app
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_filtered_listing_uses_indexes_and_matches_python(catalog_app, client, filters):
+    with catalog_app.app_context():
+        headers = {"Authorization": f"Bearer {create_access_token(identity='1')}"}
+        log = StatementLog(db.engine)
+
+    # 每种排序，两种 serializer；小的 limit 让每个用例都翻好几页
+    for sort, fast in product(SORTS, (True, False)):
+        url = f"/item?limit=7&sort={sort}&{filters}"
+        _, problems = check_case(catalog_app, client, log, headers, url, filters, sort, fast)
+        assert problems == [], f"{url} ({'compiled' if fast else 'marshmallow'})"
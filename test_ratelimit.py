@@ -0,0 +1,72 @@
+import time
+from types import SimpleNamespace
+
+import fakeredis
+import pytest
+
+import ratelimit
+from db import db
+from ratelimit import RedisTokenBuckets
+
+KEYS = ["login:ip:127.0.0.1", "login:user:alice"]
+
+@pytest.fixture()
+def server():
+    return fakeredis.FakeServer()
+
+@pytest.fixture()
+def buckets(server):
+    # 3 个 token 的 burst，每秒补充 1 个
+    return RedisTokenBuckets(fakeredis.FakeRedis(server=server), capacity=3, rate=1.0)
+
+def test_burst_then_retry_after(buckets):
+    assert [buckets.hit(KEYS) for _ in range(3)] == [0, 0, 0]
+    retry_after = buckets.hit(KEYS)
+    assert 0 < retry_after <= 1
+
+def test_one_empty_bucket_rejects_and_takes_no_token_from_the_others(buckets):
+    for _ in range(3):
+        buckets.hit(KEYS[1:])
+    assert buckets.hit(KEYS) > 0
+    # 被拒绝的请求没有扣减 ip 的 bucket
+    assert [buckets.hit(KEYS[:1]) for _ in range(3)] == [0, 0, 0]
+
+def test_buckets_refill_over_time(buckets, server):
+    connection = fakeredis.FakeRedis(server=server)
+    for _ in range(3):
+        buckets.hit(KEYS)
+    assert buckets.hit(KEYS) > 0
+
+    # 上一次写入在 2 秒之前: 补充了 2 个 token
+    for key in KEYS:
+        connection.hset(buckets.prefix + key, "ts", str(float(connection.hget(buckets.prefix + key, "ts")) - 2))
+    assert buckets.hit(KEYS) == 0
+    assert buckets.hit(KEYS) == 0
+    assert buckets.hit(KEYS) > 0
+
+def test_worker_clock_does_not_refill_buckets(buckets, monkeypatch):
+    for _ in range(3):
+        buckets.hit(KEYS)
+    # worker 的时钟快了一个小时: 时间取 Redis 的 TIME，bucket 仍然是空的
+    skewed = time.time() + 3600
+    monkeypatch.setattr(ratelimit, "time", SimpleNamespace(time=lambda: skewed))
+    assert buckets.hit(KEYS) > 0
+
+def test_falls_back_to_memory_buckets_when_redis_is_down(buckets, server):
+    server.connected = False
+    assert [buckets.hit(KEYS) for _ in range(3)] == [0, 0, 0]
+    assert buckets.hit(KEYS) > 0
+
+@pytest.fixture()
+def limited_app(offline_env, server, app):
+    with app.app_context():
+        db.create_all()
+    app.rate_limiter = RedisTokenBuckets(fakeredis.FakeRedis(server=server), capacity=2, rate=1 / 60)
+    return app
+
+def test_login_answers_429_with_retry_after(limited_app, client):
+    body = {"username": "alice", "password": "wrong"}
+    assert [client.post("/login", json=body).status_code for _ in range(2)] == [401, 401]
+    response = client.post("/login", json=body)
+    assert response.status_code == 429
+    assert 1 <= int(response.headers["Retry-After"]) <= 60
@@ -0,0 +1,32 @@
+import pytest
+from flask_jwt_extended import create_access_token
+
+from benchmarks.seed import Catalog, seed
+from search import TRUNCATED_HEADER
+
+# "benchmark" 出现在每个 item 的 description 中，"ceramic" 出现在 1/11 的 item 中
+CATALOG = Catalog(stores=2, items_per_store=15, tags_per_store=1, users=1)
+
+@pytest.fixture()
+def max_ranked(offline_env, monkeypatch):
+    # 在 app fixture 创建 app 之前生效
+    monkeypatch.setenv("SEARCH_MAX_RANKED", "5")
+
+pytestmark = pytest.mark.usefixtures("max_ranked")
+
+@pytest.fixture()
+def headers(app):
+    seed(app, CATALOG)
+    with app.app_context():
+        return {"Authorization": f"Bearer {create_access_token(identity='1')}"}
+
+def test_search_past_the_cap_is_flagged_as_truncated(client, headers):
+    response = client.get("/item/search?q=benchmark&limit=20", headers=headers)
+    assert response.status_code == 200
+    assert len(response.get_json()) == 5
+    assert response.headers[TRUNCATED_HEADER] == "true"
+
+def test_search_within_the_cap_is_not_flagged(client, headers):
+    response = client.get("/item/search?q=ceramic&limit=20", headers=headers)
+    assert len(response.get_json()) == 3
+    assert TRUNCATED_HEADER not in response.headers
@@ -0,0 +1,27 @@
+import pytest
+from flask_jwt_extended import create_access_token
+
+from benchmarks.seed import Catalog, seed
+from benchmarks.serializers import _add_edge_cases, check_parity, detail_urls, list_urls
+
+CATALOG = Catalog(stores=3, items_per_store=12, tags_per_store=3, users=1)
+# _add_edge_cases 加入的没有 tag 的 store
+EMPTY_STORE = CATALOG.stores + 1
+
+@pytest.fixture()
+def no_response_cache(offline_env, monkeypatch):
+    # 不需要 Redis (见 conftest.offline_env)；单个实体的缓存会让两条路径读到同一份缓存的响应
+    monkeypatch.setenv("RESPONSE_CACHE_BACKEND", "null")
+
+@pytest.fixture()
+def headers(app):
+    seed(app, CATALOG)
+    assert _add_edge_cases(app) == EMPTY_STORE
+    with app.app_context():
+        return {"Authorization": f"Bearer {create_access_token(identity='1')}"}
+
+@pytest.mark.usefixtures("no_response_cache")
+@pytest.mark.parametrize("url", [*list_urls(EMPTY_STORE), *detail_urls(CATALOG, EMPTY_STORE)])
+def test_compiled_serializer_matches_marshmallow(client, headers, url):
+    # FAST_SERIALIZER_ENABLED 开和关，逐页比较 JSON、X-Next-Cursor 和 Content-Type
+    check_parity(client, url, headers)
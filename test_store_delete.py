@@ -0,0 +1,47 @@
+import fakeredis
+import pytest
+from rq import Queue
+from sqlalchemy import update
+
+from benchmarks.seed import Catalog, seed
+from db import db
+from models import StoreModel, StoreStatsModel
+
+@pytest.fixture()
+def small_sync_limit(offline_env, monkeypatch):
+    # 在 app fixture 创建 app 之前生效: 超过 5 个 item 的 store 由 RQ 任务删除
+    monkeypatch.setenv("STORE_DELETE_SYNC_MAX_ITEMS", "5")
+
+@pytest.fixture()
+def catalog_app(small_sync_limit, app):
+    seed(app, Catalog(stores=2, items_per_store=10, tags_per_store=2, users=1))
+    connection = fakeredis.FakeRedis()
+    app.queue = Queue("emails", connection=connection)
+    app.jobs_queue = Queue("default", connection=connection)
+    return app
+
+def test_repeated_delete_reuses_the_running_job(catalog_app, client):
+    first = client.delete("/store/1")
+    assert first.status_code == 202
+    assert first.headers["Location"].endswith("/store/1/delete-job")
+
+    # 任务已经删除了一部分 item 并 commit: store_stats 中的个数低于同步删除的上限
+    with catalog_app.app_context():
+        db.session.execute(update(StoreStatsModel).where(StoreStatsModel.store_id == 1).values(item_count=2))
+        db.session.commit()
+
+    second = client.delete("/store/1")
+    assert second.status_code == 202
+    assert second.get_json()["job_id"] == first.get_json()["job_id"]
+    assert len(catalog_app.jobs_queue) == 1
+    with catalog_app.app_context():
+        assert db.session.get(StoreModel, 1) is not None
+
+def test_small_store_without_a_job_is_deleted_in_the_request(catalog_app, client):
+    with catalog_app.app_context():
+        db.session.execute(update(StoreStatsModel).where(StoreStatsModel.store_id == 2).values(item_count=2))
+        db.session.commit()
+
+    assert client.delete("/store/2").status_code == 200
+    with catalog_app.app_context():
+        assert db.session.get(StoreModel, 2) is None
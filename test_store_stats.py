@@ -0,0 +1,64 @@
+import pytest
+from flask_jwt_extended import create_access_token
+from sqlalchemy.dialects import postgresql
+
+from benchmarks.seed import Catalog, seed
+from db import db
+from store_stats import record_item_changes
+
+# 不需要 Redis (见 conftest.offline_env)
+pytestmark = pytest.mark.usefixtures("offline_env")
+
+@pytest.fixture()
+def headers(app):
+    seed(app, Catalog(stores=2, items_per_store=2, tags_per_store=1, users=1))
+    with app.app_context():
+        return {"Authorization": f"Bearer {create_access_token(identity='1', fresh=True)}"}
+
+def put_items(client, headers, rows):
+    response = client.put("/item", json=rows, headers=headers)
+    assert response.status_code == 200, response.get_data(as_text=True)
+
+def test_min_max_follow_prices_when_the_deltas_cancel_out(client, headers):
+    put_items(client, headers, [{"id": 1, "name": "a", "price": 1, "store_id": 1}, {"id": 2, "name": "b", "price": 5, "store_id": 1}])
+    stats = client.get("/store/1/stats").get_json()
+    assert (stats["min_price"], stats["max_price"]) == (1, 5)
+
+    # 个数和价格之和都不变，min / max 变了
+    put_items(client, headers, [{"id": 1, "name": "a", "price": 3, "store_id": 1}, {"id": 2, "name": "b", "price": 3, "store_id": 1}])
+    stats = client.get("/store/1/stats").get_json()
+    assert (stats["item_count"], stats["min_price"], stats["max_price"], stats["avg_price"]) == (2, 3, 3, 3)
+
+def test_put_item_moves_and_inserts_through_the_upsert(client, headers):
+    for store_id in (1, 2):
+        client.get(f"/store/{store_id}")
+
+    # item 2 从 store 1 移到 store 2；item 10 不存在，被插入
+    assert client.put("/item/2", json={"name": "b", "price": 7, "store_id": 2}).status_code == 200
+    assert client.put("/item/10", json={"name": "new", "price": 1, "store_id": 2}).status_code == 200
+    assert client.put("/item/11", json={"name": "lost", "price": 1, "store_id": 99}).status_code == 404
+
+    stats = client.get("/store/stats?store_id=1,2").get_json()
+    assert [(s["store_id"], s["item_count"]) for s in stats] == [(1, 1), (2, 4)]
+    assert stats[0]["min_price"] == stats[0]["max_price"]
+    assert (stats[1]["min_price"], stats[1]["max_price"]) == (1, 7)
+    # 原来的和新的 store 的缓存都失效了
+    items = {store_id: sorted(item["id"] for item in client.get(f"/store/{store_id}").get_json()["items"]) for store_id in (1, 2)}
+    assert items == {1: [1], 2: [2, 3, 4, 10]}
+
+def test_stats_rows_are_locked_before_min_max_are_read(app, headers, monkeypatch):
+    statements = []
+    execute = db.session.execute
+
+    def record(statement, *args, **kwargs):
+        statements.append(str(statement.compile(dialect=postgresql.dialect())))
+        return execute(statement, *args, **kwargs)
+
+    with app.app_context():
+        monkeypatch.setattr(db.session, "execute", record)
+        record_item_changes({1: (0, 0)})
+
+    # 先 SELECT ... FOR UPDATE，之后的 UPDATE 是新的语句 (PostgreSQL READ COMMITTED 下是新的快照)
+    assert len(statements) == 2
+    assert statements[0].startswith("SELECT") and statements[0].endswith("FOR UPDATE")
+    assert statements[1].startswith("UPDATE store_stats")
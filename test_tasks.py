@@ -0,0 +1,74 @@
+import json
+
+import fakeredis
+import pytest
+from rq import Queue, SimpleWorker
+from rq.registry import ScheduledJobRegistry
+
+import tasks
+from benchmarks.standins import MailgunStandIn
+
+USERS = [(f"user{i}@example.com", f"user{i}") for i in range(5)]
+
+@pytest.fixture()
+def mailgun(monkeypatch):
+    # api_url 在导入 tasks 时就读取了环境变量，所以直接替换模块里的值
+    with MailgunStandIn() as stand_in:
+        monkeypatch.setattr(tasks, "api_url", stand_in.url)
+        monkeypatch.setattr(tasks, "domain", "example.com")
+        monkeypatch.setattr(tasks, "api_key", "key-test")
+        tasks._reset_session()
+        yield stand_in
+    tasks._reset_session()
+
+@pytest.fixture()
+def queue():
+    return Queue("emails", connection=fakeredis.FakeRedis())
+
+def queue_users(queue):
+    for email, username in USERS:
+        tasks.queue_user_registration_email(queue, email, username)
+
+def run_flush_job(queue):
+    # 在 RQ 任务中执行，失败时 _schedule_flush_retry 才有队列可用
+    job = queue.enqueue(tasks.flush_user_registration_emails)
+    SimpleWorker([queue], connection=queue.connection).work(burst=True)
+    return job
+
+def assert_batch(message, users):
+    assert message["to"] == [email for email, _ in users]
+    assert json.loads(message["recipient-variables"][0]) == {
+        email: {"username": username} for email, username in users
+    }
+    assert message["text"] == ["Hi %recipient.username%! You have successfully signed up to the Stores REST API."]
+
+def test_buffered_registrations_are_sent_in_one_batch(mailgun, queue):
+    queue_users(queue)
+    # 第一封邮件安排了 batch_wait 秒后的发送任务，还没有发送
+    assert ScheduledJobRegistry(queue=queue).count == 1
+    assert mailgun.messages == []
+
+    job = run_flush_job(queue)
+    assert job.return_value() == len(USERS)
+    assert len(mailgun.messages) == 1
+    assert_batch(mailgun.messages[0], USERS)
+    assert queue.connection.llen(tasks.PENDING_REGISTRATIONS) == 0
+
+def test_failed_batch_is_put_back_and_flushed_again(mailgun, queue):
+    queue_users(queue)
+    scheduled = ScheduledJobRegistry(queue=queue)
+    before = scheduled.count
+
+    mailgun.failures = 1
+    assert run_flush_job(queue).is_failed
+    assert mailgun.messages == []
+    # 整批放回缓冲区的开头，并安排了一次重试
+    assert [json.loads(user)["email"] for user in queue.connection.lrange(tasks.PENDING_REGISTRATIONS, 0, -1)] == [
+        email for email, _ in USERS
+    ]
+    assert scheduled.count == before + 1
+
+    assert tasks.flush_user_registration_emails(queue.connection) == len(USERS)
+    assert len(mailgun.messages) == 1
+    assert_batch(mailgun.messages[0], USERS)
+    assert queue.connection.llen(tasks.PENDING_REGISTRATIONS) == 0